@@ -0,0 +1,95 @@
+"""
+Compares the threaded ingestion pipeline with the asyncio engine against the in-process fake
+IMAP server, with LATENCY seconds added to every IMAP command to stand in for a real server.
+Rows are written to a throwaway sqlite file, and the async engine's checkpoint goes to a dict.
+
+run with: python -m benchmarks.bench_engines
+"""
+import os
+import time
+import asyncio
+import logging
+import tempfile
+from imap_tools import MailBoxUnencrypted
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import storage.apis as apis
+from benchmarks.fake_imap import FakeIMAPServer, alert_emails
+from src.aioengine import ingest
+from src.aioimap import connect_mailbox
+from src.fetcher import MailBoxPool, fetch_sharded
+from src.logger import logger
+from src.main import classify_and_parse_alerts, to_raw_alert
+from src.pipeline import run_pipeline
+from storage.base import Base
+
+
+class DictRedis:
+    def __init__(self):
+        self.hashes = {}
+
+    async def hgetall(self, key):
+        return {k.encode(): str(v).encode() for k, v in self.hashes.get(key, {}).items()}
+
+    async def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(mapping)
+
+
+def threaded(server: FakeIMAPServer, db_path: str, connections: int, workers: int) -> int:
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(engine)
+    apis.Session = sessionmaker(bind=engine)
+    pool = MailBoxPool(lambda: MailBoxUnencrypted(server.host, server.port).login("me", "pw"), connections)
+    uids = [str(uid) for uid in server.messages]
+
+    def write(results):
+        apis.write_debit_trxns([trxn for _, trxn_type, trxn in results if trxn_type == "debit"])
+        apis.write_credit_trxns([trxn for _, trxn_type, trxn in results if trxn_type == "credit"])
+
+    try:
+        run_pipeline(fetch_sharded(pool, uids), to_raw_alert, classify_and_parse_alerts, write, workers=workers)
+    finally:
+        pool.close()
+        engine.dispose()
+    return len(uids)
+
+
+async def asynchronous(server: FakeIMAPServer, db_path: str, connections: int, workers: int) -> int:
+    db = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    async with db.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    connect = lambda: connect_mailbox(server.host, "me", "pw", port=server.port, use_ssl=False)
+    try:
+        counts = await ingest(connect, DictRedis(), async_sessionmaker(db), "me@gmail.com", to_raw_alert,
+                              classify_and_parse_alerts, connections=connections, workers=workers)
+    finally:
+        await db.dispose()
+    return counts["processed"]
+
+
+def main(n: int = 1000, latency: float = 0.02, connections: int = 4, workers: int = os.cpu_count() or 1) -> None:
+    logger.setLevel(logging.WARNING)
+    server = FakeIMAPServer(alert_emails(n), latency=latency)
+    print(f"alerts: {n}, latency: {latency * 1000:.0f}ms/command, connections: {connections}, workers: {workers}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["ARCHIVE_DIR"] = tmp
+        with server.serve_in_thread():
+            start = time.perf_counter()
+            processed = threaded(server, f"{tmp}/threads.db", connections, workers)
+            threads = time.perf_counter() - start
+        print(f"{'threads':<10} {processed / threads:>8,.0f} alerts/s  {threads:>6.2f} s")
+
+        async def run():
+            async with server:
+                start = time.perf_counter()
+                processed = await asynchronous(server, f"{tmp}/async.db", connections, workers)
+                return processed, time.perf_counter() - start
+        processed, elapsed = asyncio.run(run())
+        print(f"{'async':<10} {processed / elapsed:>8,.0f} alerts/s  {elapsed:>6.2f} s")
+
+
+if __name__ == "__main__":
+    main(int(os.getenv("N", 1000)), float(os.getenv("LATENCY", 0.02)), int(os.getenv("CONNECTIONS", 4)))
@@ -0,0 +1,38 @@
+"""
+Compares extract_alert_text against building a BeautifulSoup tree for every alert.
+
+run with: python -m benchmarks.bench_extract
+"""
+import os
+import time
+from bs4 import BeautifulSoup
+
+from benchmarks.corpus import STATEMENTS, alert_html
+from src.extract import extract_alert_text
+
+
+def beautifulsoup_span_text(html: str) -> str:
+    return BeautifulSoup(html, 'html.parser').span.get_text()
+
+
+def bench(name: str, extract, corpus) -> float:
+    start = time.perf_counter()
+    for html in corpus:
+        extract(html)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<22} {len(corpus) / elapsed:>10,.0f} alerts/s  {elapsed * 1e6 / len(corpus):>8,.1f} us/alert")
+    return elapsed
+
+
+def main(n: int = 2000) -> None:
+    corpus = [alert_html(STATEMENTS[i % len(STATEMENTS)].replace("John", f"John{i}")) for i in range(n)]
+    assert all(extract_alert_text(html) == beautifulsoup_span_text(html) for html in corpus[:len(STATEMENTS) * 2])
+
+    print(f"alerts: {n}, average html size: {sum(map(len, corpus)) // n:,} chars")
+    slow = bench("BeautifulSoup", beautifulsoup_span_text, corpus)
+    fast = bench("extract_alert_text", extract_alert_text, corpus)
+    print(f"speedup: {slow / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(os.getenv("N", 2000)))
@@ -0,0 +1,77 @@
+"""
+Measures how many bytes the IMAP server sends per kuda alert for a full message fetch
+versus the header fields + BODYSTRUCTURE + html part fetch in src/fetcher.py, counted as imaplib
+reads them off the socket of a connection to the in-process fake IMAP server. fetch_alerts is also
+measured with a body range that cuts the alert span off, so every message is fetched again in full.
+
+run with: python -m benchmarks.bench_fetch_bytes
+"""
+import os
+from typing import Callable, Tuple
+from imap_tools import MailBoxUnencrypted
+from imap_tools.utils import chunked_crop
+
+from benchmarks.fake_imap import FakeIMAPServer, alert_emails
+from src.fetcher import BODY_RANGE, fetch_alerts
+
+# short enough that the span, about 28KB into the base64 html part, is always cut off.
+CUT_OFF_RANGE = 16 * 1024
+
+
+class CountingReader:
+    """
+    Wraps the file imaplib reads server responses from, counting the bytes it gets.
+    """
+    def __init__(self, file):
+        self.file = file
+        self.count = 0
+
+    def read(self, size=-1) -> bytes:
+        data = self.file.read(size)
+        self.count += len(data)
+        return data
+
+    def readline(self, size=-1) -> bytes:
+        data = self.file.readline(size)
+        self.count += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+def measure(server: FakeIMAPServer, fetch: Callable[[MailBoxUnencrypted], None]) -> Tuple[int, int]:
+    """
+    Gets the bytes read and the commands sent while fetch runs, not counting the login.
+    """
+    with MailBoxUnencrypted(server.host, server.port).login("me@gmail.com", "pw") as mailbox:
+        reader = CountingReader(mailbox.client.file)
+        mailbox.client.file = reader
+        commands = server.commands
+        fetch(mailbox)
+        return reader.count, server.commands - commands
+
+
+def fetch_full(mailbox: MailBoxUnencrypted, uids) -> None:
+    for uid_chunk in chunked_crop(uids, 100):
+        mailbox.client.uid("FETCH", ",".join(uid_chunk), "(UID BODY.PEEK[])")
+
+
+def main(n: int = 200) -> None:
+    uids = [str(uid) for uid in range(1, n + 1)]
+    runs = {
+        "full BODY[] fetch": lambda mailbox: fetch_full(mailbox, uids),
+        "fetch_alerts": lambda mailbox: list(fetch_alerts(mailbox, uids)),
+        f"fetch_alerts, span cut off at {CUT_OFF_RANGE // 1024}KB": lambda mailbox: list(fetch_alerts(mailbox, uids, body_range=CUT_OFF_RANGE)),
+    }
+    with FakeIMAPServer(alert_emails(n)).serve_in_thread() as server:
+        results = {name: measure(server, fetch) for name, fetch in runs.items()}
+
+    full = results["full BODY[] fetch"][0]
+    print(f"messages: {n}")
+    for name, (read, commands) in results.items():
+        print(f"{name:<36} {read / n:>9,.0f} bytes/message  {commands:>4} commands  {100 - read * 100 / full:>5.1f}% saved")
+
+
+if __name__ == "__main__":
+    main(int(os.getenv("N", 200)))
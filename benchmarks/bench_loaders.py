@@ -0,0 +1,99 @@
+"""
+Compares writing parsed transactions one row at a time with the ORM, in executemany batches
+and with COPY through a staging table, then writes them the way init flushes them: with a
+checkpoint, --batch-size rows per insert and --copy-batch-size rows per COPY. Needs DATABASE_URL
+to point at postgres; the tables are migrated in a throwaway kuda_bench schema which is dropped at the end.
+
+run with: python -m benchmarks.bench_loaders
+"""
+import os
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.orm import sessionmaker
+
+import storage.apis as apis
+from storage.migrations import migrate
+from storage.models import DebitTransaction
+
+SCHEMA = "kuda_bench"
+
+
+def debit_trxns(n: int):
+    start = datetime(2020, 1, 1)
+    return [{
+        "date_of_transaction": start + timedelta(hours=i),
+        "amount": float(i % 50000),
+        "source_key": f"{i:064x}",
+        "debit_metadata": {"transfer": True, "receiver": f"john doe {i}", "narration": "rent\tand\\bills"},
+    } for i in range(n)]
+
+
+def single_rows(trxns):
+    for trxn in trxns:
+        apis.write_debit_trxn(trxn)
+
+
+def flushes(write, size: int):
+    """
+    Writes the transactions size at a time, each with a checkpoint, like init does.
+    """
+    def load(trxns):
+        for i in range(0, len(trxns), size):
+            write(trxns[i:i + size], [], {"key": "sync:bench", "uidvalidity": 1, "last_uid": i + size})
+    return load
+
+
+def bench(name: str, load, trxns, session) -> float:
+    session.execute(text("TRUNCATE debit_transactions, transactions, daily_totals, monthly_totals"))
+    session.commit()
+    start = time.perf_counter()
+    load(trxns)
+    elapsed = time.perf_counter() - start
+    assert session.scalar(select(func.count()).select_from(DebitTransaction)) == len(trxns)
+    print(f"{name:<30} {len(trxns) / elapsed:>10,.0f} rows/s  {elapsed:>8.2f} s")
+    return elapsed
+
+
+def main(n: int = 20000) -> None:
+    url = os.getenv("DATABASE_URL", "")
+    if not url.startswith("postgresql"):
+        raise SystemExit("set DATABASE_URL to a postgres database to run this benchmark.")
+
+    engine = create_engine(url, connect_args={"options": f"-csearch_path={SCHEMA}"})
+    with engine.begin() as connection:
+        connection.execute(text(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}"))
+    migrate(engine)
+    apis.engine, apis.Session = engine, sessionmaker(bind=engine)
+    apis.logger.disabled = True
+
+    trxns = debit_trxns(n)
+    print(f"rows: {n}")
+    try:
+        with apis.Session() as session:
+            orm = bench("ORM, one row at a time", single_rows, trxns[:n // 10], session)
+            batched = bench("executemany batches", apis.write_debit_trxns, trxns, session)
+            copied = bench("COPY + merge", apis.copy_debit_trxns, trxns, session)
+
+            start = time.perf_counter()
+            apis.copy_debit_trxns(trxns)
+            assert session.scalar(select(func.count()).select_from(DebitTransaction)) == n
+            print(f"{'COPY again (no-op)':<30} {n / (time.perf_counter() - start):>10,.0f} rows/s")
+
+            print("flushes with a checkpoint:")
+            inserts = bench(f"inserts, {apis.DEFAULT_BATCH_SIZE} rows", flushes(
+                lambda debit, credit, checkpoint: apis.write_trxns(debit, credit, apis.DEFAULT_BATCH_SIZE, checkpoint),
+                apis.DEFAULT_BATCH_SIZE), trxns, session)
+            small = bench(f"COPY, {apis.DEFAULT_BATCH_SIZE} rows", flushes(apis.copy_trxns, apis.DEFAULT_BATCH_SIZE), trxns, session)
+            large = bench(f"COPY, {apis.DEFAULT_COPY_BATCH_SIZE} rows", flushes(apis.copy_trxns, apis.DEFAULT_COPY_BATCH_SIZE), trxns, session)
+    finally:
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+        engine.dispose()
+
+    print(f"COPY speedup: {orm * 10 / copied:.1f}x over single rows, {batched / copied:.1f}x over batches")
+    print(f"flushing with COPY: {inserts / large:.1f}x over inserts, {small / large:.1f}x over COPY of {apis.DEFAULT_BATCH_SIZE} rows")
+
+
+if __name__ == "__main__":
+    main(int(os.getenv("N", 20000)))
@@ -0,0 +1,119 @@
+"""
+Measures the parsing hot path one step at a time over a reproducible corpus that covers every
+alert template: span extraction, generally_classify_transactions, the parse_*_transaction
+functions, get_amount, and classify_and_parse_alerts end to end. For each step it reports alerts
+per second (best of REPEAT runs) and the peak memory allocated while handling one alert.
+
+Set SAVE_BASELINE=path.json to save the rates, and BASELINE=path.json to compare against saved
+rates. The benchmark exits with 1 if any step got more than TOLERANCE (default 0.15) slower,
+so parser changes can be gated on throughput.
+
+run with: python -m benchmarks.bench_parsers
+"""
+import os
+import sys
+import json
+import time
+import logging
+import tracemalloc
+from collections import Counter
+from typing import Callable, Dict, List
+
+from benchmarks.corpus import TEMPLATES, alert_corpus
+from src.extract import extract_alert_text
+from src.logger import logger
+from src.main import (
+    classify_and_parse_alerts,
+    generally_classify_transactions,
+    parse_credit_transaction,
+    parse_debit_transaction
+)
+from utils.utils import get_amount
+
+
+def rate(func: Callable, inputs: List, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in inputs:
+            func(item)
+        best = min(best, time.perf_counter() - start)
+    return len(inputs) / best
+
+
+def peak_bytes(func: Callable, inputs: List, sample: int = 500) -> float:
+    """
+    Averages the most memory allocated at once while func handles each of the first sample inputs.
+    """
+    inputs = inputs[:sample]
+    tracemalloc.start()
+    try:
+        total = 0
+        for item in inputs:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            func(item)
+            total += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return total / len(inputs)
+
+
+def check_baseline(rates: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    """
+    Gets the steps that are more than tolerance slower than in the baseline.
+    """
+    return [name for name, old in baseline.items() if name in rates and rates[name] < old * (1 - tolerance)]
+
+
+def main(n: int = 5000, seed: int = 0, repeat: int = 3, baseline: str | None = None,
+         save_baseline: str | None = None, tolerance: float = 0.15) -> bool:
+    logger.setLevel(logging.WARNING)
+    corpus = alert_corpus(n, seed)
+    statements = [extract_alert_text(html) for _, html in corpus]
+    transactions = [{"trxn_statement": statement, "date": "2026-01-02"} for statement in statements]
+    debits = [trxn for (template, _), trxn in zip(corpus, transactions) if TEMPLATES[template][0] == "debit"]
+    credits = [trxn for (template, _), trxn in zip(corpus, transactions) if TEMPLATES[template][0] == "credit"]
+    raw_alerts = [(str(i), "2026-01-02", html, f"<{i}@kuda.com>", "2026-01-02T10:00:00+01:00")
+                  for i, (_, html) in enumerate(corpus)]
+
+    # the templates whose statements the classifier doesn't put in the same type as the parse rules do.
+    mismatched = Counter(template for (template, _), trxn in zip(corpus, transactions)
+                         if generally_classify_transactions(trxn) != TEMPLATES[template][0])
+    print(f"alerts: {n} over {len(TEMPLATES)} templates (seed {seed}), average statement: "
+          f"{sum(map(len, statements)) // n} chars, average html: {sum(len(html) for _, html in corpus) // n:,} chars")
+    if mismatched:
+        print(f"classified differently from their template: {dict(mismatched)}")
+
+    steps = {
+        "extract_alert_text": (extract_alert_text, [html for _, html in corpus]),
+        "generally_classify": (generally_classify_transactions, transactions),
+        "parse_debit": (parse_debit_transaction, debits),
+        "parse_credit": (parse_credit_transaction, credits),
+        "get_amount": (get_amount, [statement.lower() for statement in statements]),
+        "end_to_end": (lambda raw_alert: classify_and_parse_alerts([raw_alert]), raw_alerts),
+    }
+    rates = {}
+    for name, (func, inputs) in steps.items():
+        rates[name] = rate(func, inputs, repeat)
+        print(f"{name:<20} {rates[name]:>12,.0f} alerts/s  {1e6 / rates[name]:>8,.2f} us/alert  "
+              f"{peak_bytes(func, inputs):>9,.0f} B peak/alert")
+
+    if save_baseline:
+        with open(save_baseline, "w") as f:
+            json.dump(rates, f, indent=2)
+        print(f"saved the rates to {save_baseline}")
+    if baseline:
+        with open(baseline) as f:
+            slower = check_baseline(rates, json.load(f), tolerance)
+        if slower:
+            print(f"more than {tolerance:.0%} slower than {baseline}: {', '.join(slower)}")
+            return False
+        print(f"no step is more than {tolerance:.0%} slower than {baseline}")
+    return True
+
+
+if __name__ == "__main__":
+    ok = main(int(os.getenv("N", 5000)), int(os.getenv("SEED", 0)), int(os.getenv("REPEAT", 3)),
+              os.getenv("BASELINE"), os.getenv("SAVE_BASELINE"), float(os.getenv("TOLERANCE", 0.15)))
+    sys.exit(0 if ok else 1)
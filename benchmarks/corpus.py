@@ -0,0 +1,117 @@
+"""
+Synthetic kuda alert emails for benchmarks.
+"""
+import random
+from html import escape
+from email.message import Message
+from email.mime.image import MIMEImage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formatdate, make_msgid
+from typing import List, Tuple
+
+EPOCH = 1767348000 # when the first synthetic alert was sent. each one after it is an hour later.
+STYLE = "".join(f".c{i} {{ font-family: Helvetica, Arial, sans-serif; color: #40196d; padding: {i % 16}px; }}\n" for i in range(250))
+ROWS = "".join(
+    f'<tr><td class="c{i}" style="padding:8px 24px;border-bottom:1px solid #eee">&nbsp;</td></tr>\n' for i in range(60)
+)
+STATEMENTS = [
+    "John Doe just sent you ₦25,000.00 - Rent. Love, Kuda.",
+    "You just sent ₦1,500.00 to Jane Doe - Lunch. Love, Kuda.",
+    "You just recharged MTN NG VTU 08031234567 - Airtime with ₦500.00",
+    "You tried to make a transfer of ₦10,000.00, and it didn't go through so we've reversed it.",
+]
+
+# (transaction type, statement) for every kind of alert the parsers handle, worded the way the
+# parse rules in src/debit.py and src/credit.py expect.
+TEMPLATES = {
+    "transfer_in": ("credit", "{name} just sent you ₦{amount} - {narration}. Love, Kuda."),
+    "transfer_out": ("debit", "You just sent ₦{amount} to {name} - {narration}. Love, Kuda."),
+    "airtime": ("debit", "You just recharged {network} {phone} - {plan} with ₦{amount}"),
+    "card_online": ("debit", "You paid ₦{amount} with your Kuda card on {merchant}. Love, Kuda."),
+    "card_pos": ("debit", "You used your card on a POS to pay ₦{amount} at {merchant}. Love, Kuda."),
+    "spend_and_save": ("debit", "We moved ₦{amount} from your Spend account to {pocket} savings. Love, Kuda."),
+    "savings_withdrawal": ("credit", "You took out ₦{amount} from your {pocket} savings. Love, Kuda."),
+    "reversal": ("credit", "You tried to make a transfer of ₦{amount}, and it didn't go through so we've reversed it."),
+}
+FIRST_NAMES = ["John", "Jane", "Chidi", "Amaka", "Tunde", "Ngozi", "Emeka", "Bisi", "Ifeoma", "Segun"]
+LAST_NAMES = ["Doe", "Okafor", "Adeyemi", "Bello", "Eze", "Nwosu", "Balogun", "Okoro", "Adebayo", "Ibrahim"]
+NARRATIONS = ["Rent", "Lunch", "School fees", "Transport", "Groceries", "Thanks", "Birthday gift", "Light bill", "Data", "Contribution"]
+NETWORKS = ["MTN NG VTU", "Airtel NG", "Glo NG", "9mobile"]
+MERCHANTS = ["Netflix", "Spotify", "Jumia", "Bolt", "Uber", "Apple", "Shoprite Lekki", "Chicken Republic", "Konga", "Amazon"]
+POCKETS = ["Personal", "Reserve", "Rent", "Holiday", "Emergency"]
+
+
+def random_fields(rng: random.Random) -> dict:
+    # most transactions are small, with a long tail of large ones.
+    amount = round(min(10 ** rng.uniform(2, 7), 5_000_000), 2)
+    return {
+        "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        "amount": f"{amount:,.2f}",
+        "narration": rng.choice(NARRATIONS),
+        "network": rng.choice(NETWORKS),
+        "phone": "0" + rng.choice(["803", "806", "810", "813", "703", "706", "802", "805", "809"]) + f"{rng.randrange(10 ** 7):07d}",
+        "plan": rng.choice(["Airtime", "Data"]),
+        "merchant": rng.choice(MERCHANTS),
+        "pocket": rng.choice(POCKETS),
+    }
+
+
+def alert_statements(n: int, seed: int = 0) -> List[Tuple[str, str]]:
+    """
+    Builds n (template, statement) pairs that go round every template, with names, amounts,
+    narrations and the rest picked by a generator seeded with seed, so the same seed always
+    gives the same corpus.
+    """
+    rng = random.Random(seed)
+    names = list(TEMPLATES)
+    return [(names[i % len(names)], TEMPLATES[names[i % len(names)]][1].format(**random_fields(rng))) for i in range(n)]
+
+
+def alert_corpus(n: int, seed: int = 0) -> List[Tuple[str, str]]:
+    """
+    alert_statements as the html of the alert emails they would arrive in.
+    """
+    return [(template, alert_html(statement)) for template, statement in alert_statements(n, seed)]
+
+
+def alert_html(statement: str) -> str:
+    """
+    Builds html shaped like a kuda alert: a large style block, an outlook-only comment,
+    layout tables and the statement in the first span, with its entities escaped.
+    """
+    statement = escape(statement).replace("₦", "&#8358;")
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><meta name="viewport" content="width=device-width">'
+        f"<title>Kuda</title><style>{STYLE}</style></head><body>"
+        "<!--[if mso]><span>Kuda Bank</span><![endif]-->"
+        '<table role="presentation" width="100%"><tr><td><img src="cid:logo" alt="Kuda"></td></tr>'
+        f'<tr><td class="c1">Hi John,</td></tr><tr><td class="c2"><span style="font-size:16px">{statement}</span></td></tr>'
+        f"{ROWS}</table></body></html>"
+    )
+
+
+def alert_email(statement: str, seed: int = 0) -> Message:
+    """
+    Builds an email shaped like a kuda alert: the html, a plain text alternative, and an
+    inline logo and banner image.
+    """
+    rng = random.Random(seed)
+    alternative = MIMEMultipart("alternative")
+    alternative.attach(MIMEText(statement, "plain", "utf-8"))
+    alternative.attach(MIMEText(alert_html(statement), "html", "utf-8"))
+
+    message = MIMEMultipart("related")
+    message.attach(alternative)
+    for cid, size in (("logo", 6 * 1024), ("banner", 24 * 1024)):
+        image = MIMEImage(rng.randbytes(size), "png")
+        image.add_header("Content-ID", f"<{cid}>")
+        image.add_header("Content-Disposition", "inline", filename=f"{cid}.png")
+        message.attach(image)
+
+    message["From"] = "Kuda <no-reply@kuda.com>"
+    message["To"] = "john@gmail.com"
+    message["Subject"] = "Kuda transaction alert"
+    message["Date"] = formatdate(EPOCH + seed * 3600)
+    message["Message-ID"] = make_msgid(domain="kuda.com")
+    return message
@@ -0,0 +1,294 @@
+"""
+A small in-process IMAP server loaded with synthetic kuda alerts, so ingestion can be tested
+and benchmarked without a network or a real mailbox.
+"""
+import re
+import asyncio
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.message import Message
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Iterator, List, Mapping, Sequence, Tuple
+
+from benchmarks.corpus import EPOCH, STATEMENTS, alert_email, alert_statements
+
+
+FETCH_ITEM_PATTERN = re.compile(r"BODY(?:\.PEEK)?\[([^\]]*)\](?:<(\d+)\.(\d+)>)?|[A-Z0-9.]+", re.IGNORECASE)
+SEARCH_TOKEN_PATTERN = re.compile(r'"[^"]*"|[^\s()]+')
+
+
+def body_structure(part: Message) -> str:
+    """
+    Builds the BODYSTRUCTURE a server reports for a message.
+    """
+    if part.is_multipart():
+        children = "".join(body_structure(child) for child in part.get_payload())
+        return f'({children} "{part.get_content_subtype()}" ("boundary" "{part.get_boundary()}") NIL NIL NIL)'
+
+    params = " ".join(f'"{k}" "{v}"' for k, v in part.get_params()[1:]) or "NIL"
+    payload = part.get_payload()
+    encoding = (part.get("Content-Transfer-Encoding") or "7bit").lower()
+    fields = f'"{part.get_content_maintype()}" "{part.get_content_subtype()}" ({params}) NIL NIL "{encoding}" {len(payload.encode())}'
+    if part.get_content_maintype() == "text":
+        fields += f" {payload.count(chr(10)) + 1}"
+    return f"({fields} NIL NIL NIL NIL)"
+
+
+def body_sections(part: Message, section: str = "") -> Iterator[Tuple[str, bytes]]:
+    """
+    Yields the section number and still encoded payload of every leaf part of a message.
+    """
+    if not part.is_multipart():
+        yield section or "1", part.get_payload().encode()
+        return
+    for idx, child in enumerate(part.get_payload(), start=1):
+        yield from body_sections(child, f"{section}.{idx}" if section else str(idx))
+
+
+def alert_emails(n: int, start: int = 0) -> List[Message]:
+    """
+    Builds n synthetic kuda alerts with different statements.
+    """
+    return [alert_email(STATEMENTS[i % len(STATEMENTS)].replace("John", f"John{i}"), i) for i in range(start, start + n)]
+
+
+class FakeMessage:
+    def __init__(self, uid: int, message: Message):
+        self.uid = uid
+        self.message = message
+        self.date = parsedate_to_datetime(message["Date"]).date()
+        self.structure = body_structure(message).encode()
+        self.sections = dict(body_sections(message))
+
+    def header_fields(self, names: Sequence[str]) -> bytes:
+        return "".join(f"{name}: {self.message[name]}\r\n" for name in names if self.message[name]).encode() + b"\r\n"
+
+    def section(self, section: str) -> bytes:
+        if section.upper().startswith("HEADER.FIELDS"):
+            return self.header_fields(re.findall(r"[\w-]+", section[len("HEADER.FIELDS"):]))
+        if not section:
+            return self.message.as_bytes()
+        return self.sections.get(section, b"")
+
+
+class SyntheticMessage(FakeMessage):
+    """
+    A message of SyntheticAlerts: the body of one of its pooled alerts under its own Date and Message-ID.
+    """
+    def __init__(self, uid: int, base: FakeMessage):
+        self.uid = uid
+        self.message = base.message
+        self.structure = base.structure
+        self.sections = base.sections
+        self.date = datetime.fromtimestamp(EPOCH + uid * 3600, timezone.utc).date()
+
+    def header_fields(self, names: Sequence[str]) -> bytes:
+        headers = {"date": formatdate(EPOCH + self.uid * 3600), "message-id": f"<alert-{self.uid}@kuda.com>"}
+        lines = [f"{name}: {headers.get(name.lower()) or self.message[name]}\r\n" for name in names
+                 if name.lower() in headers or self.message[name]]
+        return "".join(lines).encode() + b"\r\n"
+
+
+class SyntheticAlerts(Mapping):
+    """
+    uid -> message for n synthetic alerts over every template, for load tests. Building an alert
+    takes about a millisecond, so a pool of them is built once and uid i gets the body of alert
+    i % pool_size, with its own Date and Message-ID so every uid is still a different transaction.
+    """
+    def __init__(self, n: int, seed: int = 0, pool_size: int = 512):
+        self.n = n
+        self.pool = [FakeMessage(0, alert_email(statement, seed + idx))
+                     for idx, (_, statement) in enumerate(alert_statements(min(n, pool_size), seed))]
+
+    def __getitem__(self, uid: int) -> SyntheticMessage:
+        if not isinstance(uid, int) or not 1 <= uid <= self.n:
+            raise KeyError(uid)
+        return SyntheticMessage(uid, self.pool[(uid - 1) % len(self.pool)])
+
+    def __contains__(self, uid) -> bool:
+        return isinstance(uid, int) and 1 <= uid <= self.n
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(1, self.n + 1))
+
+    def __len__(self) -> int:
+        return self.n
+
+
+class FakeIMAPServer:
+    """
+    Serves messages over plain TCP with just enough IMAP for ingestion: LOGIN, SELECT, STATUS,
+    UID SEARCH (UID, FROM, SINCE and BEFORE), UID FETCH, IDLE, NOOP and LOGOUT. Any login is accepted.
+    latency is how long each command takes to answer, to stand in for a round trip to a real server.
+    """
+    def __init__(self, messages: Sequence[Message] | SyntheticAlerts = (), uidvalidity: int = 1, latency: float = 0.0):
+        self.messages: Dict[int, FakeMessage] = messages if isinstance(messages, SyntheticAlerts) else {}
+        self.uidvalidity = uidvalidity
+        self.latency = latency
+        self.commands = 0
+        self.host = "127.0.0.1"
+        self.port = 0
+        self._server = None
+        self._writers = set()
+        if not isinstance(messages, SyntheticAlerts):
+            for message in messages:
+                self.append(message)
+
+    def append(self, message: Message) -> int:
+        # messages are never expunged, so a message's sequence number is its uid.
+        uid = max(self.messages, default=0) + 1
+        self.messages[uid] = FakeMessage(uid, message)
+        return uid
+
+    async def start(self) -> "FakeIMAPServer":
+        self._server = await asyncio.start_server(self._handle, self.host, 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    def disconnect_all(self) -> None:
+        """
+        Drops every open connection, like a server restart or a network blip would.
+        """
+        for writer in list(self._writers):
+            writer.transport.abort()
+
+    @contextmanager
+    def serve_in_thread(self):
+        """
+        Runs the server on its own event loop in a background thread, for blocking clients like imap_tools.
+        """
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        asyncio.run_coroutine_threadsafe(self.start(), loop).result()
+        try:
+            yield self
+        finally:
+            asyncio.run_coroutine_threadsafe(self.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+    async def __aenter__(self) -> "FakeIMAPServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    def _uid_set(self, uid_set: str) -> List[int]:
+        last = max(self.messages, default=0)
+        uids = set()
+        for item in uid_set.split(","):
+            lo, _, hi = item.partition(":")
+            lo = last if lo == "*" else int(lo)
+            hi = lo if not hi else last if hi == "*" else int(hi)
+            uids.update(uid for uid in range(min(lo, hi), max(lo, hi) + 1) if uid in self.messages)
+        return sorted(uids)
+
+    def search(self, criteria: str) -> List[int]:
+        tokens = SEARCH_TOKEN_PATTERN.findall(criteria)
+        found = list(self.messages.values())
+        for key, value in zip(tokens, tokens[1:] + [""]):
+            key, value = key.upper(), value.strip('"')
+            if key == "UID":
+                uids = set(self._uid_set(value))
+                found = [m for m in found if m.uid in uids]
+            elif key == "FROM":
+                found = [m for m in found if value.lower() in str(m.message["From"]).lower()]
+            elif key in ("SINCE", "BEFORE"):
+                day = datetime.strptime(value, "%d-%b-%Y").date()
+                found = [m for m in found if (m.date >= day if key == "SINCE" else m.date < day)]
+        return [m.uid for m in found]
+
+    def fetch(self, message: FakeMessage, items: str) -> bytes:
+        parts = []
+        for match in FETCH_ITEM_PATTERN.finditer(items):
+            name = match.group(0).upper()
+            if match.group(1) is not None or name.startswith("BODY["):
+                section, start, length = match.group(1) or "", match.group(2), match.group(3)
+                data = message.section(section)
+                label = f"BODY[{section}]"
+                if start is not None:
+                    data = data[int(start):int(start) + int(length)]
+                    label += f"<{start}>"
+                parts.append(f"{label} {{{len(data)}}}\r\n".encode() + data)
+            elif name == "UID":
+                parts.append(f"UID {message.uid}".encode())
+            elif name == "BODYSTRUCTURE":
+                parts.append(b"BODYSTRUCTURE " + message.structure)
+            elif name == "FLAGS":
+                parts.append(b"FLAGS ()")
+            elif name == "RFC822.SIZE":
+                parts.append(f"RFC822.SIZE {len(message.message.as_bytes())}".encode())
+        return f"* {message.uid} FETCH (".encode() + b" ".join(parts) + b")\r\n"
+
+    async def _idle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, seen: int) -> int:
+        """
+        Reports messages added since the client last saw seen of them with EXISTS, until it sends DONE.
+        """
+        writer.write(b"+ idling\r\n")
+        await writer.drain()
+        done = asyncio.ensure_future(reader.readline())
+        while not done.done():
+            if len(self.messages) != seen:
+                seen = len(self.messages)
+                writer.write(f"* {seen} EXISTS\r\n".encode())
+                await writer.drain()
+            await asyncio.wait([done], timeout=0.05)
+        if not done.result():
+            raise ConnectionResetError("the client went away while idling.")
+        return seen
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._writers.add(writer)
+        writer.write(b"* OK fake imap server ready\r\n")
+        exists = 0
+        try:
+            while line := await reader.readline():
+                tag, _, rest = line.decode().rstrip("\r\n").partition(" ")
+                command, _, args = rest.partition(" ")
+                command = command.upper()
+                self.commands += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+
+                if command == "UID":
+                    command, _, args = args.partition(" ")
+                    command = "UID " + command.upper()
+                if command == "CAPABILITY":
+                    writer.write(b"* CAPABILITY IMAP4rev1 IDLE\r\n")
+                elif command == "SELECT" or command == "EXAMINE":
+                    exists = len(self.messages)
+                    writer.write(f"* {len(self.messages)} EXISTS\r\n* OK [UIDVALIDITY {self.uidvalidity}] UIDs valid\r\n"
+                                 f"* OK [UIDNEXT {max(self.messages, default=0) + 1}] next uid\r\n".encode())
+                elif command == "STATUS":
+                    folder = args.rsplit(" (", 1)[0]
+                    writer.write(f"* STATUS {folder} (UIDVALIDITY {self.uidvalidity})\r\n".encode())
+                elif command == "UID SEARCH":
+                    writer.write(("* SEARCH " + " ".join(map(str, self.search(args)))).rstrip().encode() + b"\r\n")
+                elif command == "UID FETCH":
+                    uid_set, _, items = args.partition(" ")
+                    for uid in self._uid_set(uid_set):
+                        writer.write(self.fetch(self.messages[uid], items))
+                elif command == "IDLE":
+                    exists = await self._idle(reader, writer, exists)
+                elif command == "LOGOUT":
+                    writer.write(b"* BYE logging out\r\n")
+                elif command not in ("LOGIN", "NOOP", "CLOSE"):
+                    writer.write(f"{tag} BAD unknown command {command}\r\n".encode())
+                    await writer.drain()
+                    continue
+                writer.write(f"{tag} OK {command} completed\r\n".encode())
+                await writer.drain()
+                if command == "LOGOUT":
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
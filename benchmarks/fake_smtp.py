@@ -0,0 +1,115 @@
+"""
+A small in-process SMTP server that keeps every message sent to it, so exporting can be tested
+and load tested without sending real email.
+"""
+import asyncio
+import threading
+from contextlib import contextmanager
+from email import message_from_bytes
+from email.message import Message
+from typing import List, Tuple
+
+
+class FakeSMTPServer:
+    """
+    Accepts mail over plain TCP with just enough SMTP for smtplib: EHLO, HELO, AUTH PLAIN and LOGIN,
+    MAIL, RCPT, DATA, RSET, NOOP and QUIT. Any login is accepted. Each message is kept in messages as
+    (sender, recipients, message).
+    """
+    def __init__(self):
+        self.messages: List[Tuple[str, List[str], Message]] = []
+        self.host = "127.0.0.1"
+        self.port = 0
+        self._server = None
+
+    async def start(self) -> "FakeSMTPServer":
+        self._server = await asyncio.start_server(self._handle, self.host, 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    @contextmanager
+    def serve_in_thread(self):
+        """
+        Runs the server on its own event loop in a background thread, for blocking clients like smtplib.
+        """
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        asyncio.run_coroutine_threadsafe(self.start(), loop).result()
+        try:
+            yield self
+        finally:
+            asyncio.run_coroutine_threadsafe(self.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+    async def __aenter__(self) -> "FakeSMTPServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def _data(self, reader: asyncio.StreamReader) -> bytes:
+        lines = []
+        while (line := await reader.readline()) not in (b".\r\n", b".\n", b""):
+            # a leading dot was doubled by the client so it isn't read as the end of the message.
+            lines.append(line[1:] if line.startswith(b"..") else line)
+        return b"".join(lines)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        writer.write(b"220 fake smtp server ready\r\n")
+        sender, recipients = None, []
+        try:
+            while line := await reader.readline():
+                command, _, args = line.decode().rstrip("\r\n").partition(" ")
+                command = command.upper()
+                if command == "EHLO":
+                    writer.write(b"250-fake smtp server\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+                elif command == "HELO":
+                    writer.write(b"250 fake smtp server\r\n")
+                elif command == "AUTH":
+                    mechanism, _, initial = args.partition(" ")
+                    if mechanism.upper() == "LOGIN":
+                        # asks for the user and then the password, unless the user came with the command.
+                        for prompt in ([b"334 UGFzc3dvcmQ6\r\n"] if initial else [b"334 VXNlcm5hbWU6\r\n", b"334 UGFzc3dvcmQ6\r\n"]):
+                            writer.write(prompt)
+                            await writer.drain()
+                            await reader.readline()
+                    elif not initial:
+                        writer.write(b"334 \r\n")
+                        await writer.drain()
+                        await reader.readline()
+                    writer.write(b"235 authenticated\r\n")
+                elif command == "MAIL":
+                    sender, recipients = args.partition(":")[2].split()[0].strip("<>"), []
+                    writer.write(b"250 OK\r\n")
+                elif command == "RCPT":
+                    recipients.append(args.partition(":")[2].split()[0].strip("<>"))
+                    writer.write(b"250 OK\r\n")
+                elif command == "DATA":
+                    writer.write(b"354 end data with <CR><LF>.<CR><LF>\r\n")
+                    await writer.drain()
+                    self.messages.append((sender, recipients, message_from_bytes(await self._data(reader))))
+                    sender, recipients = None, []
+                    writer.write(b"250 OK\r\n")
+                elif command == "RSET":
+                    sender, recipients = None, []
+                    writer.write(b"250 OK\r\n")
+                elif command == "NOOP":
+                    writer.write(b"250 OK\r\n")
+                elif command == "QUIT":
+                    writer.write(b"221 bye\r\n")
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(f"502 unknown command {command}\r\n".encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
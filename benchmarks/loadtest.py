@@ -0,0 +1,220 @@
+"""
+End-to-end load test of the ka commands. For each mailbox size in SIZES it serves that many
+synthetic alerts over every template from the in-process fake IMAP server, runs `ka init` and
+then `ka export --credit` as subprocesses against a throwaway database, and sends the export to
+an in-process fake SMTP server. Nothing but the servers is faked: the commands run exactly as a
+user would run them, with the settings passed through the environment.
+
+For each command and size it reports the wall time, the peak RSS of its largest process and the
+rows it wrote or exported per second, so a run over a few sizes gives a scaling curve.
+
+    SIZES        mailbox sizes to run, default 1000,10000
+    DB           sqlite (default) or postgres. postgres uses LOADTEST_DATABASE_URL, or starts a
+                 local server with pgserver, and creates a fresh database for every size.
+    ENGINE       the ka init engine, threads (default) or async
+    WORKERS      ka init --workers, default every core
+    CONNECTIONS  ka init --connections, default 1
+    SEED         the corpus seed, default 0
+    REDIS_URL    the redis used for checkpoints, default an in-process fakeredis server
+
+Set SAVE_BASELINE=path.json to save the results, and BASELINE=path.json to compare against saved
+results. The load test exits with 1 if any command got more than TOLERANCE (default 0.25) slower
+or its peak RSS grew by more than that.
+
+run with: python -m benchmarks.loadtest
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Iterator, List
+from sqlalchemy import create_engine, make_url, text
+
+from benchmarks.fake_imap import FakeIMAPServer, SyntheticAlerts
+from benchmarks.fake_smtp import FakeSMTPServer
+
+ROOT = Path(__file__).resolve().parent.parent
+KUDA = "no-reply@kuda.com"
+
+
+@contextmanager
+def redis_url() -> Iterator[str]:
+    """
+    Uses REDIS_URL, or serves fakeredis over TCP so the ka subprocesses can share it.
+    """
+    if os.getenv("REDIS_URL"):
+        yield os.getenv("REDIS_URL")
+        return
+    try:
+        from fakeredis import TcpFakeServer
+    except ImportError:
+        sys.exit("set REDIS_URL or pip install fakeredis to run the load test.")
+    server = TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"redis://127.0.0.1:{server.server_address[1]}/0"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@contextmanager
+def postgres_url(tmp: str) -> Iterator[str]:
+    """
+    Uses LOADTEST_DATABASE_URL, or starts a local postgres with pgserver.
+    """
+    if os.getenv("LOADTEST_DATABASE_URL"):
+        yield os.getenv("LOADTEST_DATABASE_URL")
+        return
+    try:
+        import pgserver
+    except ImportError:
+        sys.exit("set LOADTEST_DATABASE_URL or pip install pgserver to load test on postgres.")
+    server = pgserver.get_server(f"{tmp}/pgdata", cleanup_mode="stop")
+    try:
+        yield make_url(server.get_uri()).set(drivername="postgresql+psycopg2").render_as_string(hide_password=False)
+    finally:
+        server.cleanup()
+
+
+@contextmanager
+def disposable_database(db: str, server_url: str | None, tmp: str, name: str) -> Iterator[str]:
+    """
+    Creates an empty database for one run and drops it afterwards.
+    """
+    if db == "sqlite":
+        yield f"sqlite:///{tmp}/{name}.db"
+        return
+
+    admin = create_engine(server_url, isolation_level="AUTOCOMMIT")
+    try:
+        with admin.connect() as conn:
+            conn.execute(text(f'DROP DATABASE IF EXISTS "{name}"'))
+            conn.execute(text(f'CREATE DATABASE "{name}"'))
+        yield make_url(server_url).set(database=name).render_as_string(hide_password=False)
+        with admin.connect() as conn:
+            conn.execute(text(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)'))
+    finally:
+        admin.dispose()
+
+
+def count_rows(database_url: str) -> Dict[str, int]:
+    engine = create_engine(database_url)
+    try:
+        with engine.connect() as conn:
+            return {table: conn.execute(text(f"SELECT count(*) FROM {table}_transactions")).scalar()
+                    for table in ("debit", "credit")}
+    finally:
+        engine.dispose()
+
+
+def run_ka(args: List[str], env: Dict[str, str], cwd: str, log_path: str) -> Dict:
+    """
+    Runs a ka command to completion and measures its wall time and the peak RSS of its largest process,
+    which covers the worker processes it started as well.
+    """
+    with open(log_path, "w") as log:
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, "-m", "src.cli", *args], env=env, cwd=cwd,
+                                   stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(process.pid, 0)
+        seconds = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode:
+        tail = Path(log_path).read_text().splitlines()[-20:]
+        raise RuntimeError(f"ka {' '.join(args)} exited with {process.returncode}:\n" + "\n".join(tail))
+    return {"seconds": seconds, "peak_rss_mb": usage.ru_maxrss / 1024}
+
+
+def run_size(n: int, seed: int, database_url: str, redis: str, tmp: str, engine: str,
+             workers: int, connections: int) -> Dict[str, Dict]:
+    """
+    Loads n alerts with ka init and exports the credits with ka export.
+    """
+    imap, smtp = FakeIMAPServer(SyntheticAlerts(n, seed)), FakeSMTPServer()
+    workdir = Path(tmp) / f"n{n}"
+    workdir.mkdir()
+    with imap.serve_in_thread(), smtp.serve_in_thread():
+        env = {
+            **os.environ,
+            "PYTHONPATH": str(ROOT),
+            "DATABASE_URL": database_url,
+            "REDIS_URL": redis,
+            "IMAP_SERVER": imap.host, "IMAP_PORT": str(imap.port), "IMAP_SSL": "false",
+            "SMTP_SERVER": smtp.host, "SMTP_PORT": str(smtp.port), "SMTP_SSL": "false",
+            # a new address every run, so checkpoints left in a shared redis never apply.
+            "EMAIL": f"loadtest-{uuid.uuid4().hex[:12]}@example.com", "PASSWORD": "loadtest",
+            "KUDA": KUDA,
+            "GEMINI_API_KEY": "loadtest", "GOOGLE_API_KEY": "loadtest",
+            "ARCHIVE_DIR": str(workdir / "archive"), "METRICS_DIR": str(workdir / "metrics"),
+        }
+
+        init = run_ka(["init", f"--n={n}", f"--engine={engine}", f"--workers={workers}", f"--connections={connections}"],
+                      env, str(workdir), str(workdir / "init.log"))
+        rows = count_rows(database_url)
+        init["rows"] = rows["debit"] + rows["credit"]
+
+        export = run_ka(["export", "2000-01-01", "2100-01-01", "sink@example.com", "--credit"],
+                        env, str(workdir), str(workdir / "export.log"))
+        export["rows"] = rows["credit"]
+        if not any("sink@example.com" in recipients for _, recipients, _ in smtp.messages):
+            raise RuntimeError(f"ka export didn't send anything, see {workdir / 'export.log'}")
+
+    for result in (init, export):
+        result["rows_per_s"] = result["rows"] / result["seconds"]
+    return {"init": init, "export": export}
+
+
+def check_baseline(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """
+    Gets the runs that are more than tolerance slower, or whose peak RSS is more than tolerance bigger, than in the baseline.
+    """
+    return [run for run, old in baseline.items() if run in results and (
+        results[run]["rows_per_s"] < old["rows_per_s"] * (1 - tolerance)
+        or results[run]["peak_rss_mb"] > old["peak_rss_mb"] * (1 + tolerance))]
+
+
+def main(sizes: List[int], seed: int = 0, db: str = "sqlite", engine: str = "threads",
+         workers: int = os.cpu_count() or 1, connections: int = 1, baseline: str | None = None,
+         save_baseline: str | None = None, tolerance: float = 0.25) -> bool:
+    print(f"sizes: {', '.join(map(str, sizes))}, db: {db}, engine: {engine}, workers: {workers}, connections: {connections}")
+    print(f"{'command':<8} {'alerts':>8} {'rows':>8} {'seconds':>9} {'rows/s':>10} {'peak RSS':>10}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, ExitStack() as stack:
+        redis = stack.enter_context(redis_url())
+        server_url = stack.enter_context(postgres_url(tmp)) if db == "postgres" else None
+        for n in sizes:
+            with disposable_database(db, server_url, tmp, f"kuda_loadtest_{n}") as database_url:
+                for command, result in run_size(n, seed, database_url, redis, tmp, engine, workers, connections).items():
+                    results[f"{command} n={n}"] = result
+                    print(f"{command:<8} {n:>8,} {result['rows']:>8,} {result['seconds']:>9.2f} "
+                          f"{result['rows_per_s']:>10,.0f} {result['peak_rss_mb']:>7,.0f} MB")
+
+    if save_baseline:
+        with open(save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"saved the results to {save_baseline}")
+    if baseline:
+        with open(baseline) as f:
+            worse = check_baseline(results, json.load(f), tolerance)
+        if worse:
+            print(f"more than {tolerance:.0%} slower or bigger than {baseline}: {', '.join(worse)}")
+            return False
+        print(f"no command is more than {tolerance:.0%} slower or bigger than {baseline}")
+    return True
+
+
+if __name__ == "__main__":
+    ok = main([int(n) for n in os.getenv("SIZES", "1000,10000").split(",")], int(os.getenv("SEED", 0)),
+              os.getenv("DB", "sqlite"), os.getenv("ENGINE", "threads"), int(os.getenv("WORKERS", os.cpu_count() or 1)),
+              int(os.getenv("CONNECTIONS", 1)), os.getenv("BASELINE"), os.getenv("SAVE_BASELINE"),
+              float(os.getenv("TOLERANCE", 0.25)))
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,60 @@
+import os
+import json
+from pathlib import Path
+from typing import Dict, List
+
+from src.logger import logger
+
+
+REQUIRED_FIELDS = ("id", "email")
+
+
+def accounts_path() -> Path:
+    """
+    Gets the file the mailboxes to ingest are configured in, ACCOUNTS_FILE or ./accounts.json.
+    """
+    return Path(os.getenv("ACCOUNTS_FILE") or Path.cwd() / "accounts.json")
+
+
+def parse_account(entry: Dict) -> Dict:
+    """
+    Fills in the settings an account entry leaves out. The password can be given inline or as
+    password_env, the name of the environment variable that holds it, so it can stay in .env.
+    Connection settings default to the IMAP_* variables, like ka init.
+    """
+    missing = [field for field in REQUIRED_FIELDS if not entry.get(field)]
+    if missing:
+        raise ValueError(f"account {entry.get('id') or entry.get('email')} is missing {', '.join(missing)}")
+    use_ssl = entry.get("imap_ssl", os.getenv("IMAP_SSL", "true").lower() not in ("0", "false", "no"))
+    return {
+        "id": str(entry["id"]),
+        "email": entry["email"],
+        "password": entry.get("password") or os.getenv(entry.get("password_env") or "", ""),
+        "imap_server": entry.get("imap_server") or os.getenv("IMAP_SERVER"),
+        "imap_port": int(entry.get("imap_port") or os.getenv("IMAP_PORT") or (993 if use_ssl else 143)),
+        "imap_ssl": bool(use_ssl),
+        "connections": int(entry.get("connections", 1)),
+        # the most alerts a minute to fetch from this mailbox, to stay under its provider's limits.
+        "max_per_minute": entry.get("max_per_minute"),
+    }
+
+
+def load_accounts(path: Path | None = None) -> List[Dict] | None:
+    """
+    Reads the accounts file, a json list with an entry per mailbox:
+    {"id": "personal", "email": "...", "password_env": "PERSONAL_PASSWORD", "max_per_minute": 600}
+    """
+    path = path or accounts_path()
+    try:
+        accounts = [parse_account(entry) for entry in json.loads(path.read_text())]
+    except (OSError, ValueError, TypeError) as e:
+        logger.info(f"failed to read the accounts in {path}: {e}")
+        return None
+
+    # checkpoints and archives are kept per email address, so two accounts can't share one.
+    for field in ("id", "email"):
+        values = [account[field] for account in accounts]
+        if len(set(values)) != len(values):
+            logger.info(f"the {field} of every account in {path} has to be unique.")
+            return None
+    return accounts
@@ -20,7 +20,11 @@ def generate_transaction_sql(transaction_question: str) -> str:
         Here are there columns;
             - debit_transactions: (id, amount (float), date_of_transaction(string), narration, is_savings, savings_account, receiver, airtime, phone_number, network, online_payment, service_for_online_payment, point_of_sale)
             - credit_transactions: (id, amount (float), date_of_transaction(string), narration, is_savings, savings_account, sender, reversal)
-        Make sure the resulting query generates a query using either of those tables.
+            - daily_totals: (day (date), inflow, outflow, credits (count), debits (count), transfer_outflow, airtime_outflow, online_payment_outflow, point_of_sale_outflow, savings_outflow)
+            - monthly_totals: (month (date, the first day of the month), and the same totals as daily_totals)
+        For questions about totals over whole days or months, like how much was spent in March, prefer daily_totals and
+        monthly_totals, which already hold the sums, over adding up the transactions.
+        Make sure the resulting query generates a query using one of those tables.
         
         question: {transaction_question} 
     """
@@ -0,0 +1,125 @@
+import time
+import asyncio
+import multiprocessing
+from functools import partial
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor
+from typing import Awaitable, Callable, Dict
+
+from src.aioimap import AsyncIMAPClient, AsyncMailBoxPool
+from src.archive import ArchiveWriter, archive_dir
+from src.logger import logger
+from src.metrics import Metrics, measure_chunk
+from src.pipeline import START_METHOD
+from src.sync import (
+    DEFAULT_CHECKPOINT_EVERY,
+    get_sync_state_async,
+    new_messages_criteria,
+    resolve_last_uid,
+    select_new_uids,
+    sync_checkpoint,
+    sync_state_key
+)
+from storage.apis import DEFAULT_BATCH_SIZE, get_checkpoint_async, write_trxns_async
+from utils.utils import get_account_source_key
+
+
+async def ingest(connect: Callable[[], Awaitable[AsyncIMAPClient]], r, session_maker, email: str,
+                 to_raw: Callable, process_chunk: Callable, n: int | None = None,
+                 since: date | None = None, before: date | None = None, connections: int = 1, workers: int = 1,
+                 batch_size: int = DEFAULT_BATCH_SIZE, shard_size: int = 200, chunk_size: int = 50,
+                 queue_size: int = 8, folder: str = "INBOX", metrics: Metrics | None = None,
+                 checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY, account_id: str | None = None) -> Dict[str, int]:
+    """
+    Ingests new kuda alerts on one event loop. Shards of uids are fetched over every connection
+    at once, each chunk is parsed by process_chunk in a worker process (or a thread with one worker)
+    while the next ones download, and rows are written through an async session batch_size at a time,
+    or after at most checkpoint_every alerts. Each batch moves the checkpoint in the same transaction.
+    r is a redis.asyncio client, only read for checkpoints from before they were kept in the db,
+    and session_maker an async_sessionmaker. Rows are tagged with account_id when it is passed.
+    When metrics are passed, every stage and the depth of the parsed queue are timed into them.
+    """
+    client = await connect()
+    pool = AsyncMailBoxPool(connect, connections, [client])
+    executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(START_METHOD)) if workers > 1 else None
+    archive = None
+    try:
+        uidvalidity = await client.uidvalidity(folder)
+        state = (await get_checkpoint_async(session_maker, sync_state_key(email, folder, since, before))
+                 or await get_sync_state_async(r, email, folder, since, before))
+        last_uid = resolve_last_uid(state, uidvalidity)
+        uids = select_new_uids(await client.uid_search(str(new_messages_criteria(last_uid, since, before))), last_uid, n)
+        logger.info(f"fetching {len(uids)} transactions from uid {last_uid + 1} over {connections} connections.")
+
+        archive = ArchiveWriter(archive_dir(email, folder, uidvalidity))
+        loop = asyncio.get_running_loop()
+        parsed: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        counts = {"processed": 0, "debit": 0, "credit": 0, "invalid": 0, "last_uid": last_uid}
+
+        process = partial(measure_chunk, process_chunk) if metrics else process_chunk
+
+        async def fetch():
+            started = time.perf_counter()
+            async for messages in pool.fetch_sharded(uids, shard_size):
+                if metrics:
+                    metrics.observe("fetch", time.perf_counter() - started)
+                # compressing into the archive would hold up the other connections, so it runs in a thread.
+                await loop.run_in_executor(None, archive.extend, messages)
+                raw_alerts = [to_raw(message) for message in messages]
+                for i in range(0, len(raw_alerts), chunk_size):
+                    await parsed.put(loop.run_in_executor(executor, process, raw_alerts[i:i + chunk_size]))
+                started = time.perf_counter()
+            await parsed.put(None)
+
+        async def write():
+            buffered = {"debit": [], "credit": [], "last_uid": last_uid, "alerts": 0}
+
+            async def flush():
+                if buffered["last_uid"] == counts["last_uid"]:
+                    return
+                archive.flush()
+                started = time.perf_counter()
+                await write_trxns_async(session_maker, buffered["debit"], buffered["credit"], batch_size,
+                                        sync_checkpoint(email, folder, uidvalidity, buffered["last_uid"], since, before))
+                if metrics:
+                    metrics.observe("write", time.perf_counter() - started)
+                buffered["debit"], buffered["credit"], buffered["alerts"] = [], [], 0
+                counts["last_uid"] = buffered["last_uid"]
+
+            while (chunk := await parsed.get()) is not None:
+                results = await chunk
+                if metrics:
+                    metrics.sample_queue("parsed", parsed.qsize())
+                    results, chunk_metrics = results
+                    metrics.merge(chunk_metrics)
+                for uid, trxn_type, trxn in results:
+                    counts["processed"] += 1
+                    counts[trxn_type or "invalid"] += 1
+                    if trxn_type and account_id:
+                        trxn["account_id"] = account_id
+                        trxn["source_key"] = get_account_source_key(trxn["source_key"], account_id)
+                    if trxn_type:
+                        buffered[trxn_type].append(trxn)
+                    buffered["last_uid"] = max(buffered["last_uid"], int(uid))
+                    buffered["alerts"] += 1
+                if len(buffered["debit"]) + len(buffered["credit"]) >= batch_size or buffered["alerts"] >= checkpoint_every:
+                    await flush()
+            await flush()
+
+        tasks = [asyncio.create_task(fetch()), asyncio.create_task(write())]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            # chunks still queued after a failure are dropped, along with any error they raised.
+            while not parsed.empty():
+                if chunk := parsed.get_nowait():
+                    chunk.add_done_callback(lambda chunk: chunk.cancelled() or chunk.exception())
+        return counts
+    finally:
+        if archive:
+            archive.close()
+        await pool.close()
+        if executor:
+            executor.shutdown(cancel_futures=True)
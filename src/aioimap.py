@@ -0,0 +1,240 @@
+import re
+import ssl
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Sequence, Tuple
+from imap_tools import MailboxFetchError, MailboxFolderSelectError, MailboxFolderStatusError, MailboxLoginError
+from imap_tools.utils import check_command_status, chunked_crop, quote
+
+from src.fetcher import (
+    BODY_RANGE,
+    HEADER_FIELDS,
+    AlertMessage,
+    _body_section,
+    decode_html_part,
+    group_html_sections,
+    parse_fetch_response,
+    shard_uids,
+    to_alert_message
+)
+from src.logger import logger
+
+
+LITERAL_PATTERN = re.compile(rb"\{(\d+)\}\r\n$")
+IDLE_DONE_TIMEOUT = 30
+# the longest response line read, like imaplib's _MAXLINE. a SEARCH reply is one line with every uid on it.
+MAX_LINE = 1_000_000
+
+
+def _first_line(pieces: List[list]) -> bytes:
+    return pieces[0][0] if isinstance(pieces[0], tuple) else pieces[0]
+
+
+class AsyncIMAPClient:
+    """
+    A minimal asyncio IMAP client with just the commands ingestion needs.
+    Untagged responses come back in the same shape imaplib gives them, so the FETCH parsing
+    in src/fetcher.py is shared with the threaded engine.
+    """
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self._tag = 0
+
+    @classmethod
+    async def connect(cls, host: str, port: int = 993, use_ssl: bool = True) -> "AsyncIMAPClient":
+        reader, writer = await asyncio.open_connection(host, port, ssl=ssl.create_default_context() if use_ssl else None,
+                                                       limit=MAX_LINE)
+        client = cls(reader, writer)
+        await client._read_response()
+        return client
+
+    async def _read_response(self) -> List[list]:
+        """
+        Reads one untagged or tagged response with its literals, as imaplib would return it.
+        """
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("the imap server closed the connection.")
+        pieces = []
+        while match := LITERAL_PATTERN.search(line):
+            literal = await self.reader.readexactly(int(match.group(1)))
+            pieces.append((line[:-2], literal))
+            line = await self.reader.readline()
+        pieces.append(line.rstrip(b"\r\n"))
+        return pieces
+
+    async def command(self, *args: str) -> Tuple[str, List[list]]:
+        """
+        Sends a command and returns its status with the untagged responses that came before it.
+        """
+        self._tag += 1
+        tag = f"A{self._tag:05d}".encode()
+        self.writer.write(tag + b" " + " ".join(args).encode() + b"\r\n")
+        await self.writer.drain()
+
+        responses = []
+        while True:
+            pieces = await self._read_response()
+            first = _first_line(pieces)
+            if first.startswith(tag + b" "):
+                return first.split(b" ", 2)[1].decode().upper(), responses
+            if first.startswith(b"* "):
+                pieces[0] = (first[2:], pieces[0][1]) if isinstance(pieces[0], tuple) else first[2:]
+                responses.append(pieces)
+
+    async def login(self, username: str, password: str) -> None:
+        check_command_status(await self.command("LOGIN", quote(username), quote(password)), MailboxLoginError)
+
+    async def select(self, folder: str = "INBOX") -> None:
+        check_command_status(await self.command("SELECT", quote(folder)), MailboxFolderSelectError)
+
+    async def uidvalidity(self, folder: str = "INBOX") -> int:
+        result = await self.command("STATUS", quote(folder), "(UIDVALIDITY)")
+        check_command_status(result, MailboxFolderStatusError)
+        for pieces in result[1]:
+            match = re.search(rb"UIDVALIDITY (\d+)", pieces[0])
+            if match:
+                return int(match.group(1))
+        raise MailboxFolderStatusError(command_result=result, expected="UIDVALIDITY")
+
+    async def uid_search(self, criteria: str) -> List[str]:
+        result = await self.command("UID", "SEARCH", criteria)
+        check_command_status(result, MailboxFetchError)
+        return [uid.decode() for pieces in result[1] if pieces[0].startswith(b"SEARCH") for uid in pieces[0].split()[1:]]
+
+    async def uid_fetch(self, uids: Sequence[str], message_parts: str) -> Dict[str, Dict[str, Any]]:
+        result = await self.command("UID", "FETCH", ",".join(uids), message_parts)
+        check_command_status(result, MailboxFetchError)
+        fetches = [piece for pieces in result[1] if b" FETCH " in _first_line(pieces) for piece in pieces]
+        return parse_fetch_response(fetches)
+
+    async def idle(self, timeout: float) -> bool:
+        """
+        Waits in IDLE until the server reports new mail or timeout seconds pass, and returns
+        whether new mail arrived. Servers may drop a connection idling for more than 30 minutes,
+        so timeout should stay well under that.
+        """
+        self._tag += 1
+        tag = f"A{self._tag:05d}".encode()
+        self.writer.write(tag + b" IDLE\r\n")
+        await self.writer.drain()
+        while not (first := _first_line(await self._read_response())).startswith(b"+"):
+            if first.startswith(tag + b" "):
+                raise ConnectionError(f"the imap server refused IDLE: {first.decode(errors='replace')}")
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        arrived = False
+        while not arrived and (remaining := deadline - loop.time()) > 0:
+            try:
+                first = _first_line(await asyncio.wait_for(self._read_response(), remaining))
+            except asyncio.TimeoutError:
+                break
+            if first.startswith(b"* BYE"):
+                raise ConnectionError(f"the imap server ended the session: {first.decode(errors='replace')}")
+            arrived = first.startswith(b"* ") and first.endswith(b" EXISTS")
+
+        self.writer.write(b"DONE\r\n")
+        await self.writer.drain()
+        while not (first := _first_line(await asyncio.wait_for(self._read_response(), IDLE_DONE_TIMEOUT))).startswith(tag + b" "):
+            pass
+        return arrived
+
+    async def logout(self) -> None:
+        try:
+            await self.command("LOGOUT")
+        except Exception:
+            pass
+        self.writer.close()
+
+
+async def connect_mailbox(server: str, email: str, password: str, port: int = 993, use_ssl: bool = True,
+                          folder: str = "INBOX") -> AsyncIMAPClient:
+    """
+    Connects, logs in and selects the folder alerts are read from.
+    """
+    client = await AsyncIMAPClient.connect(server, port, use_ssl)
+    await client.login(email, password)
+    await client.select(folder)
+    return client
+
+
+async def fetch_alerts(client: AsyncIMAPClient, uids: Sequence[str], bulk: int = 100, body_range: int = BODY_RANGE) -> List[AlertMessage]:
+    """
+    fetch_alerts from src/fetcher.py over an AsyncIMAPClient.
+    """
+    messages = []
+    for uid_chunk in chunked_crop(sorted(uids, key=int), bulk):
+        heads = await client.uid_fetch(uid_chunk, f"(UID BODYSTRUCTURE {HEADER_FIELDS})")
+
+        bodies = {}
+        for section, section_uids in group_html_sections(heads).items():
+            for uid, attributes in (await client.uid_fetch(section_uids, f"(UID BODY.PEEK[{section}]<0.{body_range}>)")).items():
+                bodies[uid] = _body_section(attributes)
+
+        for uid in sorted(heads, key=int):
+            message, section = to_alert_message(uid, heads[uid], bodies.get(uid, b""), body_range)
+            if section:
+                full = (await client.uid_fetch([uid], f"(UID BODY.PEEK[{section}])")).get(uid, {})
+                message.html = decode_html_part(heads[uid], _body_section(full))
+            messages.append(message)
+    return messages
+
+
+class AsyncMailBoxPool:
+    """
+    MailBoxPool from src/fetcher.py for AsyncIMAPClients.
+    """
+    def __init__(self, connect: Callable[[], Awaitable[AsyncIMAPClient]], size: int, clients: Sequence[AsyncIMAPClient] = ()):
+        self.connect = connect
+        self.size = size
+        self._clients: asyncio.Queue = asyncio.Queue()
+        for idx in range(size):
+            self._clients.put_nowait(clients[idx] if idx < len(clients) else None)
+
+    async def fetch_shard(self, uids: List[str], retries: int = 3, backoff: float = 1.0) -> List[AlertMessage]:
+        """
+        Fetches one shard of uids over a pooled connection, backing off and reconnecting when it fails.
+        """
+        for attempt in range(retries + 1):
+            client = await self._clients.get()
+            try:
+                client = client or await self.connect()
+                messages = await fetch_alerts(client, uids, bulk=len(uids))
+                self._clients.put_nowait(client)
+                return messages
+            except Exception as e:
+                if client:
+                    client.writer.close()
+                self._clients.put_nowait(None)
+                if attempt == retries:
+                    raise
+                delay = backoff * 2 ** attempt
+                logger.info(f"failed to fetch uids {uids[0]}-{uids[-1]}: {e}. retrying in {delay}s.")
+                await asyncio.sleep(delay)
+        return []
+
+    async def fetch_sharded(self, uids: Sequence[str], shard_size: int = 200):
+        """
+        Fetches uids in shards over every connection at the same time, yielding each shard in order.
+        At most two shards per connection are in flight.
+        """
+        shards = shard_uids(uids, shard_size)
+        in_flight = self.size * 2
+        tasks = [asyncio.create_task(self.fetch_shard(shard)) for shard in shards[:in_flight]]
+        try:
+            for idx in range(len(shards)):
+                if idx + in_flight < len(shards):
+                    tasks.append(asyncio.create_task(self.fetch_shard(shards[idx + in_flight])))
+                yield await tasks[idx]
+                tasks[idx] = None
+        finally:
+            for task in tasks:
+                if task:
+                    task.cancel()
+
+    async def close(self) -> None:
+        while not self._clients.empty():
+            client = self._clients.get_nowait()
+            if client:
+                await client.logout()
@@ -0,0 +1,169 @@
+import os
+import mmap
+import zlib
+import struct
+import threading
+from pathlib import Path
+from datetime import datetime
+from urllib.parse import quote
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+from src.fetcher import AlertMessage
+from src.logger import logger
+
+
+SEGMENT_SIZE = 64 * 1024 * 1024
+INDEX_ENTRY = struct.Struct("<IQI") # uid, offset and length of an alert in its segment.
+
+
+def archive_root() -> Path:
+    """
+    Gets the folder alerts are archived in, ARCHIVE_DIR or ./archive.
+    """
+    return Path(os.getenv("ARCHIVE_DIR") or Path.cwd() / "archive")
+
+
+def archive_dir(email: str, folder: str, uidvalidity: int) -> Path:
+    """
+    Gets the archive of a mailbox folder. Uids are only unique within a UIDVALIDITY, so each one gets its own.
+    """
+    return archive_root() / quote(email, safe="@.") / quote(folder, safe="") / str(uidvalidity)
+
+
+def archive_dirs(email: str) -> List[Path]:
+    """
+    Gets every archive kept for an email address.
+    """
+    root = archive_root() / quote(email, safe="@.")
+    return sorted({index.parent for index in root.glob("*/*/*.idx")})
+
+
+def encode_alert(message: AlertMessage) -> bytes:
+    # none of the headers can contain a NUL, and the html goes last so it doesn't matter if it does.
+    fields = [message.uid, message.date.isoformat(), message.message_id, message.html]
+    return zlib.compress("\0".join(fields).encode())
+
+
+def decode_alert(data: bytes) -> AlertMessage:
+    uid, date, message_id, html = zlib.decompress(data).decode().split("\0", 3)
+    return AlertMessage(uid, datetime.fromisoformat(date), message_id, html)
+
+
+def read_index(index: Path) -> List[Tuple[int, int, int]]:
+    """
+    Reads the (uid, offset, length) entries of a segment. A partly written entry at the end is ignored.
+    """
+    data = index.read_bytes()
+    return list(INDEX_ENTRY.iter_unpack(data[:len(data) - len(data) % INDEX_ENTRY.size]))
+
+
+class ArchiveWriter:
+    """
+    Appends fetched alerts to the segments of an archive. Each segment is a file of zlib compressed
+    alerts that is only ever appended to, with an index of where each uid is next to it.
+    Alerts are written before their index entry, so an entry always points at a whole alert.
+    Writers that share an archive at the same time, like ka worker processes, each pass their own
+    name so they append to segments of their own.
+    """
+    def __init__(self, path: Path, segment_size: int = SEGMENT_SIZE, name: str | None = None):
+        path.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.segment_size = segment_size
+        self.name = name
+        self.uids: Set[int] = {uid for index in path.glob("*.idx") for uid, _, _ in read_index(index)}
+        self._lock = threading.Lock()
+
+        prefix = f"{name}-" if name else ""
+        numbers = [segment.stem[len(prefix):] for segment in path.glob(f"{prefix}*.seg")]
+        self._number = max((int(number) for number in numbers if number.isdigit()), default=1)
+        self._open_segment()
+
+    def _open_segment(self):
+        prefix = f"{self.name}-" if self.name else ""
+        segment = self.path / f"{prefix}{self._number:06d}.seg"
+        self._segment = open(segment, "ab")
+        self._index = open(segment.with_suffix(".idx"), "ab")
+        self._offset = self._segment.tell()
+
+    def _close_segment(self):
+        self._segment.close()
+        self._index.close()
+
+    def append(self, message: AlertMessage) -> None:
+        """
+        Archives an alert, unless its uid already is.
+        """
+        uid = int(message.uid)
+        if uid in self.uids:
+            return
+        data = encode_alert(message)
+        with self._lock:
+            if self._offset and self._offset + len(data) > self.segment_size:
+                self._close_segment()
+                self._number += 1
+                self._open_segment()
+            self._segment.write(data)
+            self._index.write(INDEX_ENTRY.pack(uid, self._offset, len(data)))
+            self._offset += len(data)
+            self.uids.add(uid)
+
+    def extend(self, messages: Iterable[AlertMessage]) -> None:
+        for message in messages:
+            self.append(message)
+
+    def archive(self, messages: Iterable[AlertMessage]) -> Iterator[AlertMessage]:
+        """
+        Archives alerts as they are fetched.
+        """
+        for message in messages:
+            self.append(message)
+            yield message
+
+    def flush(self) -> None:
+        """
+        Writes out the alerts archived so far. This is called before they are checkpointed.
+        """
+        with self._lock:
+            self._segment.flush()
+            self._index.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_segment()
+
+
+def read_archived_alerts(path: Path) -> Iterator[bytes]:
+    """
+    Reads every compressed alert in an archive, oldest uid first. The segments are memory mapped,
+    so only the alerts themselves are read from disk. Decompressing them with decode_alert is
+    left to the caller, so it can happen in the worker processes.
+    """
+    entries = []
+    for index in sorted(path.glob("*.idx")):
+        segment = index.with_suffix(".seg")
+        size = segment.stat().st_size
+        entries += [(uid, segment, offset, length) for uid, offset, length in read_index(index) if offset + length <= size]
+    entries.sort(key=lambda entry: entry[0])
+
+    files: Dict[Path, Tuple] = {}
+    try:
+        for _, segment, offset, length in entries:
+            if segment not in files:
+                f = open(segment, "rb")
+                files[segment] = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            yield files[segment][1][offset:offset + length]
+    finally:
+        for f, mapped in files.values():
+            mapped.close()
+            f.close()
+
+
+def read_archive(path: Path) -> Iterator[AlertMessage]:
+    """
+    Reads every alert in an archive, oldest uid first.
+    """
+    for data in read_archived_alerts(path):
+        try:
+            yield decode_alert(data)
+        except (zlib.error, ValueError) as e:
+            logger.info(f"skipping a damaged alert in {path}: {e}")
@@ -0,0 +1,97 @@
+import re
+import time
+from datetime import datetime
+from typing import Callable, Dict, Tuple
+
+from src.credit import CREDIT_KEY_PHRASES, CREDIT_RULES
+from src.debit import DEBIT_KEY_PHRASES, DEBIT_RULES
+from utils.utils import AMOUNT_PATTERN
+
+
+# what parsing a statement that doesn't look the way the rules expect can raise.
+PARSE_ERRORS = (ValueError, AttributeError, IndexError, TypeError)
+
+KEY_PHRASES = list(dict.fromkeys(
+    DEBIT_KEY_PHRASES + CREDIT_KEY_PHRASES + [phrase for phrase, _ in DEBIT_RULES + CREDIT_RULES]
+))
+
+# every key phrase and the amount in one alternation. none of the phrases is a prefix of
+# another, so at most one can start at any position.
+STATEMENT_PATTERN = re.compile(
+    "(" + "|".join(re.escape(phrase) for phrase in KEY_PHRASES) + ")|" + AMOUNT_PATTERN.pattern
+)
+
+
+def scan_statement(trxn_statement: str) -> Tuple[Dict[str, int], str | None]:
+    """
+    Scans a lowercased statement once. Returns where each key phrase first appears and the first amount.
+    After a phrase the scan resumes on the next character, so overlapping phrases are all found,
+    e.g. "just sent you" inside "you just sent you".
+    """
+    phrases: Dict[str, int] = {}
+    amount = None
+    pos = 0
+    search = STATEMENT_PATTERN.search
+    while match := search(trxn_statement, pos):
+        phrase = match.group(1)
+        if phrase:
+            phrases.setdefault(phrase, match.start())
+            pos = match.start() + 1
+        else:
+            if amount is None:
+                amount = match.group(2)
+            pos = match.end()
+    return phrases, amount
+
+
+def classify_statement(phrases: Dict[str, int]) -> str | None:
+    """
+    Classifies a scanned statement as debit or credit.
+    """
+    if any(phrase in phrases for phrase in DEBIT_KEY_PHRASES):
+        return "debit"
+    if any(phrase in phrases for phrase in CREDIT_KEY_PHRASES):
+        return "credit"
+    return None
+
+
+def parse_statement(trxn_statement: str, date_str: str, trxn_type: str, phrases: Dict[str, int], amount: str | None) -> Dict:
+    """
+    Builds the dict storage/apis.py writes from a scanned statement. Each rule's fields are
+    matched from where its key phrase was found instead of searching the statement again.
+    """
+    if amount is None:
+        raise ValueError("Amount not found.")
+
+    rules = DEBIT_RULES if trxn_type == "debit" else CREDIT_RULES
+    metadata = {}
+    for phrase, get_metadata in rules:
+        if phrase in phrases:
+            metadata.update(get_metadata(trxn_statement, phrases[phrase]))
+
+    return {
+        'date_of_transaction': datetime.fromisoformat(date_str),
+        'amount': float(amount.replace(',', '')),
+        f'{trxn_type}_metadata': metadata,
+    }
+
+
+def classify_and_parse_transaction(transaction: Dict[str, str],
+                                   record: Callable[[str, float], None] | None = None) -> Tuple[str | None, Dict | None]:
+    """
+    Classifies and parses a transaction with a single scan of its statement.
+    When record is passed, it gets how long the "classify" and "parse" stages took.
+    """
+    started = time.perf_counter()
+    trxn_statement = transaction['trxn_statement'].lower()
+    phrases, amount = scan_statement(trxn_statement)
+    trxn_type = classify_statement(phrases)
+    classified = time.perf_counter()
+    if record:
+        record("classify", classified - started)
+    if not trxn_type:
+        return None, None
+    trxn = parse_statement(trxn_statement, transaction['date'], trxn_type, phrases, amount)
+    if record:
+        record("parse", time.perf_counter() - classified)
+    return trxn_type, trxn
@@ -1,18 +1,44 @@
+import sys
+from src.profiling import hotspots, profile_path, slowest_imports, start_profiling, stop_profiling, time_by_category
+
+# started before anything else is imported, so ka --profile also shows how long importing takes.
+if "--profile" in sys.argv[1:]:
+    start_profiling()
+
+import os
+from pathlib import Path
 from sqlalchemy.exc import SQLAlchemyError
 import typer
-from sqlalchemy import select, literal_column, union_all
+from sqlalchemy import select
 from src.ai import generate_transaction_sql
 from src.logger import logger
-from storage.base import Session
-from storage.models import CreditTransaction, DebitTransaction
+from storage.apis import DEFAULT_BATCH_SIZE, DEFAULT_COPY_BATCH_SIZE, DEFAULT_COPY_THRESHOLD, page_statement
+from src.accounts import accounts_path, load_accounts
+from src.distributed import DEFAULT_RANGE_SIZE, DEFAULT_RECLAIM_AFTER, MAX_DELIVERIES
+from src.output import FORMATS, STREAM_BATCH_SIZE, print_tables, window_size, write_rows
+from src.metrics import read_runs, summarize_stages, summarize_throughput
+from src.scheduler import DEFAULT_QUANTUM
+from src.sync import DEFAULT_CHECKPOINT_EVERY
+from src.watch import DEFAULT_IDLE_TIMEOUT
+from storage.base import Session, engine as db_engine
+from storage.migrations import MIGRATIONS, migrate as migrate_db, pending_migrations
+from storage.partitions import COLD_SCHEMA, detach_partitions, partition_stats
+from storage.models import DEBIT_FLAGS, CreditTransaction, DebitTransaction, LedgerTransaction
+from storage.rollups import summarize
 from sqlalchemy import text
 from rich.console import Console
 from rich.table import Table
-from utils.utils import get_start_datetime_end_datetime
+from utils.utils import get_start_datetime_end_datetime, get_since_before_dates, encode_cursor, decode_cursor
 from utils.utils import convert_to_excel, send_email
 from src.main import (
+    coordinate_distributed_ingestion,
     create_tables,
+    ingest_accounts,
     parse_and_load_transactions_to_db,
+    parse_and_load_transactions_to_db_async,
+    reparse_archive,
+    run_worker,
+    watch_for_transactions,
 )
 
 
@@ -25,170 +51,340 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 
 app = typer.Typer(help="Kuda Assistant CLI - Simplified Transaction History in your Terminal")
 
+
+def report_profile(command: str | None, output: str | None, top: int) -> None:
+    """
+    Saves the profile of a command as a pstats file and prints its hotspots.
+    """
+    stats = stop_profiling()
+    if not stats:
+        return
+    path = output or profile_path(command)
+    stats.dump_stats(path)
+    console = Console(stderr=True)
+    
+    table = Table(title=f"Hotspots of ka {command or ''}".strip(), show_header=True, header_style="bold magenta")
+    table.add_column("Function", style="cyan", overflow="fold")
+    table.add_column("Calls", justify="right")
+    table.add_column("Own (s)", justify="right")
+    table.add_column("Cumulative (s)", justify="right")
+    for row in hotspots(stats, top):
+        table.add_row(row["function"], f"{row['calls']:,}", f"{row['own']:.4f}", f"{row['cumulative']:.4f}")
+    console.print(table)
+    
+    times = time_by_category(stats)
+    breakdown = Table(title="Where the time went", show_header=True, header_style="bold blue")
+    breakdown.add_column("Category", style="cyan")
+    breakdown.add_column("Seconds", justify="right")
+    breakdown.add_column("Share", justify="right", style="green")
+    for category, seconds in times.items():
+        share = seconds / times["total"] if times["total"] else 0.0
+        breakdown.add_row(category, f"{seconds:.4f}", f"{share:.1%}")
+    console.print(breakdown)
+    
+    imports = Table(title="Slowest imports", show_header=True, header_style="bold yellow")
+    imports.add_column("Module", style="cyan", overflow="fold")
+    imports.add_column("Cumulative (s)", justify="right")
+    for row in slowest_imports(stats, 10):
+        imports.add_row(row["module"], f"{row['cumulative']:.4f}")
+    console.print(imports)
+    console.print(f"[dim]profile saved to {path}. open it with python -m pstats {path} or snakeviz.[/dim]")
+
+
+@app.callback()
+def main(ctx: typer.Context, profile: bool = False, profile_output: str | None = None, profile_top: int = 20):
+    """
+    Pass --profile before a command (ka --profile get ...) to profile it. The profile is saved as a
+    pstats file (--profile-output) and its top --profile-top hotspots are printed, with the time spent
+    importing modules, in SQLAlchemy, the database driver and rich rendering.
+    """
+    if profile:
+        start_profiling()
+        ctx.call_on_close(lambda: report_profile(ctx.invoked_subcommand, profile_output, profile_top))
+
 @app.command()
-def init(n: int = 50):
+def init(n: int = 50, since: str | None = None, before: str | None = None, connections: int = 1,
+         workers: int = os.cpu_count() or 1, batch_size: int = DEFAULT_BATCH_SIZE,
+         copy_threshold: int = DEFAULT_COPY_THRESHOLD, copy_batch_size: int = DEFAULT_COPY_BATCH_SIZE,
+         engine: str = "threads", checkpoint_every: int | None = None, distributed: bool = False,
+         range_size: int = DEFAULT_RANGE_SIZE):
     """
-    Initialize the database and parse the first n transactions from your email.
+    Initialize the database and parse up to n new transactions from your email.
+    Pass --since and/or --before (YYYY-MM-DD) to only backfill that date window.
+    Pass --connections to fetch over several mailbox connections at once, --workers
+    to set how many processes parse the transactions (defaults to every core), and
+    --batch-size to set how many transactions are written to the db at once.
+    Backfills of at least --copy-threshold transactions are loaded with postgres COPY,
+    --copy-batch-size at a time.
+    Pass --engine=async to run fetching, parsing and db writes on one asyncio event loop.
+    Progress is committed with the transactions at least every --checkpoint-every alerts
+    (1000, or the COPY batch size when copying), so an interrupted init resumes from the last commit.
+    Pass --distributed to hand the emails to ka worker processes through redis instead,
+    --range-size at a time, and wait for them to finish.
     """
-    logger.info(f"parsing the first {n} transactions in your email.")
+    window = get_since_before_dates(since, before)
+    if not window:
+        return None
+    
+    logger.info(f"parsing up to {n} new transactions in your email.")
+    if engine not in ("threads", "async"):
+        logger.info(f"unknown engine {engine}, use threads or async.")
+        return None
+    
     create_tables()
-    parse_and_load_transactions_to_db(n)
+    if distributed:
+        coordinate_distributed_ingestion(n, *window, range_size=range_size)
+    elif engine == "async":
+        parse_and_load_transactions_to_db_async(n, *window, connections=connections, workers=workers, batch_size=batch_size,
+                                                checkpoint_every=checkpoint_every or DEFAULT_CHECKPOINT_EVERY)
+    else:
+        parse_and_load_transactions_to_db(n, *window, connections=connections, workers=workers, batch_size=batch_size,
+                                          copy_threshold=copy_threshold, copy_batch_size=copy_batch_size,
+                                          checkpoint_every=checkpoint_every)
     logger.info("done parsing information your transactions into the db. you can query for your transactions now!")
     
 @app.command()
-def get(start_date: str, end_date: str, n: int = 10, credit: bool = False, debit: bool = False):
+def sync_accounts(n: int | None = None, processes: int = os.cpu_count() or 1, quantum: int = DEFAULT_QUANTUM,
+                  accounts_file: str | None = None):
     """
-    Get transactions from the database.
+    Parse the new transactions of every mailbox in your accounts file (ACCOUNTS_FILE or ./accounts.json).
+    Mailboxes are ingested at once over --processes processes, taking turns --quantum emails at a time
+    so a big backlog doesn't hold up the rest. Pass --n to stop after n emails per mailbox.
     """
-    datetimes = get_start_datetime_end_datetime(start_date, end_date)
-    if not datetimes:
+    accounts = load_accounts(Path(accounts_file) if accounts_file else None)
+    if not accounts:
         return None
     
-    datetime_start_date, datetime_end_date = datetimes[0], datetimes[1]
+    create_tables()
+    ingest_accounts(accounts, n=n, processes=processes, quantum=quantum)
+    logger.info("done parsing the transactions of every account.")
+    
+@app.command()
+def worker(batch_size: int = DEFAULT_BATCH_SIZE, reclaim_after: int = DEFAULT_RECLAIM_AFTER,
+           max_deliveries: int = MAX_DELIVERIES):
+    """
+    Keep running and parse the emails ka init --distributed hands out. Start as many workers as you
+    like, on this machine or others sharing the same redis and database. Emails a worker took but
+    didn't finish within --reclaim-after seconds are retried by another one, up to --max-deliveries times.
+    Stop it with Ctrl+C.
+    """
+    create_tables()
+    run_worker(batch_size=batch_size, reclaim_after=reclaim_after, max_deliveries=max_deliveries)
+    logger.info("stopped the worker.")
+    
+@app.command()
+def migrate(status: bool = False):
+    """
+    Create any missing tables and apply the pending schema migrations, like new indexes.
+    ka init runs them too. Pass --status to list the migrations without applying any.
+    """
+    if status:
+        pending = {version for version, _, _ in pending_migrations(db_engine)}
+        console = Console()
+        table = Table(title="Schema Migrations", show_header=True, header_style="bold magenta")
+        table.add_column("Version", justify="right")
+        table.add_column("Migration", style="cyan")
+        table.add_column("Applied", justify="center")
+        for version, name, _ in MIGRATIONS:
+            table.add_row(str(version), name, "[yellow]pending[/yellow]" if version in pending else "yes")
+        console.print(table)
+        return
+    
+    applied = migrate_db(db_engine)
+    if applied:
+        logger.info(f"applied migrations {', '.join(map(str, applied))}.")
+    else:
+        logger.info("the database is up to date.")
+    
+@app.command()
+def partitions(detach_before: str | None = None, tablespace: str | None = None):
+    """
+    List the monthly partitions transactions are stored in on postgres, with their size.
+    Pass --detach-before YYYY-MM-DD to detach the months before it from the tables and move them
+    to the cold schema (and --tablespace, e.g. one on cheaper disks), out of every query.
+    """
+    if db_engine.dialect.name != "postgresql":
+        logger.info("transactions are only partitioned on postgres.")
+        return
+    if detach_before:
+        window = get_since_before_dates(None, detach_before)
+        if not window:
+            return
+        with db_engine.begin() as conn:
+            detached = [name for model in (CreditTransaction, DebitTransaction)
+                        for name in detach_partitions(conn, model.__tablename__, window[1], tablespace)]
+        logger.info(f"moved {len(detached)} partitions to the {COLD_SCHEMA} schema: {', '.join(detached) or 'none'}.")
+        return
+    
     console = Console()
+    table = Table(title="Transaction Partitions", show_header=True, header_style="bold magenta")
+    table.add_column("Partition", style="cyan")
+    table.add_column("Month")
+    table.add_column("Rows (estimate)", justify="right")
+    table.add_column("Size", justify="right", style="green")
+    with db_engine.connect() as conn:
+        for model in (CreditTransaction, DebitTransaction):
+            for partition in partition_stats(conn, model.__tablename__):
+                table.add_row(partition["name"], f"{partition['month']:%Y-%m}", f"{partition['rows']:,}",
+                              f"{partition['size'] / 1024 / 1024:,.1f} MB")
+    console.print(table)
     
-    if credit:
-        with Session() as session:
-            statement = (select(CreditTransaction)
-                .where(
-                    CreditTransaction.date_of_transaction >= datetime_start_date,
-                    CreditTransaction.date_of_transaction <= datetime_end_date
-                )
-                .order_by(CreditTransaction.date_of_transaction.asc())
-                .limit(n)
-            )
-            res = session.scalars(statement).all()
-            if not res:
-                console.print("[yellow]No credit transactions found in this date range.[/yellow]")
-                return res
+@app.command()
+def reparse(workers: int = os.cpu_count() or 1, batch_size: int = DEFAULT_BATCH_SIZE, account: str | None = None,
+            accounts_file: str | None = None):
+    """
+    Reparse every email archived by ka init with the current parsers and rebuild the
+    transactions parsed from them, without downloading anything.
+    Pass --account to reparse the emails of an account in your accounts file instead. When your
+    EMAIL is also in the accounts file, its emails are reparsed as that account's.
+    """
+    path = Path(accounts_file) if accounts_file else accounts_path()
+    target = None
+    if account or path.exists():
+        accounts = load_accounts(path)
+        if not accounts:
+            return None
+        if account:
+            target = next((entry for entry in accounts if entry["id"] == account), None)
+            if not target:
+                logger.info(f"there is no account {account} in {path}.")
+                return None
+        else:
+            target = next((entry for entry in accounts if entry["email"] == os.getenv("EMAIL")), None)
     
-            table = Table(title="Credit Transactions", show_header=True, header_style="bold magenta")
-            
-            table.add_column("Date", style="cyan", justify="left")
-            table.add_column("Amount", style="green", justify="right")
-            table.add_column("Sender", style="white")
-            table.add_column("Narration", style="dim", overflow="fold")
-            table.add_column("From Savings", style="dim", overflow="fold")
-            table.add_column("Savings Account", style="dim", overflow="fold")
-            table.add_column("Reversal", style="dim", overflow="fold")
+    create_tables()
+    reparse_archive(workers=workers, batch_size=batch_size, account=target)
+    logger.info("done reparsing your archived emails.")
     
-            for tx in res:
-                date_str = tx.date_of_transaction.strftime("%Y-%m-%d")
-                amount_str = f"₦{float(tx.amount)}0" 
-                sender_str = tx.sender or "N/A"
-                narration_str = tx.narration or "N/A"
-                is_from_savings = "True" if tx.from_savings else "False"
-                savings_account = tx.savings_account or "N/A"
-                is_reversal = "True" if tx.reversal else "False"
-                
-                table.add_row(date_str, amount_str, sender_str, narration_str, is_from_savings, savings_account, is_reversal)
+@app.command()
+def watch(idle_timeout: int = DEFAULT_IDLE_TIMEOUT, batch_size: int = DEFAULT_BATCH_SIZE):
+    """
+    Keep running and add new transactions to the database within seconds of their email arriving.
+    One mailbox connection waits in IMAP IDLE and reconnects on its own if it drops.
+    Stop it with Ctrl+C.
+    """
+    create_tables()
+    watch_for_transactions(idle_timeout=idle_timeout, batch_size=batch_size)
+    logger.info("stopped watching for new transactions.")
     
-            console.print(table)
-            print("\n")
-            return res
+@app.command()
+def stats(runs: int = 10):
+    """
+    Show how long each ingestion stage took over the last n runs of ka init (p50, p95 and p99),
+    and how many transactions a second each run processed.
+    """
+    samples = read_runs(runs)
+    console = Console()
+    if not samples:
+        console.print("[yellow]No ingestion metrics found. Run ka init first.[/yellow]")
+        return None
     
-    if debit:
-        with Session() as session:
-            statement = (select(DebitTransaction)
-                .where(
-                    DebitTransaction.date_of_transaction >= start_date,
-                    DebitTransaction.date_of_transaction <= end_date
-                )
-                .order_by(DebitTransaction.date_of_transaction.asc())
-                .limit(n)
-            )
-            res = session.scalars(statement).all()
-            
-            table = Table(title="Raw Debit Transactions", show_header=True, header_style="bold red")
-                    
-            table.add_column("Date", style="cyan")
-            table.add_column("Amount", style="red", justify="right")
-            table.add_column("Receiver", style="white", overflow="fold")
-            table.add_column("Narration", style="dim", overflow="fold")
-            table.add_column("Airtime", justify="center")
-            table.add_column("Phone Number", style="white")
-            table.add_column("Network", style="white")
-            table.add_column("Online Payment", justify="center")
-            table.add_column("Service (Online)", overflow="fold")
-            table.add_column("POS", justify="center")
-            table.add_column("Savings", justify="center")
+    table = Table(title=f"Ingestion Stages (last {len(samples)} runs)", show_header=True, header_style="bold magenta")
+    table.add_column("Stage", style="cyan")
+    table.add_column("Per", style="dim")
+    table.add_column("Count", justify="right")
+    for column in ("Mean", "p50", "p95", "p99"):
+        table.add_column(column, justify="right")
     
-            for tx in res:
-                date_str = tx.date_of_transaction.strftime("%Y-%m-%d") if tx.date_of_transaction else "N/A"
-                amount_str = f"{float(tx.amount)}0" if tx.amount else "0.00"
-                narration_str = tx.narration or "N/A"
-                
-                receiver_str = tx.receiver or "N/A"
-                phone_str = tx.phone_number or "N/A"
-                network_str = tx.network or "N/A"
-                service_str = tx.service_for_online_payment or "N/A"
-                
-                airtime_str = "True" if tx.airtime else "N/A"
-                online_str = "True" if tx.online_payment else "N/A"
-                pos_str = "True" if tx.point_of_sale else "N/A"
-                savings_str = "True" if tx.savings else "N/A"
-                
-                table.add_row(
-                    date_str, 
-                    amount_str, 
-                    receiver_str, 
-                    narration_str,
-                    airtime_str, 
-                    phone_str, 
-                    network_str, 
-                    online_str, 
-                    service_str, 
-                    pos_str, 
-                    savings_str
-                )
+    format_seconds = lambda seconds: "-" if seconds is None else f"{seconds * 1000:,.3f} ms"
+    for row in summarize_stages(samples):
+        table.add_row(row["stage"], row["per"], f"{row['count']:,}", format_seconds(row["mean"]),
+                      format_seconds(row["p50"]), format_seconds(row["p95"]), format_seconds(row["p99"]))
+    console.print(table)
     
-            console.print(table)
-            return res
+    runs_table = Table(title="Runs", show_header=True, header_style="bold blue")
+    runs_table.add_column("Started", style="cyan")
+    runs_table.add_column("Transactions", justify="right")
+    runs_table.add_column("Duration", justify="right")
+    runs_table.add_column("Transactions/s", justify="right", style="green")
+    for run in summarize_throughput(samples):
+        runs_table.add_row(run["started"].strftime("%Y-%m-%d %H:%M:%S"), f"{run['processed']:,}",
+                           f"{run['duration']:,.2f} s", f"{run['rate']:,.1f}")
+    console.print(runs_table)
+    return samples
     
-    with Session() as session:
-        s1 = select(
-            CreditTransaction.id, 
-            CreditTransaction.amount, 
-            CreditTransaction.date_of_transaction,
-            literal_column("'credit'").label("type")
-        ).where(CreditTransaction.date_of_transaction.between(start_date, end_date))
+def print_next_page(console: Console, last, count: int, n: int, stopped: bool = False) -> None:
+    """
+    Prints how to get the rows after last, when the page was full or was stopped before the end.
+    """
+    if last is not None and (count == n or stopped):
+        console.print(f"[dim]next page: --after {encode_cursor(last.date_of_transaction, last.id)}[/dim]")
 
-        s2 = select(
-            DebitTransaction.id, 
-            DebitTransaction.amount, 
-            DebitTransaction.date_of_transaction,
-            literal_column("'debit'").label("type")
-        ).where(DebitTransaction.date_of_transaction.between(start_date, end_date))
 
-        statement = union_all(s1, s2).order_by(literal_column("date_of_transaction").asc()).limit(n)
-        res = session.execute(statement).all()
-        
-        if not res:
-            console.print("[yellow]No transactions found in this date range.[/yellow]")
-            return res
+@app.command()
+def get(start_date: str, end_date: str, n: int = 10, credit: bool = False, debit: bool = False,
+        after: str | None = None, format: str = "table", page_size: int | None = None):
+    """
+    Get transactions from the database, n at a time. When a page is full, the --after to pass
+    for the next one is printed below it. Rows are streamed from the database as they are read:
+    pass --format jsonl, csv or tsv to write them to stdout for other tools, or page through the
+    table --page-size rows at a time (the height of the terminal by default).
+    """
+    if format not in FORMATS:
+        logger.info(f"{format} is not one of {', '.join(FORMATS)}.")
+        return None
+    datetimes = get_start_datetime_end_datetime(start_date, end_date)
+    if not datetimes:
+        return None
     
-        table = Table(title="Combined Bank Statement", show_header=True, header_style="bold blue")
-        
-        table.add_column("Date", style="cyan", justify="left")
-        table.add_column("Type", justify="center")
-        table.add_column("Amount", justify="right")
-        table.add_column("Transaction ID", style="dim", overflow="fold")
+    datetime_start_date, datetime_end_date = datetimes[0], datetimes[1]
+    cursor = None
+    if after:
+        cursor = decode_cursor(after)
+        if not cursor:
+            return None
+    # the credit and debit tables, or the transactions ledger holding both, kept by triggers on them.
+    model = CreditTransaction if credit else DebitTransaction if debit else LedgerTransaction
+    statement = page_statement(model, datetime_start_date, datetime_end_date, n, cursor)
     
-        for row in res:
-            date_str = row.date_of_transaction.strftime("%Y-%m-%d %H:%M") if row.date_of_transaction else "N/A"
-            id_str = str(row.id)
+    with Session() as session:
+        rows = session.scalars(statement, execution_options={"yield_per": STREAM_BATCH_SIZE})
+        if format != "table":
+            # stdout only gets the rows, so they can be piped.
+            count, last = write_rows(model, rows, format, sys.stdout)
+            print_next_page(Console(stderr=True), last, count, n)
+            return count
         
-            if row.type == 'credit':
-                type_str = "[bold green]CREDIT[/bold green]"
-                amount_str = f"[green]+₦{float(row.amount):,.2f}[/green]"
-            else:
-                type_str = "[bold red]DEBIT[/bold red]"
-                amount_str = f"[red]-₦{float(row.amount):,.2f}[/red]"
-                
-            table.add_row(date_str, type_str, amount_str, id_str)
-        console.print(table)
-        return res
+        console = Console()
+        windows = rows.partitions(page_size or window_size(console))
+        count, last, stopped = print_tables(console, model, windows, console.is_terminal)
+        if not count:
+            console.print("[yellow]No transactions found in this date range.[/yellow]")
+        print_next_page(console, last, count, n, stopped)
+        return count
         
+@app.command()
+def summary(start_date: str, end_date: str):
+    """
+    Get how much came in and went out from start_date to end_date, both included, and how much
+    of it went on each kind of debit. It is read from the daily and monthly totals kept as
+    transactions are written, so it takes as long for a year as for a day.
+    """
+    datetimes = get_start_datetime_end_datetime(start_date, end_date)
+    if not datetimes:
+        return None
+    start, end = datetimes[0].date(), datetimes[1].date()
+    if start > end:
+        logger.info(f"{start_date} has to be before {end_date}.")
+        return None
+    
+    with Session() as session:
+        totals = summarize(session, start, end)
+    
+    console = Console()
+    table = Table(title=f"Summary {start:%Y-%m-%d} to {end:%Y-%m-%d}", show_header=True, header_style="bold blue")
+    table.add_column("", style="cyan")
+    table.add_column("Amount", justify="right")
+    table.add_column("Transactions", justify="right", style="dim")
+    table.add_row("Inflow", f"[green]+₦{totals['inflow']:,.2f}[/green]", f"{totals['credits']:,}")
+    table.add_row("Outflow", f"[red]-₦{totals['outflow']:,.2f}[/red]", f"{totals['debits']:,}")
+    net = totals["inflow"] - totals["outflow"]
+    table.add_row("Net", f"{'-' if net < 0 else '+'}₦{abs(net):,.2f}", "")
+    for flag in DEBIT_FLAGS:
+        table.add_row(f"  {flag.replace('_', ' ').title()}", f"₦{totals[f'{flag}_outflow']:,.2f}", "")
+    console.print(table)
+    return totals
+    
 @app.command()
 def export(start_date: str, end_date: str, email: str, credit: bool = False, debit: bool = False):
     """
@@ -231,8 +427,6 @@ def export(start_date: str, end_date: str, email: str, credit: bool = False, deb
 
         convert_to_excel(trxn_list, "credit", start_date, end_date)
         send_email(email, "credit", start_date, end_date)
-        convert_to_excel.delay(trxn_list, "credit", start_date, end_date)
-        send_email.delay(email, "credit", start_date, end_date)
         return "Your transaction excel sheet is currently being processed and will be sent to you shortly!"
      
         
@@ -1,10 +1,19 @@
 import re
 
+from utils.utils import match_from
+
+TRANSFER_PHRASE = "just sent you"
+REVERSAL_PHRASE = "so we've reversed"
+FROM_SAVINGS_PHRASE = "you took out"
+
+SAVINGS_POCKET_PATTERN = re.compile(r"you took out ₦?([\d,.]+) from your (.*?) savings", re.IGNORECASE)
+
+
 def is_credit_by_transfer(transaction_information):
     """
     Checks to see if the credit is by transfer/alert.
     """
-    key_phrase = "just sent you"
+    key_phrase = TRANSFER_PHRASE
 
     if key_phrase not in transaction_information:
         return False
@@ -16,17 +25,17 @@ def is_credit_by_reversal(trxn_statement):
     """
     Checks to see if credits is by reversal.
     """
-    if "so we've reversed" in trxn_statement:
+    if REVERSAL_PHRASE in trxn_statement:
         return True
-    return False 
+    return False
 
 def is_credit_by_removal_from_savings(trxn_statement) -> bool:
-    if "you took out" in trxn_statement:
+    if FROM_SAVINGS_PHRASE in trxn_statement:
         return True
     return False
 
-def get_savings_pocket(trxn_statement) -> str | None:
-    match = re.search(r"you took out ₦?([\d,.]+) from your (.*?) savings", trxn_statement, re.IGNORECASE)
+def get_savings_pocket(trxn_statement, pos=None) -> str | None:
+    match = match_from(SAVINGS_POCKET_PATTERN, trxn_statement, pos)
     if not match:
         return None
     return match.group(2)
@@ -41,3 +50,30 @@ def get_credit_by_alert_info(transaction_information):
     }
 
     return res
+
+
+def get_reversal_metadata(trxn_statement, pos=None):
+    return {"reversal": True}
+
+def get_from_savings_metadata(trxn_statement, pos=None):
+    savings_account = get_savings_pocket(trxn_statement, pos)
+    return {"from_savings": True, "savings_account": savings_account if savings_account else ""}
+
+def get_transfer_metadata(trxn_statement, pos=None):
+    info = get_credit_by_alert_info(trxn_statement)
+    return {"transfer": True, "sender": info["sender"], "narration": info["description"]}
+
+
+# a statement containing any of these, and none of the debit ones, is a credit.
+CREDIT_KEY_PHRASES = [
+    "so we've reversed",
+    "just sent you",
+    "you took out",
+]
+
+# (key phrase, metadata getter) for every kind of credit. each matching rule adds its metadata.
+CREDIT_RULES = [
+    (REVERSAL_PHRASE, get_reversal_metadata),
+    (FROM_SAVINGS_PHRASE, get_from_savings_metadata),
+    (TRANSFER_PHRASE, get_transfer_metadata),
+]
@@ -1,10 +1,24 @@
 import re
 
+from utils.utils import match_from
+
+AIRTIME_PHRASE = "you just recharged"
+TRANSFER_PHRASE = "you just sent"
+CARD_ONLINE_PHRASE = "with your kuda card"
+CARD_POS_PHRASE = "you used your card on a pos"
+SPEND_AND_SAVE_PHRASE = "we moved"
+
+AIRTIME_PATTERN = re.compile(r"you just recharged (.*?)(?:\s+data|\s+airtime)?\s+(\d+) - .*? with ₦?([\d,.]+)", re.IGNORECASE)
+TRANSFER_PATTERN = re.compile(r"you just sent ₦?([\d,.]+) to (.*?)\s*-\s*(.*?)\s*\.\s*love", re.IGNORECASE)
+CARD_ONLINE_PATTERN = re.compile(r"you paid ₦?([\d,.]+) with your kuda card on (.*?)\.", re.IGNORECASE)
+SAVINGS_POCKET_PATTERN = re.compile(r"we moved ₦?([\d,.]+) from your spend account to (.*?) savings", re.IGNORECASE)
+
+
 def is_debit_by_airtime_recharge(trxn_statement):
     """
     Checks to see if debit is by airtime recharge.
     """
-    if "you just recharged" in trxn_statement:
+    if AIRTIME_PHRASE in trxn_statement:
         return True
     return False
 
@@ -12,7 +26,7 @@ def is_debit_by_transfer(trxn_statement):
     """
     Checks to see if debit is by transfer.
     """
-    if "you just sent" in trxn_statement:
+    if TRANSFER_PHRASE in trxn_statement:
         return True
     return False
 
@@ -21,14 +35,14 @@ def is_debit_by_card_online(trxn_statement):
     """
     Checks to see if debit is by use of card online
     """
-    if "with your kuda card" in trxn_statement:
+    if CARD_ONLINE_PHRASE in trxn_statement:
         return True
     return False
 
-def get_service_for_online_card_payment(trxn_statement) -> str | None:
-    pattern = r"you paid ₦?([\d,.]+) with your kuda card on (.*?)\."
-    match = re.search(pattern, trxn_statement, re.IGNORECASE)
-    
+def get_service_for_online_card_payment(trxn_statement, pos=None) -> str | None:
+    # the phrase sits in the middle of the pattern, so it can't be matched from pos.
+    match = CARD_ONLINE_PATTERN.search(trxn_statement)
+
     if not match:
         return None
     return match.group(2)
@@ -37,29 +51,27 @@ def is_debit_by_card_pos(trxn_statement):
     """
     Checks to see if debit is by card at POS or ATM.
     """
-    if "you used your card on a pos" in trxn_statement:
+    if CARD_POS_PHRASE in trxn_statement:
         return True
     return False
 
 def is_debit_by_spend_and_save(trxn_statement):
-    if "we moved" in trxn_statement:
+    if SPEND_AND_SAVE_PHRASE in trxn_statement:
         return True
     return False
 
-def get_savings_pocket(trxn_statement) -> str | None:
-    pattern = r"we moved ₦?([\d,.]+) from your spend account to (.*?) savings"
-    match = re.search(pattern, trxn_statement, re.IGNORECASE)
-    
+def get_savings_pocket(trxn_statement, pos=None) -> str | None:
+    match = match_from(SAVINGS_POCKET_PATTERN, trxn_statement, pos)
+
     if not match:
         return None
     return match.group(2)
-    
-def get_narration_and_receiver(trxn_statement):
+
+def get_narration_and_receiver(trxn_statement, pos=None):
     """
     Gets the information of a debit (by transfer)
     """
-    pattern = r"you just sent ₦?([\d,.]+) to (.*?)\s*-\s*(.*?)\s*\.\s*love"
-    match = re.search(pattern, trxn_statement, re.IGNORECASE)
+    match = match_from(TRANSFER_PATTERN, trxn_statement, pos)
     if not match:
         return None
     return {
@@ -68,17 +80,53 @@ def get_narration_and_receiver(trxn_statement):
     }
 
 
-def get_debit_by_airtime_info(trxn_statement):
+def get_debit_by_airtime_info(trxn_statement, pos=None):
     """
     Gets the information of debit (by airtime recharge)
     """
-    pattern = r"you just recharged (.*?)(?:\s+data|\s+airtime)?\s+(\d+) - .*? with ₦?([\d,.]+)"
-    match = re.search(pattern, trxn_statement, re.IGNORECASE)
-    
+    match = match_from(AIRTIME_PATTERN, trxn_statement, pos)
+
     if not match:
         return None
     return {
         "network": match.group(1),
         "phone_number": match.group(2)
     }
-        
\ No newline at end of file
+
+
+def get_airtime_metadata(trxn_statement, pos=None):
+    info = get_debit_by_airtime_info(trxn_statement, pos)
+    return {"airtime": True, "network": info["network"], "phone_number": info["phone_number"]}
+
+def get_card_online_metadata(trxn_statement, pos=None):
+    return {"online_payment": True, "service_for_online_payment": get_service_for_online_card_payment(trxn_statement, pos)}
+
+def get_card_pos_metadata(trxn_statement, pos=None):
+    return {"point_of_sale": True}
+
+def get_spend_and_save_metadata(trxn_statement, pos=None):
+    return {"savings": True}
+
+def get_transfer_metadata(trxn_statement, pos=None):
+    info = get_narration_and_receiver(trxn_statement, pos)
+    return {"transfer": True, "receiver": info["receiver"], "narration": info["description"]}
+
+
+# a statement containing any of these is a debit. they are checked before the credit ones.
+DEBIT_KEY_PHRASES = [
+    "you just sent",
+    "you just recharged",
+    "you used your card online",
+    "you used your kuda card on a pos",
+    "you saved some money",
+    "we moved",
+]
+
+# (key phrase, metadata getter) for every kind of debit. each matching rule adds its metadata.
+DEBIT_RULES = [
+    (AIRTIME_PHRASE, get_airtime_metadata),
+    (CARD_ONLINE_PHRASE, get_card_online_metadata),
+    (CARD_POS_PHRASE, get_card_pos_metadata),
+    (SPEND_AND_SAVE_PHRASE, get_spend_and_save_metadata),
+    (TRANSFER_PHRASE, get_transfer_metadata),
+]
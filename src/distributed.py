@@ -0,0 +1,325 @@
+import os
+import uuid
+import socket
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Tuple
+from imap_tools import MailboxLoginError
+from redis.exceptions import ConnectionError as RedisConnectionError, ResponseError
+
+from src.aioimap import AsyncIMAPClient, fetch_alerts
+from src.archive import ArchiveWriter, archive_dir
+from src.logger import logger
+from src.sync import (
+    get_sync_state_async,
+    new_messages_criteria,
+    resolve_last_uid,
+    select_new_uids,
+    sync_checkpoint,
+    sync_state_key
+)
+from storage.apis import DEFAULT_BATCH_SIZE, get_checkpoint_async, write_trxns_async
+
+
+GROUP = "workers"
+DEFAULT_RANGE_SIZE = 500
+# a range a worker hasn't acknowledged this many seconds after it was delivered is taken to have
+# been lost with the worker, and is handed to another one. It has to be well over the time one range takes.
+DEFAULT_RECLAIM_AFTER = 300
+# a range delivered this many times without being acknowledged is moved to the dead letter stream.
+MAX_DELIVERIES = 5
+MAX_BACKOFF = 60
+JOB_TTL = 7 * 24 * 3600
+COUNTS = ("processed", "debit", "credit", "invalid")
+
+
+class StaleRange(Exception):
+    """
+    A range published under another UIDVALIDITY than the folder has now, so its uids point at other emails.
+    """
+
+
+def stream_key(email: str) -> str:
+    """
+    Gets the stream the uid ranges of a mailbox are published to. Each mailbox has its own,
+    so every worker reading one can log in to it.
+    """
+    return f"ingest:{email}"
+
+
+def dead_letter_key(stream: str) -> str:
+    return f"{stream}:dead"
+
+
+def job_key(job: str) -> str:
+    return f"ingest:job:{job}"
+
+
+def failed_key(job: str) -> str:
+    return f"ingest:job:{job}:failed"
+
+
+def consumer_name() -> str:
+    """
+    Names a worker after its host and process, so the ranges it holds can be told apart in XPENDING.
+    """
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _str(value) -> str:
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+def _decode(fields: Dict) -> Dict[str, str]:
+    return {_str(key): _str(value) for key, value in fields.items()}
+
+
+def _entry_id(entry_id) -> Tuple[int, int]:
+    ms, _, seq = _str(entry_id).partition("-")
+    return int(ms), int(seq or 0)
+
+
+def split_ranges(uids: List[str], range_size: int) -> List[List[str]]:
+    return [uids[i:i + range_size] for i in range(0, len(uids), range_size)]
+
+
+async def ensure_group(r, stream: str) -> None:
+    """
+    Creates the consumer group of a stream, and the stream itself, unless they exist.
+    """
+    try:
+        await r.xgroup_create(stream, GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+async def publish(r, email: str, folder: str, uidvalidity: int, uids: List[str],
+                  range_size: int = DEFAULT_RANGE_SIZE) -> Tuple[str, List[bytes]]:
+    """
+    Publishes uids to the stream of their mailbox in ranges of range_size, as one job.
+    Gets the job id and the stream ids of its ranges.
+    """
+    stream = stream_key(email)
+    await ensure_group(r, stream)
+    job = uuid.uuid4().hex[:12]
+    ranges = split_ranges(uids, range_size)
+    await r.hset(job_key(job), mapping={"ranges": len(ranges), "done": 0, **{key: 0 for key in COUNTS}})
+    await r.expire(job_key(job), JOB_TTL)
+    async with r.pipeline(transaction=False) as pipe:
+        for uid_range in ranges:
+            pipe.xadd(stream, {"job": job, "folder": folder, "uidvalidity": uidvalidity, "uids": ",".join(uid_range)})
+        entry_ids = await pipe.execute()
+    return job, entry_ids
+
+
+async def job_progress(r, job: str) -> Dict[str, int]:
+    progress = {key: int(value) for key, value in _decode(await r.hgetall(job_key(job))).items()}
+    progress["failed"] = await r.scard(failed_key(job))
+    return progress
+
+
+async def job_finished(r, stream: str, entry_ids: List) -> bool:
+    """
+    Tells whether every range of a job was acknowledged: the group has read past its last range
+    and none of its ranges is still pending.
+    """
+    group = next(group for group in await r.xinfo_groups(stream) if _str(group["name"]) == GROUP)
+    if _entry_id(group["last-delivered-id"]) < _entry_id(entry_ids[-1]):
+        return False
+    return not await r.xpending_range(stream, GROUP, min=entry_ids[0], max=entry_ids[-1], count=1)
+
+
+async def coordinate(connect: Callable[[], Awaitable[AsyncIMAPClient]], r, session_maker, email: str,
+                     n: int | None = None, since=None, before=None, range_size: int = DEFAULT_RANGE_SIZE,
+                     folder: str = "INBOX", poll: float = 1.0) -> Dict[str, int]:
+    """
+    Publishes the new uids of a mailbox to its stream in ranges of range_size, waits for ka worker
+    processes to ingest every range and then moves the checkpoint past them. A range that ended up
+    in the dead letter stream holds the checkpoint back to just before it, so the next run publishes it again.
+    """
+    client = await connect()
+    try:
+        uidvalidity = await client.uidvalidity(folder)
+        state = (await get_checkpoint_async(session_maker, sync_state_key(email, folder, since, before))
+                 or await get_sync_state_async(r, email, folder, since, before))
+        last_uid = resolve_last_uid(state, uidvalidity)
+        uids = select_new_uids(await client.uid_search(str(new_messages_criteria(last_uid, since, before))), last_uid, n)
+    finally:
+        await client.logout()
+
+    counts = {**{key: 0 for key in COUNTS}, "failed": 0, "last_uid": last_uid}
+    if not uids:
+        return counts
+
+    stream = stream_key(email)
+    job, entry_ids = await publish(r, email, folder, uidvalidity, uids, range_size)
+    logger.info(f"published {len(entry_ids)} ranges of uids {uids[0]}-{uids[-1]} to {stream} as job {job}.")
+    reported = -1
+    while not await job_finished(r, stream, entry_ids):
+        progress = await job_progress(r, job)
+        if progress["done"] + progress["failed"] != reported:
+            reported = progress["done"] + progress["failed"]
+            logger.info(f"{reported} of {len(entry_ids)} ranges of job {job} are done.")
+        await asyncio.sleep(poll)
+
+    progress = await job_progress(r, job)
+    counts.update({key: progress[key] for key in COUNTS}, failed=progress["failed"])
+    failed = sorted(int(uid) for uid in await r.smembers(failed_key(job)))
+    new_last_uid = failed[0] - 1 if failed else int(uids[-1])
+    if failed:
+        logger.info(f"{len(failed)} ranges of job {job} failed, see {dead_letter_key(stream)}. "
+                    f"they are published again on the next run.")
+    if new_last_uid > last_uid:
+        await write_trxns_async(session_maker, [], [],
+                                checkpoint=sync_checkpoint(email, folder, uidvalidity, new_last_uid, since, before))
+        counts["last_uid"] = new_last_uid
+    await r.xdel(stream, *entry_ids)
+    return counts
+
+
+async def dead_letter(r, stream: str, entry_id, fields: Dict[str, str], reason: str) -> None:
+    """
+    Moves a range that can't be ingested to the dead letter stream of its mailbox and acknowledges it.
+    It is recorded as failed before it is acknowledged, so its job never looks finished without it.
+    """
+    logger.info(f"giving up on uids {fields['uids'].split(',')[0]}-{fields['uids'].split(',')[-1]}: {reason}")
+    await r.xadd(dead_letter_key(stream), {**fields, "entry": _str(entry_id), "reason": reason})
+    await r.sadd(failed_key(fields["job"]), fields["uids"].split(",")[0])
+    await r.expire(failed_key(fields["job"]), JOB_TTL)
+    await r.xack(stream, GROUP, entry_id)
+
+
+async def claim_stale(r, stream: str, consumer: str, reclaim_after: float = DEFAULT_RECLAIM_AFTER,
+                      max_deliveries: int = MAX_DELIVERIES, count: int = 10) -> List[Tuple]:
+    """
+    Claims ranges delivered more than reclaim_after seconds ago that are still not acknowledged,
+    because their worker crashed or failed on them. Ranges delivered max_deliveries times already
+    are dead lettered instead.
+    """
+    idle = int(reclaim_after * 1000)
+    retry = []
+    for entry in await r.xpending_range(stream, GROUP, min="-", max="+", count=count, idle=idle):
+        if entry["times_delivered"] < max_deliveries:
+            retry.append(entry["message_id"])
+            continue
+        for entry_id, fields in await r.xrange(stream, entry["message_id"], entry["message_id"]) or [(entry["message_id"], None)]:
+            if fields:
+                await dead_letter(r, stream, entry_id, _decode(fields), f"delivered {entry['times_delivered']} times")
+            else:
+                await r.xack(stream, GROUP, entry_id)
+    return await r.xclaim(stream, GROUP, consumer, idle, retry) if retry else []
+
+
+async def ingest_range(client: AsyncIMAPClient, session_maker, email: str, fields: Dict[str, str],
+                       archives: Dict[Tuple[str, int], ArchiveWriter], to_raw: Callable, process_chunk: Callable,
+                       batch_size: int = DEFAULT_BATCH_SIZE, name: str | None = None) -> Dict[str, int]:
+    """
+    Fetches, archives, parses and writes one range of uids. Rows are upserted by their source key,
+    so a range ingested again after a worker crashed doesn't duplicate anything. Raises if its rows
+    could not be written, so the range isn't acknowledged.
+    """
+    folder, uidvalidity = fields["folder"], int(fields["uidvalidity"])
+    current = await client.uidvalidity(folder)
+    if current != uidvalidity:
+        raise StaleRange(f"{folder} has UIDVALIDITY {current} now, not {uidvalidity}")
+
+    loop = asyncio.get_running_loop()
+    messages = await fetch_alerts(client, fields["uids"].split(","))
+    if (folder, uidvalidity) not in archives:
+        archives[folder, uidvalidity] = ArchiveWriter(archive_dir(email, folder, uidvalidity), name=name)
+    archive = archives[folder, uidvalidity]
+    await loop.run_in_executor(None, archive.extend, messages)
+    archive.flush()
+
+    counts = {key: 0 for key in COUNTS}
+    buffered = {"debit": [], "credit": []}
+    for _, trxn_type, trxn in await loop.run_in_executor(None, process_chunk, [to_raw(message) for message in messages]):
+        counts["processed"] += 1
+        counts[trxn_type or "invalid"] += 1
+        if trxn_type:
+            buffered[trxn_type].append(trxn)
+    await write_trxns_async(session_maker, buffered["debit"], buffered["credit"], batch_size)
+    return counts
+
+
+async def _sleep_unless_stopped(stop: asyncio.Event, delay: float) -> None:
+    try:
+        await asyncio.wait_for(stop.wait(), delay)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def work(connect: Callable[[], Awaitable[AsyncIMAPClient]], r, session_maker, email: str,
+               to_raw: Callable, process_chunk: Callable, batch_size: int = DEFAULT_BATCH_SIZE,
+               consumer: str | None = None, reclaim_after: float = DEFAULT_RECLAIM_AFTER,
+               max_deliveries: int = MAX_DELIVERIES, block: float = 2.0, stop: asyncio.Event | None = None) -> Dict[str, int]:
+    """
+    Ingests the ranges published to the stream of a mailbox, one at a time, until stop is set.
+    Any number of workers can read one stream, on one host or several: the consumer group hands each
+    range to one of them, and a range is only acknowledged once its rows are committed. A range that
+    fails is left pending and retried by whichever worker reclaims it after reclaim_after seconds.
+    """
+    stop = stop or asyncio.Event()
+    consumer = consumer or consumer_name()
+    stream = stream_key(email)
+    totals = {key: 0 for key in COUNTS}
+    archives: Dict[Tuple[str, int], ArchiveWriter] = {}
+    client = None
+    backoff = 1
+    logger.info(f"worker {consumer} is waiting for ranges on {stream}.")
+    try:
+        await ensure_group(r, stream)
+        while not stop.is_set():
+            try:
+                entries = await claim_stale(r, stream, consumer, reclaim_after, max_deliveries)
+                if not entries:
+                    response = await r.xreadgroup(GROUP, consumer, {stream: ">"}, count=1, block=int(block * 1000))
+                    entries = response[0][1] if response else []
+            except RedisConnectionError as e:
+                logger.info(f"lost the connection to redis: {e}. retrying in {backoff}s.")
+                await _sleep_unless_stopped(stop, backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+                continue
+
+            for entry_id, fields in entries:
+                if not fields:
+                    # deleted from the stream after it was delivered, so there is nothing left to do.
+                    await r.xack(stream, GROUP, entry_id)
+                    continue
+                fields = _decode(fields)
+                try:
+                    client = client or await connect()
+                    counts = await ingest_range(client, session_maker, email, fields, archives, to_raw,
+                                                process_chunk, batch_size, name=consumer)
+                except StaleRange as e:
+                    await dead_letter(r, stream, entry_id, fields, str(e))
+                    continue
+                except MailboxLoginError:
+                    # wrong credentials won't fix themselves, so there is no point retrying.
+                    raise
+                except Exception as e:
+                    logger.info(f"failed to ingest uids {fields['uids'].split(',')[0]}-{fields['uids'].split(',')[-1]}: {e}. "
+                                f"it is retried in {reclaim_after}s.")
+                    if client:
+                        client.writer.close()
+                        client = None
+                    await _sleep_unless_stopped(stop, backoff)
+                    backoff = min(backoff * 2, MAX_BACKOFF)
+                    continue
+
+                backoff = 1
+                for key in COUNTS:
+                    totals[key] += counts[key]
+                # counted only by the worker whose ack went through, in case the range was reclaimed meanwhile.
+                if await r.xack(stream, GROUP, entry_id):
+                    async with r.pipeline(transaction=False) as pipe:
+                        pipe.hincrby(job_key(fields["job"]), "done", 1)
+                        for key in COUNTS:
+                            pipe.hincrby(job_key(fields["job"]), key, counts[key])
+                        await pipe.execute()
+    finally:
+        for archive in archives.values():
+            archive.close()
+        if client:
+            await client.logout()
+    return totals
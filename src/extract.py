@@ -0,0 +1,72 @@
+import re
+from html import unescape
+from bs4 import BeautifulSoup
+
+
+TAG_PATTERN = re.compile(r"<(?:(!--)|(script|style)\b|(/?)span\b[^>]*?(/?)>)", re.I)
+BLOCK_END_PATTERNS = {
+    "script": re.compile(r"</script\s*>", re.I),
+    "style": re.compile(r"</style\s*>", re.I),
+}
+MARKUP_PATTERN = re.compile(r"<!--.*?-->|<[^>]*>", re.S)
+EMBEDDED_PATTERN = re.compile(r"<(script|style)\b", re.I)
+
+
+def find_first_span_text(html: str) -> str | None:
+    """
+    Finds the text of the first <span> without building a parse tree. Comments, scripts and
+    styles are jumped over so a "<span" inside them is never mistaken for a tag. Nested spans
+    are tracked, and tags inside the span are dropped the same way BeautifulSoup's get_text drops them.
+    Returns None when the markup around the span is not simple enough to be sure about.
+    """
+    depth = 0
+    start = None
+    pos = 0
+    while True:
+        match = TAG_PATTERN.search(html, pos)
+        if not match:
+            return None
+        pos = match.end()
+
+        if match.group(1): # comment
+            end = html.find("-->", pos)
+            if end == -1:
+                return None
+            pos = end + 3
+            continue
+        if match.group(2): # script or style
+            end = BLOCK_END_PATTERNS[match.group(2).lower()].search(html, pos)
+            if not end:
+                return None
+            pos = end.end()
+            continue
+
+        closing, self_closing = match.group(3), match.group(4)
+        if self_closing:
+            return None
+        if not closing:
+            if start is None:
+                start = pos
+            depth += 1
+        elif start is None:
+            return None
+        else:
+            depth -= 1
+            if depth == 0:
+                inner = html[start:match.start()]
+                if EMBEDDED_PATTERN.search(inner):
+                    return None
+                return unescape(MARKUP_PATTERN.sub("", inner))
+
+
+def extract_alert_text(html: str) -> str:
+    """
+    Gets the text of the first span in a kuda alert, which holds the transaction statement.
+    Falls back to BeautifulSoup when the fast path cannot find the span.
+    """
+    text = find_first_span_text(html)
+    if text is not None:
+        return text
+
+    span = BeautifulSoup(html, 'html.parser').span
+    return span.get_text() if span else ""
@@ -0,0 +1,276 @@
+import re
+import time
+import queue
+import base64
+import quopri
+from itertools import takewhile
+from datetime import datetime
+from email.parser import BytesHeaderParser
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+from imap_tools import MailboxFetchError
+from imap_tools.mailbox import BaseMailBox
+from imap_tools.utils import check_command_status, chunked_crop, parse_email_date
+
+from src.logger import logger
+
+
+HEADER_FIELDS = "BODY.PEEK[HEADER.FIELDS (DATE MESSAGE-ID)]"
+BODY_RANGE = 64 * 1024 # the alert span sits near the top of the html, so this is rarely all of it.
+TOKEN_PATTERN = re.compile(rb'\(|\)|"(?:[^"\\]|\\.)*"|\{\d+\}$|[^\s()"\[]+(?:\[[^\]]*\](?:<\d+>)?)?')
+
+
+class AlertMessage:
+    """
+    The parts of a kuda alert email that ingestion needs.
+    """
+    def __init__(self, uid: str, date: datetime, message_id: str, html: str):
+        self.uid = uid
+        self.date = date
+        self.message_id = message_id
+        self.html = html
+
+    def __repr__(self) -> str:
+        return f"AlertMessage(uid={self.uid}, date={self.date})"
+
+
+class MailBoxPool:
+    """
+    A fixed size pool of logged in mailbox connections.
+    """
+    def __init__(self, connect: Callable[[], BaseMailBox | None], size: int):
+        self.connect = connect
+        self.size = size
+        self._idle: queue.Queue = queue.Queue()
+        for _ in range(size):
+            self._idle.put(self.connect())
+
+    @contextmanager
+    def connection(self) -> Iterator[BaseMailBox | None]:
+        """
+        Borrows a connection from the pool, logging in again if it was dropped.
+        """
+        conn = self._idle.get()
+        try:
+            if conn is None:
+                conn = self.connect()
+            yield conn
+        except Exception:
+            self._discard(conn)
+            conn = None
+            raise
+        finally:
+            self._idle.put(conn)
+
+    def _discard(self, conn: BaseMailBox | None) -> None:
+        if conn is None:
+            return
+        try:
+            conn.logout()
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        """
+        Logs out of every connection in the pool.
+        """
+        while not self._idle.empty():
+            self._discard(self._idle.get())
+
+
+def _tokenize(fetch_data: list) -> List[Any]:
+    """
+    Tokenizes the raw data of a FETCH response. literals come back from imaplib as
+    (prefix, literal) tuples and are kept as bytes tokens.
+    """
+    tokens = []
+    for item in fetch_data:
+        prefix, literal = item if isinstance(item, tuple) else (item, None)
+        for token in TOKEN_PATTERN.findall(prefix or b""):
+            if token.startswith(b"{"):
+                continue
+            if token.startswith(b'"'):
+                tokens.append(re.sub(rb'\\(.)', rb"\1", token[1:-1]).decode(errors="replace"))
+            elif token.upper() == b"NIL":
+                tokens.append(None)
+            else:
+                tokens.append(token if token in (b"(", b")") else token.decode())
+        if literal is not None:
+            tokens.append(literal)
+    return tokens
+
+
+def parse_fetch_response(fetch_data: list) -> Dict[str, Dict[str, Any]]:
+    """
+    Parses a FETCH response into a dict of uid -> {item name: value}.
+    """
+    stack: List[list] = [[]]
+    for token in _tokenize(fetch_data):
+        if token == b"(":
+            stack.append([])
+        elif token == b")":
+            closed = stack.pop()
+            stack[-1].append(closed)
+        else:
+            stack[-1].append(token)
+
+    res = {}
+    for item in stack[0]:
+        if not isinstance(item, list):
+            continue # message sequence numbers
+        attributes = {str(item[i]).upper(): item[i + 1] for i in range(0, len(item) - 1, 2)}
+        if "UID" in attributes:
+            res[attributes["UID"]] = attributes
+    return res
+
+
+def find_html_part(structure: list, section: str = "") -> Tuple[str, str, str, int] | None:
+    """
+    Finds the first inline text/html part of a BODYSTRUCTURE.
+    Returns its section number, transfer encoding, charset and size.
+    """
+    if structure and isinstance(structure[0], list): # multipart
+        for idx, part in enumerate(takewhile(lambda p: isinstance(p, list), structure), start=1):
+            found = find_html_part(part, f"{section}.{idx}" if section else str(idx))
+            if found:
+                return found
+        return None
+
+    if len(structure) < 7 or str(structure[0]).lower() != "text" or str(structure[1]).lower() != "html":
+        return None
+    disposition = structure[9] if len(structure) > 9 else None
+    if isinstance(disposition, list) and str(disposition[0]).lower() == "attachment":
+        return None
+
+    params = structure[2] if isinstance(structure[2], list) else []
+    charset = dict(zip([str(k).lower() for k in params[::2]], params[1::2])).get("charset") or "utf-8"
+    return section or "1", str(structure[5] or "7bit").lower(), charset, int(structure[6])
+
+
+def decode_part(raw: bytes, encoding: str, charset: str) -> str:
+    """
+    Decodes a (possibly truncated) body part.
+    """
+    if encoding == "base64":
+        raw = raw.translate(None, b" \t\r\n")
+        raw = base64.b64decode(raw[:len(raw) - len(raw) % 4])
+    elif encoding == "quoted-printable":
+        raw = quopri.decodestring(raw)
+    try:
+        return raw.decode(charset, errors="replace")
+    except LookupError:
+        return raw.decode("utf-8", errors="replace")
+
+
+def _uid_fetch(conn: BaseMailBox, uids: Sequence[str], message_parts: str) -> Dict[str, Dict[str, Any]]:
+    fetch_result = conn.client.uid("FETCH", ",".join(uids), message_parts)
+    check_command_status(fetch_result, MailboxFetchError)
+    return parse_fetch_response(fetch_result[1])
+
+
+def _body_section(attributes: Dict[str, Any]) -> bytes:
+    for key, value in attributes.items():
+        if key.startswith("BODY[") and isinstance(value, bytes):
+            return value
+    return b""
+
+
+def group_html_sections(heads: Dict[str, Dict[str, Any]]) -> Dict[str, List[str]]:
+    """
+    Groups the uids of a header FETCH by the section their html part is in, so each section
+    can be fetched for all of them with one command.
+    """
+    html_parts = {}
+    for uid, attributes in heads.items():
+        part = find_html_part(attributes.get("BODYSTRUCTURE") or [])
+        if part:
+            html_parts.setdefault(part[0], []).append(uid)
+    return html_parts
+
+
+def to_alert_message(uid: str, head: Dict[str, Any], body: bytes, body_range: int) -> Tuple[AlertMessage, str | None]:
+    """
+    Builds an alert from its header FETCH and the first body_range bytes of its html part.
+    Also returns the html section to fetch in full when the span was cut off, or None.
+    """
+    headers = BytesHeaderParser().parsebytes(_body_section(head))
+    message = AlertMessage(uid, parse_email_date(headers.get("Date", "")), headers.get("Message-ID", ""), "")
+    part = find_html_part(head.get("BODYSTRUCTURE") or [])
+    if not part:
+        return message, None
+    section, encoding, charset, size = part
+    message.html = decode_part(body, encoding, charset)
+    return message, section if size > body_range and "</span>" not in message.html else None
+
+
+def decode_html_part(head: Dict[str, Any], body: bytes) -> str:
+    _, encoding, charset, _ = find_html_part(head.get("BODYSTRUCTURE") or [])
+    return decode_part(body, encoding, charset)
+
+
+def fetch_alerts(conn: BaseMailBox, uids: Sequence[str], bulk: int = 100, body_range: int = BODY_RANGE) -> Iterator[AlertMessage]:
+    """
+    Fetches the date, Message-ID and html part of each uid, oldest first.
+    Instead of downloading whole messages, each bulk of uids costs two FETCH commands: one for the
+    headers and BODYSTRUCTURE, and one for the first body_range bytes of the html section.
+    Plain text parts, attachments and inline images are never downloaded.
+    """
+    for uid_chunk in chunked_crop(sorted(uids, key=int), bulk):
+        heads = _uid_fetch(conn, uid_chunk, f"(UID BODYSTRUCTURE {HEADER_FIELDS})")
+
+        bodies = {}
+        for section, section_uids in group_html_sections(heads).items():
+            for uid, attributes in _uid_fetch(conn, section_uids, f"(UID BODY.PEEK[{section}]<0.{body_range}>)").items():
+                bodies[uid] = _body_section(attributes)
+
+        for uid in sorted(heads, key=int):
+            message, section = to_alert_message(uid, heads[uid], bodies.get(uid, b""), body_range)
+            if section:
+                # the span was cut off, so get the whole html part for this one.
+                full = _uid_fetch(conn, [uid], f"(UID BODY.PEEK[{section}])").get(uid, {})
+                message.html = decode_html_part(heads[uid], _body_section(full))
+            yield message
+
+
+def shard_uids(uids: Sequence[str], shard_size: int) -> List[List[str]]:
+    """
+    Splits a list of uids into consecutive shards of shard_size.
+    """
+    return [list(uids[i:i + shard_size]) for i in range(0, len(uids), shard_size)]
+
+
+def fetch_shard(pool: MailBoxPool, uids: List[str], retries: int = 3, backoff: float = 1.0) -> List[AlertMessage]:
+    """
+    Fetches one shard of uids over a pooled connection, backing off and reconnecting when it fails.
+    """
+    for attempt in range(retries + 1):
+        try:
+            with pool.connection() as conn:
+                if conn is None:
+                    raise ConnectionError("could not log in to the imap server.")
+                return list(fetch_alerts(conn, uids, bulk=len(uids)))
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt
+            logger.info(f"failed to fetch uids {uids[0]}-{uids[-1]}: {e}. retrying in {delay}s.")
+            time.sleep(delay)
+    return []
+
+
+def fetch_sharded(pool: MailBoxPool, uids: Sequence[str], shard_size: int = 200) -> Iterator[AlertMessage]:
+    """
+    Fetches uids in shards over every connection in the pool at the same time.
+    Messages are yielded in the order of uids, and at most two shards per connection are held in memory.
+    """
+    shards = shard_uids(uids, shard_size)
+    in_flight = pool.size * 2
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        futures = [executor.submit(fetch_shard, pool, shard) for shard in shards[:in_flight]]
+        for idx in range(len(shards)):
+            if idx + in_flight < len(shards):
+                futures.append(executor.submit(fetch_shard, pool, shards[idx + in_flight]))
+            for trxn in futures[idx].result():
+                yield trxn
+            futures[idx] = None
@@ -1,37 +1,57 @@
 import os
+import time
+import zlib
+import signal
+import asyncio
 import redis
+import redis.asyncio as aioredis
 from redis import Redis
-from imap_tools import MailBox, AND, MailboxLoginError
+from imap_tools import MailBox, MailBoxUnencrypted, MailboxLoginError
 from dotenv import load_dotenv, find_dotenv
-from typing import List, Dict
-from bs4 import BeautifulSoup
+from typing import List, Dict, Tuple
 from imap_tools.mailbox import BaseMailBox
-from datetime import datetime
-
-from src.credit import (
-    get_credit_by_alert_info,
-    is_credit_by_reversal,
-    is_credit_by_transfer,
-    is_credit_by_removal_from_savings,
-    get_savings_pocket
-)
+from datetime import datetime, date
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
-from src.debit import (
-    get_debit_by_airtime_info,
-    get_narration_and_receiver,
-    get_service_for_online_card_payment,
-    is_debit_by_airtime_recharge,
-    is_debit_by_card_online,
-    is_debit_by_card_pos,
-    is_debit_by_spend_and_save,
-    is_debit_by_transfer
+from src.aioengine import ingest
+from src.aioimap import connect_mailbox
+from src.archive import ArchiveWriter, archive_dir, archive_dirs, decode_alert, read_archived_alerts
+from src.distributed import DEFAULT_RANGE_SIZE, DEFAULT_RECLAIM_AFTER, MAX_DELIVERIES, coordinate, work
+from src.classify import (
+    PARSE_ERRORS,
+    classify_and_parse_transaction,
+    classify_statement,
+    parse_statement,
+    scan_statement
 )
-
+from src.extract import extract_alert_text
+from src.fetcher import MailBoxPool, fetch_alerts, fetch_sharded
 from src.logger import logger
-
-from storage.apis import write_credit_trxn, write_debit_trxn
-from storage.base import engine, Base
-from utils.utils import get_amount
+from src.metrics import Metrics, record, write_metrics
+from src.pipeline import run_pipeline
+from src.scheduler import DEFAULT_QUANTUM, schedule
+from src.sync import (
+    DEFAULT_CHECKPOINT_EVERY,
+    get_sync_state,
+    get_uidvalidity,
+    resolve_last_uid,
+    search_new_uids,
+    sync_checkpoint,
+    sync_state_key
+)
+from src.watch import DEFAULT_IDLE_TIMEOUT, watch
+from storage.apis import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_COPY_BATCH_SIZE,
+    DEFAULT_COPY_THRESHOLD,
+    copy_trxns,
+    get_checkpoint,
+    replace_trxns,
+    write_trxns
+)
+from storage.base import async_database_url, engine
+from storage.migrations import migrate
+from utils.utils import get_account_source_key, get_source_key
 
 load_dotenv(find_dotenv())
 
@@ -47,12 +67,22 @@ def redis_conn() -> Redis | None:
         logger.info(f"failed to connect to redis. the error {e} occurred.")
         return None
         
+def imap_settings() -> Tuple[int, bool]:
+    """
+    Gets the IMAP port and whether to use TLS from IMAP_PORT and IMAP_SSL, which default to 993 over TLS.
+    """
+    use_ssl = os.getenv("IMAP_SSL", "true").lower() not in ("0", "false", "no")
+    return int(os.getenv("IMAP_PORT") or (993 if use_ssl else 143)), use_ssl
+
+
 def login(server, email, password) -> BaseMailBox | None:
     """
     Logs in to the IMAP server.
     """
+    port, use_ssl = imap_settings()
     try:
-        return MailBox(server).login(email, password)
+        mailbox = MailBox(server, port) if use_ssl else MailBoxUnencrypted(server, port)
+        return mailbox.login(email, password)
     except MailboxLoginError as e:
         logger.info("failed to login ", str(e))
 
@@ -62,63 +92,16 @@ def parse_debit_transaction(transaction):
     Parses debit transactions.
     """
     trxn_statement = transaction['trxn_statement'].lower()
-    
-    res = {'date_of_transaction': datetime.strptime(transaction['date'], "%Y-%m-%d")}
-    res['amount'] = float(get_amount(trxn_statement).replace(',', ''))
-    res['debit_metadata'] = {}
-    
-    if is_debit_by_airtime_recharge(trxn_statement):
-        network = get_debit_by_airtime_info(trxn_statement)['network']
-        phone_number = get_debit_by_airtime_info(trxn_statement)['phone_number']
-        res['debit_metadata']['airtime'] = True
-        res['debit_metadata']['network'] = network
-        res['debit_metadata']['phone_number'] = phone_number
-    
-    if is_debit_by_card_online(trxn_statement):
-        service_for_online_payment = get_service_for_online_card_payment(trxn_statement)
-        res['debit_metadata']['online_payment'] = True
-        res['debit_metadata']['service_for_online_payment'] = service_for_online_payment
-
-    if is_debit_by_card_pos(trxn_statement):
-        res['debit_metadata']['point_of_sale'] = True
-    
-    if is_debit_by_spend_and_save(trxn_statement):
-        res['debit_metadata']['savings'] = True
-    
-    if is_debit_by_transfer(trxn_statement):
-        info = get_narration_and_receiver(trxn_statement)
-        res['debit_metadata']['transfer'] = True
-        res['debit_metadata']['receiver'] = info['receiver']
-        res['debit_metadata']['narration'] = info['description']
-       
-    return res
+    phrases, amount = scan_statement(trxn_statement)
+    return parse_statement(trxn_statement, transaction['date'], "debit", phrases, amount)
     
 def parse_credit_transaction(transaction):
     """
     Parses credit transactions.
     """
     trxn_statement = transaction['trxn_statement'].lower()
-    
-    res = {'date_of_transaction': datetime.strptime(transaction['date'], "%Y-%m-%d")}
-    res['amount'] = float(get_amount(trxn_statement).replace(',', ''))
-    res['credit_metadata'] = {}
-    
-    if is_credit_by_reversal(trxn_statement):
-        res['credit_metadata']['reversal'] = True
-    
-    if is_credit_by_removal_from_savings(trxn_statement):
-        savings_account = get_savings_pocket(trxn_statement)
-        res['credit_metadata']['from_savings'] = True
-        res['credit_metadata']['savings_account'] = savings_account if savings_account else ""
-        
-    if is_credit_by_transfer(trxn_statement):
-        sender = get_credit_by_alert_info(trxn_statement)['sender']
-        narration = get_credit_by_alert_info(trxn_statement)['description']
-        res['credit_metadata']['transfer'] = True
-        res['credit_metadata']['sender'] = sender
-        res['credit_metadata']['narration'] = narration
-        
-    return res
+    phrases, amount = scan_statement(trxn_statement)
+    return parse_statement(trxn_statement, transaction['date'], "credit", phrases, amount)
     
 def generally_classify_transactions(transaction) -> str | None:
     """
@@ -128,26 +111,94 @@ def generally_classify_transactions(transaction) -> str | None:
     logger.info(f"Transaction statement: {statement}")
     
     # todo: fix bug that classifies both credit and debit transactions as debit because of how "you just sent" and "just sent you" are in both types of transaction. 
-    if ("you just sent" in statement
-        or "you just recharged" in statement
-        or "you used your card online" in statement 
-        or "you used your kuda card on a pos" in statement 
-        or "you saved some money" in statement
-        or "we moved" in statement
-    ):
-        return "debit"
-    
-    if ("so we've reversed" in statement 
-        or "just sent you" in statement
-        or "you took out" in statement
-    ):
-        return "credit" 
+    return classify_statement(scan_statement(statement)[0])
+
+RawAlert = Tuple[str, str, str, str, str]
+
+
+def to_raw_alert(trxn) -> RawAlert:
+    """
+    Keeps the uid, date, html, Message-ID and send time of a fetched alert so it can be sent to a worker process.
+    """
+    return trxn.uid, datetime.strftime(trxn.date, "%Y-%m-%d"), trxn.html, trxn.message_id, trxn.date.isoformat()
+
+
+def classify_and_parse_alert(raw_alert: RawAlert) -> Tuple[str, str | None, Dict | None]:
+    """
+    Extracts the transaction statement from an alert, classifies it and parses it.
+    The parsed transaction carries the source key of its alert, so writing it twice is a no-op.
+    An alert that can't be parsed is logged and counted as invalid, so the checkpoint still moves past it.
+    """
+    uid, date_str, html, message_id, sent_at = raw_alert
+    started = time.perf_counter()
+    trxn_statement = extract_alert_text(html)
+    record("extract", time.perf_counter() - started)
+    logger.info(f"Transaction statement: {trxn_statement.lower()}")
     
-    return None
+    try:
+        trxn_type, trxn = classify_and_parse_transaction({"trxn_statement": trxn_statement, "date": date_str}, record)
+    except PARSE_ERRORS as e:
+        logger.info(f"skipping the alert with uid {uid}, its transaction could not be parsed: {e}")
+        return uid, None, None
+    if not trxn_type:
+        return uid, None, None
+    trxn["source_key"] = get_source_key(message_id, sent_at, trxn_statement)
+    return uid, trxn_type, trxn
+
+
+def classify_and_parse_alerts(raw_alerts: List[RawAlert]) -> List[Tuple[str, str | None, Dict | None]]:
+    """
+    Classifies and parses a chunk of alerts. This is what runs in the worker processes.
+    """
+    return [classify_and_parse_alert(raw_alert) for raw_alert in raw_alerts]
+
+
+def alert_source_key(raw_alert: RawAlert) -> str:
+    """
+    Gets the source key of an alert, whether it holds a transaction or not.
+    """
+    _, _, html, message_id, sent_at = raw_alert
+    # the statement is only part of the key when there is no Message-ID, so it is rarely extracted here.
+    return get_source_key(message_id, sent_at, "" if message_id.strip() else extract_alert_text(html))
+
+
+def classify_and_parse_archived_alerts(archived_alerts: List[bytes]) -> List[Tuple[str, str, str | None, Dict | None]]:
+    """
+    Decompresses a chunk of archived alerts, then classifies and parses them. This runs in the worker processes
+    so the compressed alerts are what gets sent to them. Each result also has the source key of its alert.
+    """
+    results = []
+    for data in archived_alerts:
+        try:
+            message = decode_alert(data)
+        except (zlib.error, ValueError) as e:
+            logger.info(f"skipping a damaged archived email: {e}")
+            continue
+        raw_alert = to_raw_alert(message)
+        uid, trxn_type, trxn = classify_and_parse_alert(raw_alert)
+        results.append((uid, trxn["source_key"] if trxn_type else alert_source_key(raw_alert), trxn_type, trxn))
+    return results
+
 
-def parse_and_load_transactions_to_db(n: int) -> List[Dict[str, str]] | None:
+def parse_and_load_transactions_to_db(n: int, since: date | None = None, before: date | None = None,
+                                      connections: int = 1, workers: int = 1,
+                                      batch_size: int = DEFAULT_BATCH_SIZE,
+                                      copy_threshold: int = DEFAULT_COPY_THRESHOLD,
+                                      copy_batch_size: int = DEFAULT_COPY_BATCH_SIZE,
+                                      checkpoint_every: int | None = None) -> List[Dict[str, str]] | None:
     """
     Parses and loads transactions into the database.
+    Only kuda alerts with a UID above the last processed one are requested from the server.
+    When since/before are passed only that date window is synced, with its own checkpoint.
+    With more than one connection, the alerts are fetched in uid shards over a pool of mailbox connections.
+    Alerts are parsed and classified by a pool of worker processes while the next ones are fetched,
+    and written to the db batch_size rows at a time, or after at most checkpoint_every alerts.
+    Each write moves the checkpoint in the same db transaction, so a crash only loses the alerts
+    after the last one and a restart picks up exactly there.
+    Backfills of at least copy_threshold alerts are loaded with COPY instead of inserts on postgres,
+    copy_batch_size rows at a time. Unless checkpoint_every is passed, it is DEFAULT_CHECKPOINT_EVERY
+    or the batch size, whichever is larger.
+    Every fetched alert is kept in a local archive so it can be reparsed later without downloading it again.
     """
     server, email, password = os.getenv("IMAP_SERVER"), os.getenv("EMAIL"), os.getenv("PASSWORD")
     imap_client = login(server, email, password) 
@@ -155,68 +206,325 @@ def parse_and_load_transactions_to_db(n: int) -> List[Dict[str, str]] | None:
         logger.info("could not connect to imap client, check if your environment variables are configured correctly or if your have proper internet connection.")
         return 
     
-    batch = imap_client.fetch(criteria=AND(from_=os.getenv("KUDA")), reverse=True)
-    debit_trxn_count = credit_trxn_count = invalid_trxn_count = 0
-    
-    
     r = redis_conn()
     if not r:
         logger.info("failed to connect to redit before parsing transactions.")
         return 
-        
-    if not r.get("checkpoint"):
-        r.set("checkpoint", 0) # if it does not exist, i.e first call, create checkpoint and set it's value to 0
     
-    checkpoint = r.get("checkpoint").decode("utf-8") # get checkpoint again.
-
-    for idx, trxn in enumerate(batch):
-        if idx < int(checkpoint): # don't double process this transaction.
-            logger.info(f"skipping this transaction because transaction {idx} has already been processed and is in the db.")
-            continue
-        
-        if idx == n:  
-            logger.info(f"done processing all {n} transactions.")
-            break
+    folder = imap_client.folder.get()
+    uidvalidity = get_uidvalidity(imap_client, folder)
+    # checkpoints used to be kept in redis, which is still read until the db has one.
+    state = get_checkpoint(sync_state_key(email, folder, since, before)) or get_sync_state(r, email, folder, since, before)
+    last_uid = resolve_last_uid(state, uidvalidity)
+    logger.info(f"syncing {folder} from uid {last_uid + 1}.")
+    
+    uids = search_new_uids(imap_client, last_uid, n, since, before)
+    pool = None
+    if connections > 1:
+        logger.info(f"fetching {len(uids)} transactions over {connections} connections.")
+        pool = MailBoxPool(lambda: login(server, email, password), connections)
+        messages = fetch_sharded(pool, uids)
+    else:
+        messages = fetch_alerts(imap_client, uids)
+    archive = ArchiveWriter(archive_dir(email, folder, uidvalidity))
+    messages = archive.archive(messages)
+    
+    if len(uids) >= copy_threshold:
+        logger.info(f"loading {len(uids)} transactions with COPY.")
+        write = copy_trxns
+        flush_size = copy_batch_size
+    else:
+        write = lambda debit, credit, checkpoint: write_trxns(debit, credit, batch_size, checkpoint)
+        flush_size = batch_size
+    checkpoint_every = checkpoint_every or max(DEFAULT_CHECKPOINT_EVERY, flush_size)
+    
+    counts = {"processed": 0, "debit": 0, "credit": 0, "invalid": 0, "last_uid": last_uid}
+    buffered = {"debit": [], "credit": [], "last_uid": last_uid, "alerts": 0}
+    metrics = Metrics()
+    
+    def flush():
+        if buffered["last_uid"] == counts["last_uid"]:
+            return
+        archive.flush()
+        started = time.perf_counter()
+        write(buffered["debit"], buffered["credit"],
+              sync_checkpoint(email, folder, uidvalidity, buffered["last_uid"], since, before))
+        metrics.observe("write", time.perf_counter() - started)
+        buffered["debit"], buffered["credit"], buffered["alerts"] = [], [], 0
+        counts["last_uid"] = buffered["last_uid"]
+    
+    def write_transactions(results):
+        for uid, trxn_type, trxn in results:
+            idx = counts["processed"]
+            if not trxn_type:
+                logger.info(f"Transaction number: {idx} is an invalid type of transaction")
+                counts["invalid"] += 1
+                
+            elif trxn_type == "debit":
+                logger.info(f"Transaction number: {idx} is a debit transaction.")
+                logger.info(f"{trxn}")
+                buffered["debit"].append(trxn)
+                counts["debit"] += 1 
+                logger.info("\n")
+            elif trxn_type == "credit":
+                logger.info(f"Transaction no: {idx} is a credit transaction.")
+                buffered["credit"].append(trxn)
+                logger.info(f"{trxn}")
+                counts["credit"] += 1
+                logger.info("\n")
             
-        s = BeautifulSoup(trxn.html, 'html.parser')
-        transaction = {
-            "trxn_statement": s.span.get_text(),
-            "date": datetime.strftime(trxn.date, "%Y-%m-%d")
-        }
-        trxn_type = generally_classify_transactions(transaction)
+            buffered["last_uid"] = max(buffered["last_uid"], int(uid))
+            buffered["alerts"] += 1
+            counts["processed"] += 1
         
-        if not trxn_type:
-            logger.info(f"Transaction number: {idx} is an invalid type of transaction")
-            invalid_trxn_count += 1
-            
-        elif trxn_type == "debit":
-            logger.info(f"Transaction number: {idx} is a debit transaction.")
-            debit = parse_debit_transaction(transaction)
-            logger.info(f"{debit}")
-            write_debit_trxn(debit)
-            debit_trxn_count += 1 
-            logger.info("\n")
-        elif trxn_type == "credit":
-            logger.info(f"Transaction no: {idx} is a credit transaction.")
-            credit = parse_credit_transaction(transaction)
-            write_credit_trxn(credit)
-            logger.info(f"{credit}")
-            credit_trxn_count += 1
-            logger.info("\n")
-    
-    r.set("checkpoint", n if n > int(checkpoint) else int(checkpoint)) # update counter to be the new checkpoint 
-    
-    logger.info(f"Processed {n - int(checkpoint)} number of transactions.")
-    logger.info(f"{debit_trxn_count} of them were debit transactions.")
-    logger.info(f"{credit_trxn_count} of them were credit transactions.")
-    logger.info(f"{invalid_trxn_count} of them were invalid transactions.")
+        if len(buffered["debit"]) + len(buffered["credit"]) >= flush_size or buffered["alerts"] >= checkpoint_every:
+            flush()
+    
+    try:
+        run_pipeline(messages, to_raw_alert, classify_and_parse_alerts, write_transactions, workers=workers, metrics=metrics)
+    except BaseException:
+        # whatever was parsed before a failure is still committed along with its checkpoint, unless the
+        # db is what failed, and then the error that stopped ingestion is the one raised.
+        try:
+            flush()
+        except Exception as e:
+            logger.info(f"failed to commit the transactions parsed before ingestion stopped: {e}")
+        raise
+    else:
+        flush()
+    finally:
+        archive.close()
+        if pool:
+            pool.close()
+        metrics.finish(counts)
+        write_metrics(metrics)
+    
+    logger.info(f"Processed {counts['processed']} number of transactions.")
+    logger.info(f"{counts['debit']} of them were debit transactions.")
+    logger.info(f"{counts['credit']} of them were credit transactions.")
+    logger.info(f"{counts['invalid']} of them were invalid transactions.")
 
 
+def parse_and_load_transactions_to_db_async(n: int, since: date | None = None, before: date | None = None,
+                                            connections: int = 1, workers: int = 1,
+                                            batch_size: int = DEFAULT_BATCH_SIZE,
+                                            checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY,
+                                            account: Dict | None = None) -> Dict[str, int] | None:
+    """
+    parse_and_load_transactions_to_db on the asyncio engine in src/aioengine.py, where fetching,
+    parsing, db writes and checkpoint updates overlap on one event loop. Writes go through the
+    async driver of DATABASE_URL (asyncpg for postgres) and are always batched inserts.
+    The mailbox is the one in EMAIL, or account from src/accounts.py, whose rows are tagged with its id.
+    """
+    if account:
+        server, email, password = account["imap_server"], account["email"], account["password"]
+        port, use_ssl = account["imap_port"], account["imap_ssl"]
+    else:
+        server, email, password = os.getenv("IMAP_SERVER"), os.getenv("EMAIL"), os.getenv("PASSWORD")
+        port, use_ssl = imap_settings()
+    
+    metrics = Metrics()
+    
+    async def run():
+        r = aioredis.from_url(os.getenv("REDIS_URL"))
+        db = create_async_engine(async_database_url(os.getenv("DATABASE_URL")))
+        try:
+            return await ingest(lambda: connect_mailbox(server, email, password, port, use_ssl), r, async_sessionmaker(db), email,
+                                to_raw_alert, classify_and_parse_alerts, n, since, before,
+                                connections=connections, workers=workers, batch_size=batch_size, metrics=metrics,
+                                checkpoint_every=checkpoint_every, account_id=account["id"] if account else None)
+        finally:
+            await db.dispose()
+            await r.aclose()
+    
+    try:
+        counts = asyncio.run(run())
+    except MailboxLoginError as e:
+        logger.info(f"failed to login: {e}")
+        return None
+    
+    metrics.finish(counts)
+    write_metrics(metrics)
+    logger.info(f"Processed {counts['processed']} number of transactions.")
+    logger.info(f"{counts['debit']} of them were debit transactions.")
+    logger.info(f"{counts['credit']} of them were credit transactions.")
+    logger.info(f"{counts['invalid']} of them were invalid transactions.")
+    return counts
+
+
+def ingest_account(account: Dict, n: int) -> Dict[str, int] | None:
+    """
+    Ingests up to n new alerts of an account, one slice of ingest_accounts. It runs in a process
+    of the scheduler's pool, so it parses in a thread instead of starting processes of its own.
+    """
+    return parse_and_load_transactions_to_db_async(n, connections=account["connections"], workers=1, account=account)
+
+
+def ingest_accounts(accounts: List[Dict], n: int | None = None, processes: int = 1,
+                    quantum: int = DEFAULT_QUANTUM) -> Dict[str, Dict[str, int]]:
+    """
+    Ingests the new alerts of every account at once over a pool of processes, taking turns
+    quantum alerts at a time, see src/scheduler.py.
+    """
+    logger.info(f"ingesting {len(accounts)} accounts over {processes} processes.")
+    totals = schedule(accounts, ingest_account, processes=processes, quantum=quantum, n=n)
+    for account_id, total in totals.items():
+        logger.info(f"{account_id}: processed {total['processed']} alerts in {total['slices']} slices, "
+                    f"{total['debit']} debit and {total['credit']} credit transactions.")
+    return totals
+
+
+def coordinate_distributed_ingestion(n: int, since: date | None = None, before: date | None = None,
+                                     range_size: int = DEFAULT_RANGE_SIZE) -> Dict[str, int] | None:
+    """
+    Publishes up to n new alerts to redis in ranges of range_size for ka worker processes to ingest,
+    see src/distributed.py, and waits for them to finish. Nothing is fetched or parsed here.
+    """
+    server, email, password = os.getenv("IMAP_SERVER"), os.getenv("EMAIL"), os.getenv("PASSWORD")
+    port, use_ssl = imap_settings()
+    
+    async def run():
+        r = aioredis.from_url(os.getenv("REDIS_URL"))
+        db = create_async_engine(async_database_url(os.getenv("DATABASE_URL")))
+        try:
+            return await coordinate(lambda: connect_mailbox(server, email, password, port, use_ssl), r, async_sessionmaker(db),
+                                    email, n, since, before, range_size=range_size)
+        finally:
+            await db.dispose()
+            await r.aclose()
+    
+    try:
+        counts = asyncio.run(run())
+    except MailboxLoginError as e:
+        logger.info(f"failed to login: {e}")
+        return None
+    
+    logger.info(f"Processed {counts['processed']} number of transactions.")
+    logger.info(f"{counts['debit']} of them were debit transactions.")
+    logger.info(f"{counts['credit']} of them were credit transactions.")
+    logger.info(f"{counts['invalid']} of them were invalid transactions.")
+    return counts
+
+
+def run_worker(batch_size: int = DEFAULT_BATCH_SIZE, reclaim_after: float = DEFAULT_RECLAIM_AFTER,
+               max_deliveries: int = MAX_DELIVERIES) -> Dict[str, int] | None:
+    """
+    Ingests the ranges ka init --distributed publishes for the mailbox in EMAIL until interrupted.
+    """
+    server, email, password = os.getenv("IMAP_SERVER"), os.getenv("EMAIL"), os.getenv("PASSWORD")
+    port, use_ssl = imap_settings()
+    
+    async def run():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError:
+                pass
+        r = aioredis.from_url(os.getenv("REDIS_URL"))
+        db = create_async_engine(async_database_url(os.getenv("DATABASE_URL")))
+        try:
+            return await work(lambda: connect_mailbox(server, email, password, port, use_ssl), r, async_sessionmaker(db), email,
+                              to_raw_alert, classify_and_parse_alerts, batch_size=batch_size,
+                              reclaim_after=reclaim_after, max_deliveries=max_deliveries, stop=stop)
+        finally:
+            await db.dispose()
+            await r.aclose()
+    
+    try:
+        counts = asyncio.run(run())
+    except MailboxLoginError as e:
+        logger.info(f"failed to login: {e}")
+        return None
+    
+    logger.info(f"Processed {counts['processed']} number of transactions in this worker.")
+    return counts
+
+
+def watch_for_transactions(idle_timeout: float = DEFAULT_IDLE_TIMEOUT, batch_size: int = DEFAULT_BATCH_SIZE) -> Dict[str, int] | None:
+    """
+    Ingests new transactions as their alerts arrive until interrupted, over one mailbox connection
+    idling on the inbox. It starts by catching up on anything that arrived since the last sync.
+    """
+    server, email, password = os.getenv("IMAP_SERVER"), os.getenv("EMAIL"), os.getenv("PASSWORD")
+    port, use_ssl = imap_settings()
+    
+    async def run():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError:
+                pass
+        r = aioredis.from_url(os.getenv("REDIS_URL"))
+        db = create_async_engine(async_database_url(os.getenv("DATABASE_URL")))
+        try:
+            return await watch(lambda: connect_mailbox(server, email, password, port, use_ssl), r, async_sessionmaker(db), email,
+                               to_raw_alert, classify_and_parse_alerts, idle_timeout=idle_timeout,
+                               batch_size=batch_size, stop=stop)
+        finally:
+            await db.dispose()
+            await r.aclose()
+    
+    try:
+        counts = asyncio.run(run())
+    except MailboxLoginError as e:
+        logger.info(f"failed to login: {e}")
+        return None
+    
+    logger.info(f"Processed {counts['processed']} number of transactions while watching.")
+    return counts
+
+
+def reparse_archive(workers: int = 1, batch_size: int = DEFAULT_BATCH_SIZE, account: Dict | None = None) -> None:
+    """
+    Runs the current classifier and parsers over every archived alert and writes the results
+    in place of the transactions parsed from those alerts before. Nothing is downloaded.
+    The archive is the one of the mailbox in EMAIL, or of account from src/accounts.py, whose
+    rows are scoped to it the way sync-accounts writes them.
+    """
+    paths = archive_dirs(account["email"] if account else os.getenv("EMAIL"))
+    if not paths:
+        logger.info("there are no archived emails to reparse. run ka init first.")
+        return
+    
+    counts = {"processed": 0, "debit": 0, "credit": 0, "invalid": 0}
+    buffered = {"debit": [], "credit": [], "source_keys": []}
+    
+    def flush():
+        replace_trxns(buffered["debit"], buffered["credit"], batch_size, buffered["source_keys"])
+        buffered["debit"], buffered["credit"], buffered["source_keys"] = [], [], []
+    
+    def write_transactions(results):
+        for _, source_key, trxn_type, trxn in results:
+            counts["processed"] += 1
+            counts[trxn_type or "invalid"] += 1
+            if account:
+                source_key = get_account_source_key(source_key, account["id"])
+            # invalid alerts too, so rows they were once parsed into are removed.
+            buffered["source_keys"].append(source_key)
+            if trxn_type:
+                if account:
+                    trxn["account_id"], trxn["source_key"] = account["id"], source_key
+                buffered[trxn_type].append(trxn)
+        if len(buffered["source_keys"]) >= batch_size:
+            flush()
+    
+    archived_alerts = (data for path in paths for data in read_archived_alerts(path))
+    # a failed reparse is simply run again, so only a finished one writes what is left.
+    run_pipeline(archived_alerts, bytes, classify_and_parse_archived_alerts, write_transactions, workers=workers)
+    flush()
+    
+    logger.info(f"Reparsed {counts['processed']} archived emails: {counts['debit']} debit, "
+                f"{counts['credit']} credit and {counts['invalid']} invalid transactions.")
+
 
 def create_tables():
     """
-    Creates tables in the database.
+    Creates tables in the database and brings older ones up to date, see storage/migrations.py.
     """
     logger.info("connecting to db and creating tables...")
-    Base.metadata.create_all(bind=engine)
+    migrate(engine)
     logger.info("tables successfully created.")
\ No newline at end of file
@@ -0,0 +1,237 @@
+import os
+import re
+import time
+from bisect import bisect_left
+from pathlib import Path
+from datetime import datetime
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from src.logger import logger
+
+
+# fetch is timed per chunk of alerts pulled off the mailbox and write per batch of rows,
+# the other stages per alert.
+STAGES = {"fetch": "chunk", "extract": "alert", "classify": "alert", "parse": "alert", "write": "batch"}
+BUCKETS = tuple(round(m * 10.0 ** e, 12) for e in range(-5, 2) for m in (1, 1.5, 2, 3, 5, 7)) + (100.0,)
+HISTORY = 50
+METRICS_FILE = "kuda_ingest.prom"
+SAMPLE_PATTERN = re.compile(r'^(\w+)(?:\{([^}]*)\})? (\S+)$')
+LABEL_PATTERN = re.compile(r'(\w+)="([^"]*)"')
+
+_current: ContextVar["Metrics | None"] = ContextVar("metrics", default=None)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+
+    def merge(self, other: "Histogram") -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+
+
+class Metrics:
+    """
+    Stage timings, message counters and queue depths of one ingestion run.
+    Every stage has its own histogram and each stage is only timed from one thread,
+    so nothing here needs a lock.
+    """
+    def __init__(self):
+        self.stages = {stage: Histogram() for stage in STAGES}
+        self.counters: Dict[str, int] = {}
+        self.queues: Dict[str, List[int]] = {}
+        self.started = time.time()
+        self.duration = 0.0
+
+    def observe(self, stage: str, seconds: float) -> None:
+        self.stages[stage].observe(seconds)
+
+    def sample_queue(self, queue: str, depth: int) -> None:
+        """
+        Records how many items were waiting in a queue, keeping the max, sum and number of samples.
+        """
+        stats = self.queues.setdefault(queue, [0, 0, 0])
+        stats[0] = max(stats[0], depth)
+        stats[1] += depth
+        stats[2] += 1
+
+    def merge(self, other: "Metrics") -> None:
+        for stage, histogram in other.stages.items():
+            self.stages[stage].merge(histogram)
+
+    def finish(self, counts: Dict[str, int]) -> None:
+        self.duration = time.time() - self.started
+        self.counters = {key: counts[key] for key in ("processed", "debit", "credit", "invalid")}
+
+    def render(self) -> str:
+        """
+        Renders the metrics in the prometheus text format.
+        """
+        lines = ["# HELP kuda_stage_seconds Time spent in each ingestion stage.", "# TYPE kuda_stage_seconds histogram"]
+        for stage, histogram in self.stages.items():
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'kuda_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'kuda_stage_seconds_sum{{stage="{stage}"}} {histogram.sum!r}')
+            lines.append(f'kuda_stage_seconds_count{{stage="{stage}"}} {cumulative}')
+
+        lines += ["# HELP kuda_messages_total Alerts processed in the run, by transaction type.", "# TYPE kuda_messages_total counter"]
+        lines += [f'kuda_messages_total{{type="{key}"}} {value}' for key, value in self.counters.items()]
+
+        lines += ["# HELP kuda_queue_depth_max Most chunks seen waiting in a pipeline queue.", "# TYPE kuda_queue_depth_max gauge"]
+        lines += [f'kuda_queue_depth_max{{queue="{queue}"}} {stats[0]}' for queue, stats in self.queues.items()]
+        lines += ["# HELP kuda_queue_depth_avg Average chunks waiting in a pipeline queue.", "# TYPE kuda_queue_depth_avg gauge"]
+        lines += [f'kuda_queue_depth_avg{{queue="{queue}"}} {stats[1] / stats[2]!r}' for queue, stats in self.queues.items()]
+
+        rate = self.counters.get("processed", 0) / self.duration if self.duration else 0.0
+        lines += [
+            "# TYPE kuda_ingest_duration_seconds gauge", f"kuda_ingest_duration_seconds {self.duration!r}",
+            "# TYPE kuda_ingest_messages_per_second gauge", f"kuda_ingest_messages_per_second {rate!r}",
+            "# TYPE kuda_ingest_timestamp_seconds gauge", f"kuda_ingest_timestamp_seconds {self.started!r}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+def record(stage: str, seconds: float) -> None:
+    """
+    Times a stage into the metrics of the chunk being processed, if they are being collected.
+    """
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.observe(stage, seconds)
+
+
+def measure_chunk(process_chunk: Callable, chunk: list) -> Tuple[list, Metrics]:
+    """
+    Runs process_chunk and returns its results with the stage timings it recorded.
+    This runs in the worker processes, so the timings are sent back with the results.
+    """
+    metrics = Metrics()
+    token = _current.set(metrics)
+    try:
+        return process_chunk(chunk), metrics
+    finally:
+        _current.reset(token)
+
+
+def metrics_dir() -> Path:
+    """
+    Gets the folder metrics are written to, METRICS_DIR or ./metrics.
+    """
+    return Path(os.getenv("METRICS_DIR") or Path.cwd() / "metrics")
+
+
+def write_metrics(metrics: Metrics) -> Path | None:
+    """
+    Writes the metrics of a run to kuda_ingest.prom, which a prometheus node exporter can pick up,
+    and keeps a copy of the last HISTORY runs for ka stats.
+    """
+    history = metrics_dir() / "history"
+    text = metrics.render()
+    try:
+        history.mkdir(parents=True, exist_ok=True)
+        path = history / f"{datetime.fromtimestamp(metrics.started):%Y%m%dT%H%M%S%f}.prom"
+        path.write_text(text)
+        latest = metrics_dir() / METRICS_FILE
+        tmp = latest.with_suffix(".tmp")
+        tmp.write_text(text)
+        os.replace(tmp, latest) # so a scrape never sees half a file.
+        for old in sorted(history.glob("*.prom"))[:-HISTORY]:
+            old.unlink()
+    except OSError as e:
+        logger.info(f"failed to write the ingestion metrics: {e}")
+        return None
+    return path
+
+
+def parse_metrics(text: str) -> Dict[Tuple[str, frozenset], float]:
+    """
+    Parses the samples of a file in the prometheus text format, keyed by name and labels.
+    """
+    samples = {}
+    for line in text.splitlines():
+        match = SAMPLE_PATTERN.match(line)
+        if match:
+            labels = frozenset(LABEL_PATTERN.findall(match.group(2) or ""))
+            samples[(match.group(1), labels)] = float(match.group(3))
+    return samples
+
+
+def quantile(q: float, buckets: List[Tuple[float, float]]) -> float | None:
+    """
+    Estimates a quantile from cumulative (upper bound, count) buckets, interpolating within
+    the bucket it falls in the way prometheus' histogram_quantile does.
+    """
+    total = buckets[-1][1] if buckets else 0
+    if not total:
+        return None
+    rank = q * total
+    lower, below = 0.0, 0.0
+    for bound, cumulative in buckets:
+        if cumulative >= rank:
+            if bound == float("inf"):
+                return lower
+            return lower + (bound - lower) * (rank - below) / (cumulative - below)
+        lower, below = bound, cumulative
+    return lower
+
+
+def read_runs(runs: int = 10) -> List[Dict[Tuple[str, frozenset], float]]:
+    """
+    Reads the metrics of the last runs, oldest first.
+    """
+    paths = sorted((metrics_dir() / "history").glob("*.prom"))[-runs:] if runs > 0 else []
+    return [parse_metrics(path.read_text()) for path in paths]
+
+
+def summarize_stages(runs: Iterable[Dict[Tuple[str, frozenset], float]],
+                     quantiles: Tuple[float, ...] = (0.5, 0.95, 0.99)) -> List[Dict]:
+    """
+    Adds up the stage histograms of several runs and gets the count, mean and quantiles of each stage.
+    """
+    merged = {stage: {"buckets": {}, "sum": 0.0, "count": 0.0} for stage in STAGES}
+    for samples in runs:
+        for (name, labels), value in samples.items():
+            labels = dict(labels)
+            stage = merged.get(labels.get("stage"))
+            if stage is None:
+                continue
+            if name == "kuda_stage_seconds_bucket":
+                stage["buckets"][float(labels["le"])] = stage["buckets"].get(float(labels["le"]), 0.0) + value
+            elif name == "kuda_stage_seconds_sum":
+                stage["sum"] += value
+            elif name == "kuda_stage_seconds_count":
+                stage["count"] += value
+
+    summary = []
+    for name, stage in merged.items():
+        buckets = sorted(stage["buckets"].items())
+        row = {"stage": name, "per": STAGES[name], "count": int(stage["count"]),
+               "mean": stage["sum"] / stage["count"] if stage["count"] else None}
+        for q in quantiles:
+            row[f"p{q * 100:g}"] = quantile(q, buckets)
+        summary.append(row)
+    return summary
+
+
+def summarize_throughput(runs: Iterable[Dict[Tuple[str, frozenset], float]]) -> List[Dict]:
+    """
+    Gets when each run started, how many alerts it processed, how long it took and how many alerts a second that was.
+    """
+    summary = []
+    for samples in runs:
+        summary.append({
+            "started": datetime.fromtimestamp(samples.get(("kuda_ingest_timestamp_seconds", frozenset()), 0)),
+            "processed": int(samples.get(("kuda_messages_total", frozenset({("type", "processed")})), 0)),
+            "duration": samples.get(("kuda_ingest_duration_seconds", frozenset()), 0.0),
+            "rate": samples.get(("kuda_ingest_messages_per_second", frozenset()), 0.0),
+        })
+    return summary
@@ -0,0 +1,175 @@
+import csv
+import json
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, TextIO, Tuple
+from rich.console import Console
+from rich.table import Table
+
+from storage.models import CreditTransaction, DebitTransaction, LedgerTransaction
+
+FORMATS = ("table", "jsonl", "csv", "tsv")
+# rows read from the database at a time while streaming, with a server-side cursor on postgres.
+STREAM_BATCH_SIZE = 1000
+# the columns written first, in every format, followed by the rest of the table's.
+LEADING_COLUMNS = ["id", "date_of_transaction", "amount"]
+# rows left out of a window of the table for its title, header, borders and the prompt under it.
+TABLE_CHROME = 8
+
+
+def columns_of(model) -> List[str]:
+    return LEADING_COLUMNS + [column.key for column in model.__table__.columns if column.key not in LEADING_COLUMNS]
+
+
+def plain_value(value):
+    """
+    Converts a column value to one json and csv can write.
+    """
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def write_rows(model, rows: Iterable, format: str, out: TextIO) -> Tuple[int, object | None]:
+    """
+    Writes rows of model to out as they are read, one json object per line for jsonl, or with a
+    header first for csv and tsv. Gets how many were written and the last one.
+    """
+    columns = columns_of(model)
+    writer = None
+    if format != "jsonl":
+        writer = csv.writer(out, delimiter="\t" if format == "tsv" else ",", lineterminator="\n")
+        writer.writerow(columns)
+    count, last = 0, None
+    for row in rows:
+        values = [plain_value(getattr(row, column)) for column in columns]
+        if writer:
+            writer.writerow(values)
+        else:
+            out.write(json.dumps(dict(zip(columns, values))) + "\n")
+        count, last = count + 1, row
+    return count, last
+
+
+def credit_table(rows: Iterable[CreditTransaction]) -> Table:
+    table = Table(title="Credit Transactions", show_header=True, header_style="bold magenta")
+
+    table.add_column("Date", style="cyan", justify="left")
+    table.add_column("Amount", style="green", justify="right")
+    table.add_column("Sender", style="white")
+    table.add_column("Narration", style="dim", overflow="fold")
+    table.add_column("From Savings", style="dim", overflow="fold")
+    table.add_column("Savings Account", style="dim", overflow="fold")
+    table.add_column("Reversal", style="dim", overflow="fold")
+
+    for tx in rows:
+        date_str = tx.date_of_transaction.strftime("%Y-%m-%d")
+        amount_str = f"₦{float(tx.amount)}0"
+        sender_str = tx.sender or "N/A"
+        narration_str = tx.narration or "N/A"
+        is_from_savings = "True" if tx.from_savings else "False"
+        savings_account = tx.savings_account or "N/A"
+        is_reversal = "True" if tx.reversal else "False"
+
+        table.add_row(date_str, amount_str, sender_str, narration_str, is_from_savings, savings_account, is_reversal)
+    return table
+
+
+def debit_table(rows: Iterable[DebitTransaction]) -> Table:
+    table = Table(title="Raw Debit Transactions", show_header=True, header_style="bold red")
+
+    table.add_column("Date", style="cyan")
+    table.add_column("Amount", style="red", justify="right")
+    table.add_column("Receiver", style="white", overflow="fold")
+    table.add_column("Narration", style="dim", overflow="fold")
+    table.add_column("Airtime", justify="center")
+    table.add_column("Phone Number", style="white")
+    table.add_column("Network", style="white")
+    table.add_column("Online Payment", justify="center")
+    table.add_column("Service (Online)", overflow="fold")
+    table.add_column("POS", justify="center")
+    table.add_column("Savings", justify="center")
+
+    for tx in rows:
+        date_str = tx.date_of_transaction.strftime("%Y-%m-%d") if tx.date_of_transaction else "N/A"
+        amount_str = f"{float(tx.amount)}0" if tx.amount else "0.00"
+        narration_str = tx.narration or "N/A"
+
+        receiver_str = tx.receiver or "N/A"
+        phone_str = tx.phone_number or "N/A"
+        network_str = tx.network or "N/A"
+        service_str = tx.service_for_online_payment or "N/A"
+
+        airtime_str = "True" if tx.airtime else "N/A"
+        online_str = "True" if tx.online_payment else "N/A"
+        pos_str = "True" if tx.point_of_sale else "N/A"
+        savings_str = "True" if tx.savings else "N/A"
+
+        table.add_row(
+            date_str,
+            amount_str,
+            receiver_str,
+            narration_str,
+            airtime_str,
+            phone_str,
+            network_str,
+            online_str,
+            service_str,
+            pos_str,
+            savings_str
+        )
+    return table
+
+
+def ledger_table(rows: Iterable[LedgerTransaction]) -> Table:
+    table = Table(title="Combined Bank Statement", show_header=True, header_style="bold blue")
+
+    table.add_column("Date", style="cyan", justify="left")
+    table.add_column("Type", justify="center")
+    table.add_column("Amount", justify="right")
+    table.add_column("Transaction ID", style="dim", overflow="fold")
+
+    for row in rows:
+        date_str = row.date_of_transaction.strftime("%Y-%m-%d %H:%M") if row.date_of_transaction else "N/A"
+        id_str = str(row.id)
+
+        if row.type == 'credit':
+            type_str = "[bold green]CREDIT[/bold green]"
+            amount_str = f"[green]+₦{float(row.amount):,.2f}[/green]"
+        else:
+            type_str = "[bold red]DEBIT[/bold red]"
+            amount_str = f"[red]-₦{float(row.amount):,.2f}[/red]"
+
+        table.add_row(date_str, type_str, amount_str, id_str)
+    return table
+
+
+TABLES: Dict[type, Callable[[Iterable], Table]] = {
+    CreditTransaction: credit_table,
+    DebitTransaction: debit_table,
+    LedgerTransaction: ledger_table,
+}
+
+
+def window_size(console: Console) -> int:
+    """
+    Gets how many rows of a table fit on the screen at once.
+    """
+    return max(console.height - TABLE_CHROME, 5)
+
+
+def print_tables(console: Console, model, windows: Iterable[List], interactive: bool) -> Tuple[int, object | None, bool]:
+    """
+    Prints each window of rows as a table as soon as it is read, so only one window is ever held
+    in memory. When interactive, waits for Enter before printing the next window, and stops on q.
+    Gets how many rows were printed, the last one, and whether it stopped before the end.
+    """
+    count, last = 0, None
+    for window in windows:
+        if count and interactive and console.input("[dim]Enter for more, q to quit: [/dim]").strip().lower() == "q":
+            return count, last, True
+        console.print(TABLES[model](window))
+        count, last = count + len(window), window[-1]
+    return count, last, False
@@ -0,0 +1,129 @@
+import time
+import queue
+import threading
+import multiprocessing
+from functools import partial
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Iterable, List
+
+from src.logger import logger
+from src.metrics import Metrics, measure_chunk
+
+
+_DONE = object()
+# worker processes aren't forked from the pipeline, whose fetch and write threads may be holding locks
+# (logging, ssl, the db pool) that a forked child would inherit locked and wait on forever.
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def _put(q: queue.Queue, item: Any, stop: threading.Event) -> None:
+    """
+    Puts an item on a bounded queue, giving up once the pipeline is stopped.
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def _fetch_stage(messages: Iterable, to_raw: Callable, chunk_size: int, out_q: queue.Queue,
+                 stop: threading.Event, errors: List[BaseException], metrics: Metrics | None = None) -> None:
+    try:
+        messages = iter(messages)
+        while not stop.is_set():
+            started = time.perf_counter()
+            chunk = [to_raw(message) for message in islice(messages, chunk_size)]
+            if not chunk:
+                break
+            if metrics:
+                metrics.observe("fetch", time.perf_counter() - started)
+            _put(out_q, chunk, stop)
+    except BaseException as e:
+        errors.append(e)
+    finally:
+        _put(out_q, _DONE, stop)
+
+
+def _write_stage(in_q: queue.Queue, write: Callable, errors: List[BaseException]) -> None:
+    while True:
+        results = in_q.get()
+        if results is _DONE:
+            return
+        if errors:
+            continue # keep draining so the other stages never block on a full queue.
+        try:
+            write(results)
+        except BaseException as e:
+            errors.append(e)
+
+
+def run_pipeline(messages: Iterable, to_raw: Callable, process_chunk: Callable, write: Callable,
+                 workers: int = 1, chunk_size: int = 50, queue_size: int = 4, metrics: Metrics | None = None) -> None:
+    """
+    Runs ingestion as three stages joined by bounded queues:
+        fetch: a thread that pulls messages off the network and turns them into picklable raw chunks.
+        process: a pool of worker processes running process_chunk (parse + classify) on each chunk.
+        write: a thread that hands each processed chunk to write, in the order the messages were fetched.
+    At most queue_size chunks wait between stages and 2 * workers chunks are in the pool, so memory
+    stays flat however big the backfill is. With one worker the chunks are processed in this thread.
+    The worker processes are started with START_METHOD, so process_chunk must be importable by name.
+    When metrics are passed, the fetch stage, the stages process_chunk records and the queue depths are timed into them.
+    """
+    raw_q: queue.Queue = queue.Queue(maxsize=queue_size)
+    results_q: queue.Queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors: List[BaseException] = []
+
+    def collect(result):
+        if metrics is None:
+            return result
+        results, chunk_metrics = result
+        metrics.merge(chunk_metrics)
+        return results
+
+    if metrics:
+        process_chunk = partial(measure_chunk, process_chunk)
+    fetcher = threading.Thread(target=_fetch_stage, args=(messages, to_raw, chunk_size, raw_q, stop, errors, metrics), daemon=True)
+    writer = threading.Thread(target=_write_stage, args=(results_q, write, errors), daemon=True)
+    fetcher.start()
+    writer.start()
+
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(START_METHOD)) if workers > 1 else None
+    in_flight: deque = deque()
+    try:
+        while True:
+            chunk = raw_q.get()
+            if chunk is _DONE or errors:
+                break
+            if metrics:
+                metrics.sample_queue("raw", raw_q.qsize())
+                metrics.sample_queue("results", results_q.qsize())
+            if not executor:
+                results_q.put(collect(process_chunk(chunk)))
+                continue
+
+            in_flight.append(executor.submit(process_chunk, chunk))
+            if metrics:
+                metrics.sample_queue("workers", len(in_flight))
+            if len(in_flight) >= workers * 2:
+                results_q.put(collect(in_flight.popleft().result()))
+
+        while in_flight and not errors:
+            results_q.put(collect(in_flight.popleft().result()))
+    except BaseException as e:
+        errors.append(e)
+    finally:
+        stop.set()
+        if executor:
+            executor.shutdown(cancel_futures=True)
+        results_q.put(_DONE)
+        writer.join()
+        fetcher.join()
+
+    if errors:
+        logger.info(f"ingestion pipeline stopped because of: {errors[0]}")
+        raise errors[0]
@@ -0,0 +1,91 @@
+import cProfile
+import pstats
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List
+
+
+# where time goes in a ka command, by the package the profiled functions belong to.
+# C functions have no file, so drivers are also matched on their type names, e.g. psycopg2.extensions.cursor.
+CATEGORIES = {
+    "sqlalchemy": ("sqlalchemy",),
+    "database driver": ("psycopg2", "asyncpg", "sqlite3", "aiosqlite"),
+    "rich rendering": ("rich",),
+    "gemini": ("google",),
+}
+
+_profiler: cProfile.Profile | None = None
+
+
+def start_profiling() -> None:
+    """
+    Starts the deterministic profiler, unless it is already running.
+    """
+    global _profiler
+    if _profiler is None:
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+
+def stop_profiling() -> pstats.Stats | None:
+    """
+    Stops the profiler and gets what it recorded.
+    """
+    global _profiler
+    if _profiler is None:
+        return None
+    _profiler.disable()
+    stats = pstats.Stats(_profiler)
+    _profiler = None
+    return stats
+
+
+def profile_path(command: str | None) -> Path:
+    return Path.cwd() / f"profile-{command or 'ka'}-{datetime.now():%Y%m%d-%H%M%S}.pstats"
+
+
+def _category(func: tuple) -> str | None:
+    filename, _, name = func
+    for category, packages in CATEGORIES.items():
+        for package in packages:
+            if f"/{package}/" in filename or f"\\{package}\\" in filename or f"'{package}." in name:
+                return category
+    return None
+
+
+def time_by_category(stats: pstats.Stats) -> Dict[str, float]:
+    """
+    Splits the profiled time into importing modules and the own time of functions in each category.
+    Importing is counted as the cumulative time of importlib's _find_and_load, so it includes the module
+    level code of every package imported, and that code is counted in its package's category as well.
+    """
+    times = {"total": stats.total_tt, "importing modules": 0.0}
+    times.update({category: 0.0 for category in CATEGORIES})
+    for func, (_, _, own, cumulative, _) in stats.stats.items():
+        if func[2] == "_find_and_load" and "importlib._bootstrap" in func[0]:
+            times["importing modules"] += cumulative
+        category = _category(func)
+        if category:
+            times[category] += own
+    return times
+
+
+def hotspots(stats: pstats.Stats, top: int = 20) -> List[Dict]:
+    """
+    Gets the top functions by their own time.
+    """
+    rows = []
+    for func, (_, calls, own, cumulative, _) in stats.stats.items():
+        rows.append({"function": pstats.func_std_string(func), "calls": calls, "own": own, "cumulative": cumulative})
+    rows.sort(key=lambda row: row["own"], reverse=True)
+    return rows[:top]
+
+
+def slowest_imports(stats: pstats.Stats, top: int = 10) -> List[Dict]:
+    """
+    Gets the modules whose import took longest, including the modules they import in turn.
+    """
+    rows = [{"module": func[0], "cumulative": cumulative}
+            for func, (_, _, _, cumulative, _) in stats.stats.items() if func[2] == "<module>"]
+    rows.sort(key=lambda row: row["cumulative"], reverse=True)
+    return rows[:top]
@@ -0,0 +1,96 @@
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, wait
+from typing import Callable, Dict, List
+
+from src.logger import logger
+from src.pipeline import START_METHOD
+
+
+DEFAULT_QUANTUM = 1000
+
+
+def slice_size(account: Dict, quantum: int) -> int:
+    """
+    Gets how many alerts one slice of the account may fetch. A slice fetches as fast as it can,
+    so with max_per_minute it is kept to a minute's worth, and the pacing only ever stretches it.
+    """
+    rate = account.get("max_per_minute")
+    return min(quantum, rate) if rate else quantum
+
+
+def slice_delay(account: Dict, processed: int) -> float:
+    """
+    Gets how long after a slice started the account's next one may start, so the mailbox is
+    never read faster than its max_per_minute.
+    """
+    rate = account.get("max_per_minute")
+    return processed * 60 / rate if rate else 0.0
+
+
+def schedule(accounts: List[Dict], run_slice: Callable[[Dict, int], Dict[str, int] | None], processes: int = 1,
+             quantum: int = DEFAULT_QUANTUM, n: int | None = None, executor: Executor | None = None) -> Dict[str, Dict[str, int]]:
+    """
+    Ingests many mailboxes at once over a pool of processes. run_slice(account, size) ingests up to
+    size new alerts of one account and returns its counts, resuming from the account's checkpoint.
+    Accounts take turns in slices of quantum alerts, so a large backfill can't hold up the others,
+    and an account never has two slices running at once, so its checkpoint only moves forward.
+    Accounts with max_per_minute are paced to it, in slices of at most that many alerts, and at most
+    n alerts of each are ingested.
+    Gets the total counts of each account.
+    """
+    totals = {account["id"]: {"processed": 0, "debit": 0, "credit": 0, "invalid": 0, "slices": 0} for account in accounts}
+    ready = deque(accounts)
+    not_before = {account["id"]: 0.0 for account in accounts}
+    running = {}
+    own_executor = executor is None
+    executor = executor or ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context(START_METHOD))
+    try:
+        while ready or running:
+            now = time.monotonic()
+            # start the accounts whose turn it is, in order, on every free process.
+            for _ in range(len(ready)):
+                if len(running) >= processes:
+                    break
+                account = ready.popleft()
+                if not_before[account["id"]] > now:
+                    ready.append(account)
+                    continue
+                size = slice_size(account, quantum)
+                if n:
+                    size = min(size, n - totals[account["id"]]["processed"])
+                running[executor.submit(run_slice, account, size)] = (account, size, now)
+
+            waiting_for = [not_before[account["id"]] - now for account in ready]
+            timeout = max(min(waiting_for), 0.0) if waiting_for and len(running) < processes else None
+            if not running:
+                time.sleep(timeout)
+                continue
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                account, size, started = running.pop(future)
+                try:
+                    counts = future.result()
+                except Exception as e:
+                    counts = None
+                    logger.info(f"ingesting account {account['id']} failed: {e}")
+                if counts is None:
+                    logger.info(f"skipping account {account['id']} for the rest of this run.")
+                    continue
+
+                total = totals[account["id"]]
+                for key in ("processed", "debit", "credit", "invalid"):
+                    total[key] += counts[key]
+                total["slices"] += 1
+                caught_up = counts["processed"] < size
+                if caught_up or (n and total["processed"] >= n):
+                    logger.info(f"account {account['id']} is done after {total['processed']} alerts.")
+                    continue
+                not_before[account["id"]] = started + slice_delay(account, counts["processed"])
+                ready.append(account)
+    finally:
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
+    return totals
@@ -0,0 +1,119 @@
+import os
+from datetime import date
+from typing import Dict, List
+from redis import Redis
+from imap_tools import AND, U
+from imap_tools.mailbox import BaseMailBox
+
+from src.logger import logger
+
+# how many alerts at most are processed between two checkpoints, even when too few of them are
+# transactions to fill a batch.
+DEFAULT_CHECKPOINT_EVERY = 1000
+
+
+def sync_state_key(email: str, folder: str, since: date | None = None, before: date | None = None) -> str:
+    """
+    Builds the redis key that holds the sync state of a mailbox folder.
+    A date window gets its own key so it can be backfilled without moving the global one.
+    """
+    key = f"sync:{email}:{folder}"
+    if since or before:
+        key += f":{since or ''}:{before or ''}"
+    return key
+
+
+def get_sync_state(r: Redis, email: str, folder: str, since: date | None = None, before: date | None = None) -> Dict[str, int]:
+    """
+    Gets the UIDVALIDITY and the highest processed UID recorded for a mailbox folder.
+    """
+    return parse_sync_state(r.hgetall(sync_state_key(email, folder, since, before)))
+
+
+async def get_sync_state_async(r, email: str, folder: str, since: date | None = None, before: date | None = None) -> Dict[str, int]:
+    """
+    get_sync_state for a redis.asyncio client.
+    """
+    return parse_sync_state(await r.hgetall(sync_state_key(email, folder, since, before)))
+
+
+def parse_sync_state(state: Dict[bytes, bytes]) -> Dict[str, int]:
+    return {
+        "uidvalidity": int(state.get(b"uidvalidity", 0)),
+        "last_uid": int(state.get(b"last_uid", 0)),
+    }
+
+
+def set_sync_state(r: Redis, email: str, folder: str, uidvalidity: int, last_uid: int,
+                   since: date | None = None, before: date | None = None) -> None:
+    """
+    Records the UIDVALIDITY and the highest processed UID of a mailbox folder.
+    """
+    r.hset(sync_state_key(email, folder, since, before), mapping={"uidvalidity": uidvalidity, "last_uid": last_uid})
+
+
+async def set_sync_state_async(r, email: str, folder: str, uidvalidity: int, last_uid: int,
+                               since: date | None = None, before: date | None = None) -> None:
+    """
+    set_sync_state for a redis.asyncio client.
+    """
+    await r.hset(sync_state_key(email, folder, since, before), mapping={"uidvalidity": uidvalidity, "last_uid": last_uid})
+
+
+def sync_checkpoint(email: str, folder: str, uidvalidity: int, last_uid: int,
+                    since: date | None = None, before: date | None = None) -> Dict:
+    """
+    Builds the sync_checkpoints row that records last_uid as committed, to be written with the rows up to it.
+    """
+    return {"key": sync_state_key(email, folder, since, before), "uidvalidity": uidvalidity, "last_uid": last_uid}
+
+
+def get_uidvalidity(imap_client: BaseMailBox, folder: str) -> int:
+    """
+    Asks the server for the UIDVALIDITY of a folder.
+    """
+    return imap_client.folder.status(folder, ["UIDVALIDITY"])["UIDVALIDITY"]
+
+
+def resolve_last_uid(state: Dict[str, int], uidvalidity: int) -> int:
+    """
+    Gets the UID to resume from. uids are only comparable within the same UIDVALIDITY,
+    so if the server changed it every message has to be processed again.
+    """
+    if state["uidvalidity"] != uidvalidity:
+        if state["uidvalidity"]:
+            logger.info(f"uidvalidity changed from {state['uidvalidity']} to {uidvalidity}, syncing from scratch.")
+        return 0
+    return state["last_uid"]
+
+
+def new_messages_criteria(last_uid: int, since: date | None = None, before: date | None = None):
+    """
+    Builds the search criteria for kuda alerts newer than last_uid.
+    since and before are sent to the server as SEARCH SINCE/BEFORE so only that window is downloaded.
+    """
+    criteria = {"from_": os.getenv("KUDA"), "uid": U(last_uid + 1, "*")}
+    if since:
+        criteria["date_gte"] = since
+    if before:
+        criteria["date_lt"] = before
+    return AND(**criteria)
+
+
+def search_new_uids(imap_client: BaseMailBox, last_uid: int, n: int | None = None,
+                    since: date | None = None, before: date | None = None) -> List[str]:
+    """
+    Searches for the uids of at most n kuda alerts above last_uid, oldest first, without downloading them.
+    """
+    return select_new_uids(imap_client.uids(new_messages_criteria(last_uid, since, before)), last_uid, n)
+
+
+def select_new_uids(uids: List[str], last_uid: int, n: int | None = None) -> List[str]:
+    """
+    Keeps at most n of the uids a search returned that are above last_uid, oldest first.
+    UID n:* always matches the newest message, even when it is below n.
+    """
+    uids = [uid for uid in uids if int(uid) > last_uid]
+    uids.sort(key=int)
+    return uids[:n] if n else uids
+
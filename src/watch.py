@@ -0,0 +1,118 @@
+import asyncio
+from typing import Awaitable, Callable, Dict
+from imap_tools import MailboxLoginError
+
+from src.aioimap import AsyncIMAPClient, fetch_alerts
+from src.archive import ArchiveWriter, archive_dir
+from src.logger import logger
+from src.sync import (
+    get_sync_state_async,
+    new_messages_criteria,
+    resolve_last_uid,
+    select_new_uids,
+    sync_checkpoint,
+    sync_state_key
+)
+from storage.apis import DEFAULT_BATCH_SIZE, get_checkpoint_async, write_trxns_async
+
+
+# IDLE is restarted this often even when nothing arrives, well inside the 30 minutes after which
+# servers and NAT gateways may drop a quiet connection. Each restart also runs a catch-up search.
+DEFAULT_IDLE_TIMEOUT = 300
+MAX_BACKOFF = 300
+
+
+async def sync_new_alerts(client: AsyncIMAPClient, r, session_maker, email: str, uidvalidity: int,
+                          archive: ArchiveWriter, to_raw: Callable, process_chunk: Callable,
+                          batch_size: int = DEFAULT_BATCH_SIZE, folder: str = "INBOX") -> Dict[str, int]:
+    """
+    Fetches, parses and writes the kuda alerts that arrived since the checkpoint, batch_size at a time.
+    Each batch moves the checkpoint in the same transaction as its rows.
+    """
+    state = await get_checkpoint_async(session_maker, sync_state_key(email, folder)) or await get_sync_state_async(r, email, folder)
+    last_uid = resolve_last_uid(state, uidvalidity)
+    uids = select_new_uids(await client.uid_search(str(new_messages_criteria(last_uid))), last_uid)
+    counts = {"processed": 0, "debit": 0, "credit": 0, "invalid": 0, "last_uid": last_uid}
+    for i in range(0, len(uids), batch_size):
+        batch = uids[i:i + batch_size]
+        messages = await fetch_alerts(client, batch)
+        archive.extend(messages)
+        archive.flush()
+
+        buffered = {"debit": [], "credit": []}
+        for _, trxn_type, trxn in process_chunk([to_raw(message) for message in messages]):
+            counts["processed"] += 1
+            counts[trxn_type or "invalid"] += 1
+            if trxn_type:
+                buffered[trxn_type].append(trxn)
+        await write_trxns_async(session_maker, buffered["debit"], buffered["credit"], batch_size,
+                                sync_checkpoint(email, folder, uidvalidity, int(batch[-1])))
+        counts["last_uid"] = int(batch[-1])
+    return counts
+
+
+async def _sleep_unless_stopped(stop: asyncio.Event, delay: float) -> None:
+    try:
+        await asyncio.wait_for(stop.wait(), delay)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def _idle_unless_stopped(client: AsyncIMAPClient, stop: asyncio.Event, timeout: float) -> None:
+    """
+    Idles until new mail arrives, timeout passes or stop is set.
+    """
+    idle = asyncio.create_task(client.idle(timeout))
+    stopped = asyncio.create_task(stop.wait())
+    try:
+        await asyncio.wait([idle, stopped], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        stopped.cancel()
+        if not idle.done():
+            idle.cancel()
+    if not stop.is_set():
+        idle.result()
+
+
+async def watch(connect: Callable[[], Awaitable[AsyncIMAPClient]], r, session_maker, email: str,
+                to_raw: Callable, process_chunk: Callable, idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+                batch_size: int = DEFAULT_BATCH_SIZE, max_backoff: float = MAX_BACKOFF, folder: str = "INBOX",
+                stop: asyncio.Event | None = None) -> Dict[str, int]:
+    """
+    Keeps one connection idling on the folder and ingests kuda alerts as they arrive, until stop is set.
+    When the connection drops it reconnects with exponential backoff and catches up from the checkpoint,
+    so nothing that arrived in the meantime is missed. At most one batch of alerts is held in memory.
+    """
+    stop = stop or asyncio.Event()
+    totals = {"processed": 0, "debit": 0, "credit": 0, "invalid": 0}
+    backoff = 1
+    while not stop.is_set():
+        client = archive = None
+        try:
+            client = await connect()
+            uidvalidity = await client.uidvalidity(folder)
+            archive = ArchiveWriter(archive_dir(email, folder, uidvalidity))
+            backoff = 1
+            logger.info(f"watching {folder} of {email} for new transactions.")
+            while not stop.is_set():
+                counts = await sync_new_alerts(client, r, session_maker, email, uidvalidity, archive,
+                                               to_raw, process_chunk, batch_size, folder)
+                if counts["processed"]:
+                    logger.info(f"ingested {counts['debit']} debit and {counts['credit']} credit transactions "
+                                f"up to uid {counts['last_uid']}.")
+                    for key in totals:
+                        totals[key] += counts[key]
+                await _idle_unless_stopped(client, stop, idle_timeout)
+        except MailboxLoginError:
+            # wrong credentials won't fix themselves, so there is no point retrying.
+            raise
+        except Exception as e:
+            logger.info(f"lost the connection to the mailbox: {e}. reconnecting in {backoff}s.")
+            await _sleep_unless_stopped(stop, backoff)
+            backoff = min(backoff * 2, max_backoff)
+        finally:
+            if archive:
+                archive.close()
+            if client:
+                client.writer.close()
+    return totals
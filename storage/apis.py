@@ -1,39 +1,163 @@
-from storage.base import Session
-from storage.models import DebitTransaction, CreditTransaction
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, List
+from sqlalchemy import Select, delete, func, insert, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DataError, IntegrityError
+
+from storage.base import Session, engine
+from storage.models import DebitTransaction, CreditTransaction, SkippedTransaction, SyncCheckpoint
+from storage.partitions import ensure_partitions, ensure_partitions_async
 from src.logger import logger
 
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_COPY_THRESHOLD = 10000
+# rows per COPY. each one has a fixed cost (staging table, merge, commit), so it pays off in bigger batches.
+DEFAULT_COPY_BATCH_SIZE = 5000
+# postgres tables are partitioned by date_of_transaction, which every unique index there has to include.
+CONFLICT_COLUMNS = {"postgresql": ["source_key", "date_of_transaction"], "sqlite": ["source_key"]}
+# errors a row fails with however often it is written again, e.g. a missing amount. Any other error,
+# like a dropped connection, fails the whole write so the checkpoint isn't moved past unwritten rows.
+PERMANENT_ERRORS = (IntegrityError, DataError)
+
+
+def page_statement(model, start: datetime, end: datetime, n: int, after: tuple[datetime, uuid.UUID] | None = None) -> Select:
+    """
+    Selects the next n rows of model between start and end, in (date_of_transaction, id) order, after
+    the (date_of_transaction, id) of the last row of the page before. Each page starts from the index
+    on those columns where the last one stopped, instead of counting past the rows before it.
+    """
+    statement = select(model).where(model.date_of_transaction >= start, model.date_of_transaction <= end)
+    if after:
+        statement = statement.where(tuple_(model.date_of_transaction, model.id) > tuple_(*after))
+    return statement.order_by(model.date_of_transaction.asc(), model.id.asc()).limit(n)
+
+
+def debit_trxn_row(debit_trxn_dict) -> Dict:
+    """
+    Maps a parsed debit transaction to the columns of debit_transactions.
+    """
+    metadata = debit_trxn_dict.get("debit_metadata", {})
+    row = {
+        "amount": debit_trxn_dict["amount"],
+        "date_of_transaction": debit_trxn_dict["date_of_transaction"],
+        "source_key": debit_trxn_dict.get("source_key"),
+        "account_id": debit_trxn_dict.get("account_id"),
+        "airtime": None,
+        "phone_number": None,
+        "network": None,
+        "savings": None,
+        "point_of_sale": None,
+        "online_payment": None,
+        "service_for_online_payment": None,
+        "transfer": None,
+        "receiver": None,
+        "narration": None,
+    }
+
+    if metadata.get("airtime"):
+        row["airtime"] = metadata["airtime"]
+        row["phone_number"] = metadata["phone_number"]
+        row["network"] = metadata["network"]
+
+    if metadata.get("savings"):
+        row["savings"] = metadata["savings"]
+
+    if metadata.get("point_of_sale"):
+        row["point_of_sale"] = metadata["point_of_sale"]
+
+    if metadata.get('online_payment'):
+        row["online_payment"] = metadata['online_payment']
+        row["service_for_online_payment"] = metadata['service_for_online_payment']
+
+    if metadata.get("transfer"):
+        row["transfer"] = metadata["transfer"]
+        row["receiver"] = metadata["receiver"]
+        row["narration"] = metadata["narration"]
+    return row
+
+
+def credit_trxn_row(credit_trxn_dict) -> Dict:
+    """
+    Maps a parsed credit transaction to the columns of credit_transactions.
+    """
+    metadata = credit_trxn_dict.get("credit_metadata", {})
+    row = {
+        "amount": credit_trxn_dict["amount"],
+        "date_of_transaction": credit_trxn_dict["date_of_transaction"],
+        "source_key": credit_trxn_dict.get("source_key"),
+        "account_id": credit_trxn_dict.get("account_id"),
+        "transfer": None,
+        "sender": None,
+        "narration": None,
+        "reversal": None,
+        "from_savings": None,
+        "savings_account": None,
+    }
+
+    if metadata.get("transfer"):
+        row["transfer"] = metadata["transfer"]
+        row["sender"] = metadata["sender"]
+        row["narration"] = metadata["narration"]
+    if metadata.get("reversal"):
+        row["reversal"] = metadata["reversal"]
+    if metadata.get("from_savings"):
+        row["from_savings"] = metadata.get("from_savings")
+        row["savings_account"] = metadata.get("savings_account")
+    return row
+
+
+def insert_ignoring_duplicates(model, dialect_name: str):
+    """
+    Builds an INSERT for model that skips rows whose source_key is already in the table.
+    """
+    if dialect_name == "postgresql":
+        return postgresql.insert(model).on_conflict_do_nothing(index_elements=CONFLICT_COLUMNS[dialect_name])
+    if dialect_name == "sqlite":
+        return sqlite.insert(model).on_conflict_do_nothing(index_elements=CONFLICT_COLUMNS[dialect_name])
+    return insert(model)
+
+
+def upsert_checkpoint(checkpoint: Dict, dialect_name: str):
+    """
+    Builds an INSERT that records checkpoint, or moves it if its key is already in sync_checkpoints.
+    """
+    statement = (postgresql if dialect_name == "postgresql" else sqlite).insert(SyncCheckpoint).values(**checkpoint)
+    return statement.on_conflict_do_update(
+        index_elements=["key"],
+        set_={"uidvalidity": statement.excluded.uidvalidity, "last_uid": statement.excluded.last_uid, "updated_at": func.now()},
+    )
+
+
+def _checkpoint_state(row: SyncCheckpoint | None) -> Dict[str, int] | None:
+    return {"uidvalidity": row.uidvalidity, "last_uid": row.last_uid} if row else None
+
+
+def get_checkpoint(key: str) -> Dict[str, int] | None:
+    """
+    Gets the UIDVALIDITY and highest committed uid recorded under key, or None if nothing was committed yet.
+    """
+    with Session() as session:
+        return _checkpoint_state(session.get(SyncCheckpoint, key))
+
+
+async def get_checkpoint_async(session_maker, key: str) -> Dict[str, int] | None:
+    """
+    get_checkpoint over an async session.
+    """
+    async with session_maker() as session:
+        return _checkpoint_state(await session.get(SyncCheckpoint, key))
+
+
 def write_debit_trxn(debit_trxn_dict) -> None:
     with Session() as session:
         try:
             logger.info("Writing debit transaction to the database...")
-            debit_trxn = DebitTransaction()
-            debit_trxn.amount = debit_trxn_dict["amount"]
-            debit_trxn.date_of_transaction = debit_trxn_dict["date_of_transaction"]
-            
-            if debit_trxn_dict.get("debit_metadata", {}).get("airtime"):
-                debit_trxn.airtime = debit_trxn_dict["debit_metadata"]["airtime"]
-                debit_trxn.phone_number = debit_trxn_dict["debit_metadata"]["phone_number"]
-                debit_trxn.network = debit_trxn_dict["debit_metadata"]["network"]
-            
-            if debit_trxn_dict.get("debit_metadata", {}).get("savings"):
-                debit_trxn.savings = debit_trxn_dict["debit_metadata"]["savings"]
-            
-            if debit_trxn_dict.get("debit_metadata", {}).get("point_of_sale"):
-                debit_trxn.point_of_sale = debit_trxn_dict["debit_metadata"]["point_of_sale"]
-            
-            if debit_trxn_dict.get("debit_metadata", {}).get('online_payment'):
-                debit_trxn.online_payment = debit_trxn_dict['debit_metadata']['online_payment']
-                debit_trxn.service_for_online_payment = debit_trxn_dict['debit_metadata']['service_for_online_payment']
-                
-            if  debit_trxn_dict.get("debit_metadata", {}).get("transfer"):
-                debit_trxn.transfer = debit_trxn_dict["debit_metadata"]["transfer"]
-                debit_trxn.receiver = debit_trxn_dict["debit_metadata"]["receiver"]
-                debit_trxn.narration = debit_trxn_dict["debit_metadata"]["narration"]
-            
-            session.add(debit_trxn)
+            ensure_partitions(session.get_bind(), [(DebitTransaction.__tablename__, [debit_trxn_dict])])
+            session.execute(insert_ignoring_duplicates(DebitTransaction, session.get_bind().dialect.name), [debit_trxn_row(debit_trxn_dict)])
             session.commit()
             logger.info("Successfully wrote debit transaction to the db")
-            
+
         except Exception as e:
             session.rollback()
             logger.info(f"An error occurred: {str(e)}")
@@ -43,26 +167,364 @@ def write_credit_trxn(credit_trxn_dict) -> None:
     with Session() as session:
         try:
             logger.info("Writing credit transaction to the database...")
-            credit_trxn = CreditTransaction()
-            credit_trxn.amount = credit_trxn_dict["amount"]
-            credit_trxn.date_of_transaction = credit_trxn_dict["date_of_transaction"]
-            
-            if credit_trxn_dict.get("credit_metadata", {}).get("transfer"):
-                credit_trxn.transfer = credit_trxn_dict["credit_metadata"]["transfer"]
-                credit_trxn.sender = credit_trxn_dict["credit_metadata"]["sender"]
-                credit_trxn.narration = credit_trxn_dict["credit_metadata"]["narration"]
-            if credit_trxn_dict.get("credit_metadata", {}).get("reversal"):
-                credit_trxn.reversal = credit_trxn_dict["credit_metadata"]["reversal"]
-            if credit_trxn_dict.get("credit_metadata", {}).get("from_savings"):
-                credit_trxn.from_savings = credit_trxn_dict.get("credit_metadata", {}).get("from_savings")
-                credit_trxn.savings_account = credit_trxn_dict.get("credit_metadata", {}).get("savings_account")
-            session.add(credit_trxn)
+            ensure_partitions(session.get_bind(), [(CreditTransaction.__tablename__, [credit_trxn_dict])])
+            session.execute(insert_ignoring_duplicates(CreditTransaction, session.get_bind().dialect.name), [credit_trxn_row(credit_trxn_dict)])
             session.commit()
             logger.info("Successfully wrote credit transaction to the db")
-            
+
         except Exception as e:
             session.rollback()
             logger.info(f"An error occurred: {e}")
-            
-                
-    
\ No newline at end of file
+
+
+def _write_trxns(model, rows: List[Dict], batch_size: int) -> bool:
+    """
+    Inserts rows in batches of batch_size with executemany, all in one transaction.
+    Rows that are already in the table are skipped.
+    """
+    with Session() as session:
+        statement = insert_ignoring_duplicates(model, session.get_bind().dialect.name)
+        try:
+            ensure_partitions(session.get_bind(), [(model.__tablename__, rows)])
+            for i in range(0, len(rows), batch_size):
+                session.execute(statement, rows[i:i + batch_size])
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            logger.info(f"failed to write {len(rows)} rows to {model.__tablename__}: {e}. writing them one at a time.")
+            return False
+
+
+def write_debit_trxns(debit_trxn_dicts: List[Dict], batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+    """
+    Writes many debit transactions in a single transaction. If that fails, each transaction
+    is written on its own so one bad row doesn't lose the rest.
+    """
+    if not debit_trxn_dicts:
+        return
+    logger.info(f"Writing {len(debit_trxn_dicts)} debit transactions to the database...")
+    if _write_trxns(DebitTransaction, [debit_trxn_row(d) for d in debit_trxn_dicts], batch_size):
+        return
+    for debit_trxn_dict in debit_trxn_dicts:
+        write_debit_trxn(debit_trxn_dict)
+
+
+def write_credit_trxns(credit_trxn_dicts: List[Dict], batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+    """
+    Writes many credit transactions in a single transaction. If that fails, each transaction
+    is written on its own so one bad row doesn't lose the rest.
+    """
+    if not credit_trxn_dicts:
+        return
+    logger.info(f"Writing {len(credit_trxn_dicts)} credit transactions to the database...")
+    if _write_trxns(CreditTransaction, [credit_trxn_row(d) for d in credit_trxn_dicts], batch_size):
+        return
+    for credit_trxn_dict in credit_trxn_dicts:
+        write_credit_trxn(credit_trxn_dict)
+
+
+def skipped_row(model, row: Dict, error: Exception) -> Dict:
+    """
+    Builds the skipped_transactions row recording that row couldn't be written to model.
+    """
+    return {"type": "debit" if model is DebitTransaction else "credit", "source_key": row.get("source_key"),
+            "date_of_transaction": row.get("date_of_transaction"), "amount": row.get("amount"),
+            "error": str(getattr(error, "orig", error))[:500]}
+
+
+def _insert_one_at_a_time(session, tables) -> None:
+    """
+    Inserts each row in a savepoint of its own. Rows that fail with one of PERMANENT_ERRORS are left
+    out and recorded in skipped_transactions; any other error is raised. The session must already be
+    in a transaction: on sqlite the first savepoint would otherwise start one that releasing it commits.
+    """
+    dialect_name = session.get_bind().dialect.name
+    skipped = []
+    for model, rows in tables:
+        for row in rows:
+            try:
+                with session.begin_nested():
+                    session.execute(insert_ignoring_duplicates(model, dialect_name), [row])
+            except PERMANENT_ERRORS as e:
+                logger.info(f"skipping the transaction with source key {row.get('source_key')}, it can't be written: {e}")
+                skipped.append(skipped_row(model, row, e))
+    if skipped:
+        session.execute(insert(SkippedTransaction), skipped)
+
+
+def _write_one_at_a_time(session, tables, checkpoint: Dict | None) -> None:
+    """
+    Writes each row in a savepoint of its own, after the checkpoint, all in one transaction. Rows that
+    fail with one of PERMANENT_ERRORS are left out and recorded in skipped_transactions; any other
+    error is raised, and nothing is committed.
+    """
+    # the checkpoint goes first so the savepoints are inside a transaction already.
+    if checkpoint:
+        session.execute(upsert_checkpoint(checkpoint, session.get_bind().dialect.name))
+    _insert_one_at_a_time(session, tables)
+    session.commit()
+
+
+def write_trxns(debit_trxn_dicts: List[Dict], credit_trxn_dicts: List[Dict], batch_size: int = DEFAULT_BATCH_SIZE,
+                checkpoint: Dict | None = None) -> None:
+    """
+    Writes debit and credit transactions and moves the checkpoint covering them in a single transaction.
+    If a row can never be written, they are written again one at a time, still in one transaction
+    with the checkpoint, leaving that row out and recording it in skipped_transactions. Any other
+    error is raised with nothing written, so the checkpoint stays where it was.
+    """
+    tables = ((DebitTransaction, [debit_trxn_row(d) for d in debit_trxn_dicts]),
+              (CreditTransaction, [credit_trxn_row(d) for d in credit_trxn_dicts]))
+    with Session() as session:
+        dialect_name = session.get_bind().dialect.name
+        try:
+            ensure_partitions(session.get_bind(), [(model.__tablename__, rows) for model, rows in tables])
+            for model, rows in tables:
+                for i in range(0, len(rows), batch_size):
+                    session.execute(insert_ignoring_duplicates(model, dialect_name), rows[i:i + batch_size])
+            if checkpoint:
+                session.execute(upsert_checkpoint(checkpoint, dialect_name))
+            session.commit()
+            return
+        except PERMANENT_ERRORS as e:
+            session.rollback()
+            logger.info(f"failed to write {len(debit_trxn_dicts) + len(credit_trxn_dicts)} transactions: {e}. writing them one at a time.")
+        except Exception as e:
+            session.rollback()
+            logger.info(f"failed to write {len(debit_trxn_dicts) + len(credit_trxn_dicts)} transactions: {e}")
+            raise
+
+        try:
+            _write_one_at_a_time(session, tables, checkpoint)
+        except Exception as e:
+            session.rollback()
+            logger.info(f"failed to write {len(debit_trxn_dicts) + len(credit_trxn_dicts)} transactions one at a time: {e}")
+            raise
+
+
+async def _write_one_at_a_time_async(session, tables, checkpoint: Dict | None) -> None:
+    """
+    _write_one_at_a_time over an async session.
+    """
+    dialect_name = session.bind.dialect.name
+    if checkpoint:
+        await session.execute(upsert_checkpoint(checkpoint, dialect_name))
+    skipped = []
+    for model, rows in tables:
+        for row in rows:
+            try:
+                async with session.begin_nested():
+                    await session.execute(insert_ignoring_duplicates(model, dialect_name), [row])
+            except PERMANENT_ERRORS as e:
+                logger.info(f"skipping the transaction with source key {row.get('source_key')}, it can't be written: {e}")
+                skipped.append(skipped_row(model, row, e))
+    if skipped:
+        await session.execute(insert(SkippedTransaction), skipped)
+    await session.commit()
+
+
+async def write_trxns_async(session_maker, debit_trxn_dicts: List[Dict], credit_trxn_dicts: List[Dict],
+                            batch_size: int = DEFAULT_BATCH_SIZE, checkpoint: Dict | None = None) -> None:
+    """
+    write_trxns over an async session.
+    """
+    tables = ((DebitTransaction, [debit_trxn_row(d) for d in debit_trxn_dicts]),
+              (CreditTransaction, [credit_trxn_row(d) for d in credit_trxn_dicts]))
+    if not debit_trxn_dicts and not credit_trxn_dicts and not checkpoint:
+        return
+    async with session_maker() as session:
+        dialect_name = session.bind.dialect.name
+        try:
+            await ensure_partitions_async(session.bind, [(model.__tablename__, rows) for model, rows in tables])
+            for model, rows in tables:
+                for i in range(0, len(rows), batch_size):
+                    await session.execute(insert_ignoring_duplicates(model, dialect_name), rows[i:i + batch_size])
+            if checkpoint:
+                await session.execute(upsert_checkpoint(checkpoint, dialect_name))
+            await session.commit()
+            return
+        except PERMANENT_ERRORS as e:
+            await session.rollback()
+            logger.info(f"failed to write {len(debit_trxn_dicts) + len(credit_trxn_dicts)} transactions: {e}. writing them one at a time.")
+        except Exception as e:
+            await session.rollback()
+            logger.info(f"failed to write {len(debit_trxn_dicts) + len(credit_trxn_dicts)} transactions: {e}")
+            raise
+
+        try:
+            await _write_one_at_a_time_async(session, tables, checkpoint)
+        except Exception as e:
+            await session.rollback()
+            logger.info(f"failed to write {len(debit_trxn_dicts) + len(credit_trxn_dicts)} transactions one at a time: {e}")
+            raise
+
+
+def replace_trxns(debit_trxn_dicts: List[Dict], credit_trxn_dicts: List[Dict], batch_size: int = DEFAULT_BATCH_SIZE,
+                  source_keys: List[str] | None = None) -> None:
+    """
+    Writes reparsed transactions in place of the rows parsed from the same alerts before, in a
+    single transaction. A transaction that is now classified differently is removed from the other table.
+    Pass the source_keys of every reparsed alert, so the rows of alerts that are no longer
+    transactions are removed too. Like write_trxns, a row that can never be written is left out and
+    recorded in skipped_transactions, and any other error is raised with nothing replaced.
+    """
+    keys = list({*(source_keys or ()), *(d["source_key"] for d in debit_trxn_dicts + credit_trxn_dicts)})
+    if not keys:
+        return
+    tables = ((DebitTransaction, [debit_trxn_row(d) for d in debit_trxn_dicts]),
+              (CreditTransaction, [credit_trxn_row(d) for d in credit_trxn_dicts]))
+    with Session() as session:
+        dialect_name = session.get_bind().dialect.name
+        try:
+            ensure_partitions(session.get_bind(), [(model.__tablename__, rows) for model, rows in tables])
+            for model, rows in tables:
+                session.execute(delete(model).where(model.source_key.in_(keys)))
+                for i in range(0, len(rows), batch_size):
+                    session.execute(insert_ignoring_duplicates(model, dialect_name), rows[i:i + batch_size])
+            session.commit()
+            return
+        except PERMANENT_ERRORS as e:
+            session.rollback()
+            logger.info(f"failed to replace {len(keys)} reparsed transactions: {e}. writing them one at a time.")
+        except Exception as e:
+            session.rollback()
+            logger.info(f"failed to replace {len(keys)} reparsed transactions: {e}")
+            raise
+
+        try:
+            # the deletes go first, so the savepoints are inside a transaction already.
+            for model, _ in tables:
+                session.execute(delete(model).where(model.source_key.in_(keys)))
+            _insert_one_at_a_time(session, tables)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.info(f"failed to replace {len(keys)} reparsed transactions one at a time: {e}")
+            raise
+
+
+def _copy_value(value) -> str:
+    """
+    Formats a value for COPY's text format.
+    """
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+class CopyStream:
+    """
+    A file-like object COPY reads rows from as tab separated lines, so the payload is
+    built as it is sent instead of all at once.
+    """
+    def __init__(self, rows: Iterable[Dict], columns: List[str]):
+        self._lines = ("\t".join(_copy_value(row[column]) for column in columns) + "\n" for row in rows)
+        self._buffer = ""
+
+    def read(self, size: int = -1) -> str:
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        while size < 0 or length < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            chunks.append(line)
+            length += len(line)
+        data = "".join(chunks)
+        if size < 0:
+            size = length
+        data, self._buffer = data[:size], data[size:]
+        return data
+
+    readline = read
+
+
+def _copy_rows(cursor, model, rows: List[Dict]) -> None:
+    """
+    Streams rows into a temporary staging table with COPY ... FROM STDIN, then merges them into
+    the table. Rows whose source_key is already in the table are skipped, so loading the same
+    transactions twice is a no-op.
+    """
+    table = model.__tablename__
+    staging = f"{table}_staging"
+    columns = list(rows[0])
+    column_list = ", ".join(columns)
+
+    cursor.execute(f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS SELECT {column_list} FROM {table} WITH NO DATA")
+    cursor.copy_expert(f"COPY {staging} ({column_list}) FROM STDIN", CopyStream(rows, columns))
+    cursor.execute(f"""
+        INSERT INTO {table} (id, {column_list}, created_at)
+        SELECT gen_random_uuid(), {column_list}, now() FROM {staging}
+        ON CONFLICT ({", ".join(CONFLICT_COLUMNS["postgresql"])}) DO NOTHING
+    """)
+    logger.info(f"copied {cursor.rowcount} new rows into {table}.")
+
+
+def _copy_trxns(tables: List[tuple], checkpoint: Dict | None = None) -> bool:
+    """
+    COPYs the rows of each (model, rows) in tables and moves the checkpoint, all in one transaction.
+    """
+    connection = engine.raw_connection()
+    try:
+        ensure_partitions(engine, [(model.__tablename__, rows) for model, rows in tables])
+        with connection.cursor() as cursor:
+            for model, rows in tables:
+                if rows:
+                    _copy_rows(cursor, model, rows)
+            if checkpoint:
+                cursor.execute("""
+                    INSERT INTO sync_checkpoints (key, uidvalidity, last_uid, updated_at)
+                    VALUES (%(key)s, %(uidvalidity)s, %(last_uid)s, now())
+                    ON CONFLICT (key) DO UPDATE
+                    SET uidvalidity = excluded.uidvalidity, last_uid = excluded.last_uid, updated_at = now()
+                """, checkpoint)
+        connection.commit()
+        return True
+    except Exception as e:
+        connection.rollback()
+        logger.info(f"failed to copy {sum(len(rows) for _, rows in tables)} rows: {e}. writing them in batches instead.")
+        return False
+    finally:
+        connection.close()
+
+
+def copy_trxns(debit_trxn_dicts: List[Dict], credit_trxn_dicts: List[Dict], checkpoint: Dict | None = None) -> None:
+    """
+    Loads many debit and credit transactions with COPY and moves the checkpoint covering them in
+    the same transaction. This is for large backfills on postgres; anywhere else, or if COPY fails,
+    it falls back to write_trxns.
+    """
+    tables = [(DebitTransaction, [debit_trxn_row(d) for d in debit_trxn_dicts]),
+              (CreditTransaction, [credit_trxn_row(d) for d in credit_trxn_dicts])]
+    if engine.dialect.name == "postgresql" and _copy_trxns(tables, checkpoint):
+        return
+    write_trxns(debit_trxn_dicts, credit_trxn_dicts, checkpoint=checkpoint)
+
+
+def copy_debit_trxns(debit_trxn_dicts: List[Dict]) -> None:
+    """
+    Loads many debit transactions with COPY. This is for large backfills on postgres;
+    anywhere else, or if COPY fails, it falls back to write_debit_trxns.
+    """
+    if not debit_trxn_dicts:
+        return
+    if engine.dialect.name == "postgresql" and _copy_trxns([(DebitTransaction, [debit_trxn_row(d) for d in debit_trxn_dicts])]):
+        return
+    write_debit_trxns(debit_trxn_dicts)
+
+
+def copy_credit_trxns(credit_trxn_dicts: List[Dict]) -> None:
+    """
+    Loads many credit transactions with COPY. This is for large backfills on postgres;
+    anywhere else, or if COPY fails, it falls back to write_credit_trxns.
+    """
+    if not credit_trxn_dicts:
+        return
+    if engine.dialect.name == "postgresql" and _copy_trxns([(CreditTransaction, [credit_trxn_row(d) for d in credit_trxn_dicts])]):
+        return
+    write_credit_trxns(credit_trxn_dicts)
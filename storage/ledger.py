@@ -0,0 +1,67 @@
+from typing import List
+from sqlalchemy import Connection, text
+
+# the transaction tables the ledger is kept from, with the type their rows get in it and the column
+# naming the other side of the transaction.
+LEDGER_SOURCES = (
+    ("credit_transactions", "credit", "sender"),
+    ("debit_transactions", "debit", "receiver"),
+)
+LEDGER_COLUMNS = "id, type, date_of_transaction, amount, narration, counterparty, account_id"
+
+
+def _ledger_values(prefix: str, kind: str, counterparty: str) -> str:
+    return (f"{prefix}id, '{kind}', {prefix}date_of_transaction, {prefix}amount, {prefix}narration, "
+            f"{prefix}{counterparty}, {prefix}account_id")
+
+
+def ledger_trigger_ddl(dialect_name: str, table: str, kind: str, counterparty: str) -> List[str]:
+    """
+    Builds the triggers that copy every insert, update and delete on a transaction table into the
+    ledger, in the same transaction, so the ledger can never disagree with the tables.
+    """
+    if dialect_name == "postgresql":
+        return [f"""
+            CREATE OR REPLACE FUNCTION {table}_ledger() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    DELETE FROM transactions WHERE id = OLD.id;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO transactions ({LEDGER_COLUMNS}) VALUES ({_ledger_values("NEW.", kind, counterparty)});
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        """, f"DROP TRIGGER IF EXISTS {table}_ledger ON {table}", f"""
+            CREATE TRIGGER {table}_ledger AFTER INSERT OR UPDATE OR DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION {table}_ledger()
+        """]
+    return [f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_ledger_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO transactions ({LEDGER_COLUMNS}) VALUES ({_ledger_values("NEW.", kind, counterparty)});
+        END
+    """, f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_ledger_update AFTER UPDATE ON {table} BEGIN
+            DELETE FROM transactions WHERE id = OLD.id;
+            INSERT INTO transactions ({LEDGER_COLUMNS}) VALUES ({_ledger_values("NEW.", kind, counterparty)});
+        END
+    """, f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_ledger_delete AFTER DELETE ON {table} BEGIN
+            DELETE FROM transactions WHERE id = OLD.id;
+        END
+    """]
+
+
+def create_ledger(conn: Connection) -> None:
+    """
+    Starts keeping the ledger from the transaction tables, and fills it with the rows already in them.
+    """
+    for table, kind, counterparty in LEDGER_SOURCES:
+        for statement in ledger_trigger_ddl(conn.dialect.name, table, kind, counterparty):
+            conn.execute(text(statement))
+        conn.execute(text(f"""
+            INSERT INTO transactions ({LEDGER_COLUMNS})
+            SELECT {_ledger_values("", kind, counterparty)} FROM {table}
+            WHERE id NOT IN (SELECT id FROM transactions)
+        """))
@@ -0,0 +1,147 @@
+from typing import Callable, List, Tuple
+from sqlalchemy import Connection, Engine, inspect, select, text
+
+from storage.base import Base
+from storage.models import CreditTransaction, DebitTransaction, SchemaMigration
+from storage.ledger import create_ledger
+from storage.rollups import create_rollups
+from storage.partitions import create_partitions, forget_partitions, list_partitions, month_of
+from src.logger import logger
+
+# postgres advisory lock held while a migration runs, so ka commands started at the same time
+# (several ka worker processes, say) don't apply one twice.
+MIGRATION_LOCK = 4242
+
+
+def add_source_key_columns(conn: Connection) -> None:
+    """
+    Adds the source_key column to transaction tables created before it existed.
+    """
+    for model in (CreditTransaction, DebitTransaction):
+        table = model.__tablename__
+        if "source_key" in {column["name"] for column in inspect(conn).get_columns(table)}:
+            continue
+        logger.info(f"adding source_key to {table}...")
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN source_key VARCHAR(64)"))
+        conn.execute(text(f"CREATE UNIQUE INDEX ix_{table}_source_key ON {table} (source_key)"))
+
+
+def add_account_id_columns(conn: Connection) -> None:
+    """
+    Adds the account_id column to transaction tables created before it existed.
+    """
+    for model in (CreditTransaction, DebitTransaction):
+        table = model.__tablename__
+        if "account_id" in {column["name"] for column in inspect(conn).get_columns(table)}:
+            continue
+        logger.info(f"adding account_id to {table}...")
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN account_id VARCHAR(100)"))
+        conn.execute(text(f"CREATE INDEX ix_{table}_account_id ON {table} (account_id)"))
+
+
+def add_query_indexes(conn: Connection) -> None:
+    """
+    Creates the date and flag indexes of storage.models.query_indexes on tables created before them.
+    """
+    for model in (CreditTransaction, DebitTransaction):
+        for index in model.__table__.indexes:
+            if index.name not in {existing["name"] for existing in inspect(conn).get_indexes(model.__tablename__)}:
+                logger.info(f"creating {index.name}...")
+                index.create(conn)
+
+
+def partition_by_month(conn: Connection) -> None:
+    """
+    Turns the transaction tables into tables partitioned by the month of date_of_transaction, on
+    postgres, and moves their rows into a partition per month. Postgres needs the partition key in
+    every unique index, so the primary key and the source_key index include date_of_transaction.
+    An alert always parses to the same date, so a source key still can't be written twice.
+    """
+    if conn.dialect.name != "postgresql":
+        return
+    for model in (CreditTransaction, DebitTransaction):
+        table = model.__tablename__
+        if list_partitions(conn, table) is not None:
+            continue
+        logger.info(f"partitioning {table} by month...")
+        old = f"{table}_unpartitioned"
+        conn.execute(text(f"ALTER TABLE {table} RENAME TO {old}"))
+        conn.execute(text(f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY RANGE (date_of_transaction)"))
+        months = conn.scalars(text(f"SELECT DISTINCT date_trunc('month', date_of_transaction) FROM {old}"))
+        create_partitions(conn, table, [month_of(month) for month in months])
+        conn.execute(text(f"INSERT INTO {table} SELECT * FROM {old}"))
+        conn.execute(text(f"DROP TABLE {old}"))
+
+        conn.execute(text(f"ALTER TABLE {table} ADD PRIMARY KEY (id, date_of_transaction)"))
+        for index in model.__table__.indexes:
+            if index.name == f"ix_{table}_source_key":
+                conn.execute(text(f"CREATE UNIQUE INDEX {index.name} ON {table} (source_key, date_of_transaction)"))
+            else:
+                index.create(conn)
+    forget_partitions()
+
+
+def order_date_indexes_by_id(conn: Connection) -> None:
+    """
+    Rebuilds the date indexes as (date_of_transaction, id, amount), the order ka get pages in.
+    """
+    for model in (CreditTransaction, DebitTransaction):
+        table = model.__tablename__
+        index = next(index for index in model.__table__.indexes if index.name == f"ix_{table}_date_of_transaction")
+        existing = {existing["name"]: existing["column_names"] for existing in inspect(conn).get_indexes(table)}
+        if existing.get(index.name) == [column.name for column in index.columns]:
+            continue
+        logger.info(f"rebuilding {index.name}...")
+        if index.name in existing:
+            conn.execute(text(f"DROP INDEX {index.name}"))
+        index.create(conn)
+
+
+# every change to the schema of an existing database, in the order they are applied. Tables that
+# don't exist yet are created whole by create_all, so a migration only has to bring older ones up to date.
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "add source_key to transactions", add_source_key_columns),
+    (2, "add account_id to transactions", add_account_id_columns),
+    (3, "index date_of_transaction and the flag columns", add_query_indexes),
+    (4, "partition transactions by month on postgres", partition_by_month),
+    (5, "order the date indexes by id", order_date_indexes_by_id),
+    (6, "keep the transactions ledger", create_ledger),
+    (7, "keep daily and monthly totals", create_rollups),
+]
+
+
+def applied_versions(conn: Connection) -> List[int]:
+    return list(conn.scalars(select(SchemaMigration.version).order_by(SchemaMigration.version)))
+
+
+def pending_migrations(bind: Engine) -> List[Tuple[int, str, Callable[[Connection], None]]]:
+    """
+    Gets the migrations that haven't been applied to the database yet.
+    """
+    Base.metadata.create_all(bind=bind, tables=[SchemaMigration.__table__])
+    with bind.connect() as conn:
+        applied = set(applied_versions(conn))
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+
+def migrate(bind: Engine) -> List[int]:
+    """
+    Creates any missing tables and applies the pending migrations in order, each in a transaction
+    with the row that records it, so a migration that fails is retried next time. On postgres,
+    where DDL is transactional too, it also leaves nothing half done behind.
+    Gets the versions that were applied.
+    """
+    Base.metadata.create_all(bind=bind)
+    applied = []
+    for version, name, upgrade in pending_migrations(bind):
+        with bind.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                conn.execute(text("SELECT pg_advisory_xact_lock(:lock)"), {"lock": MIGRATION_LOCK})
+                # another ka command may have applied it while this one waited for the lock.
+                if version in applied_versions(conn):
+                    continue
+            logger.info(f"applying migration {version}: {name}...")
+            upgrade(conn)
+            conn.execute(SchemaMigration.__table__.insert().values(version=version, name=name))
+        applied.append(version)
+    return applied
@@ -1,10 +1,31 @@
 import uuid
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy.types import String, Float
-from sqlalchemy import func
-from datetime import datetime
+from sqlalchemy.types import BigInteger, String, Float
+from sqlalchemy import Index, func, text
+from datetime import date, datetime
+from typing import Tuple
 from storage.base import Base
 
+CREDIT_FLAGS = ("transfer", "reversal", "from_savings")
+DEBIT_FLAGS = ("transfer", "airtime", "online_payment", "point_of_sale", "savings")
+
+
+def query_indexes(table: str, flags: Tuple[str, ...]) -> Tuple[Index, ...]:
+    """
+    Indexes for the ways transactions are read. ka get filters on date_of_transaction and pages
+    in (date_of_transaction, id) order, and the amount is there too so totals over a date range
+    are answered from the index alone.
+    Each flag gets a partial index of just the rows it is set on, for questions like
+    "how much did I spend on airtime in March". sqlite only uses a partial index when the query
+    has its exact condition, so there it is written the way SQLAlchemy renders flag == True.
+    """
+    return (
+        Index(f"ix_{table}_date_of_transaction", "date_of_transaction", "id", "amount"),
+        *(Index(f"ix_{table}_{flag}", "date_of_transaction", "amount",
+                postgresql_where=text(flag), sqlite_where=text(f"{flag} = 1")) for flag in flags),
+    )
+
+
 class Transaction(Base):
     __abstract__ = True
 
@@ -14,9 +35,100 @@ class Transaction(Base):
     date_of_transaction: Mapped[datetime]
     amount: Mapped[float] = mapped_column(Float, nullable=False)
     created_at: Mapped[datetime] =  mapped_column(default=func.now())
+    # ties the row to the alert email it was parsed from, see utils.utils.get_source_key.
+    source_key: Mapped[str | None] = mapped_column(String(64), unique=True, index=True)
+    # the configured account whose mailbox the alert came from, see src.accounts. None for ka init's EMAIL.
+    account_id: Mapped[str | None] = mapped_column(String(100), index=True)
+
+class SyncCheckpoint(Base):
+    """
+    The highest uid of a mailbox folder whose transactions are in the db. It is written in the same
+    transaction as those rows, so after a crash ingestion resumes exactly where the last commit ended.
+    """
+    __tablename__ = "sync_checkpoints"
+
+    # see src.sync.sync_state_key.
+    key: Mapped[str] = mapped_column(String(400), primary_key=True)
+    uidvalidity: Mapped[int] = mapped_column(BigInteger)
+    last_uid: Mapped[int] = mapped_column(BigInteger)
+    updated_at: Mapped[datetime] = mapped_column(default=func.now(), onupdate=func.now())
+
+class SkippedTransaction(Base):
+    """
+    A parsed transaction that could never be written, e.g. one missing its amount. The write it was in
+    went ahead without it and moved the checkpoint past it, so this is the record that it was left out.
+    """
+    __tablename__ = "skipped_transactions"
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
+    type: Mapped[str] = mapped_column(String(6))
+    source_key: Mapped[str | None] = mapped_column(String(64), index=True)
+    date_of_transaction: Mapped[datetime | None]
+    amount: Mapped[float | None] = mapped_column(Float)
+    error: Mapped[str] = mapped_column(String(500))
+    skipped_at: Mapped[datetime] = mapped_column(default=func.now())
+
+class SchemaMigration(Base):
+    """
+    A migration from storage.migrations that has been applied to the database.
+    """
+    __tablename__ = "schema_migrations"
+
+    version: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(String(200))
+    applied_at: Mapped[datetime] = mapped_column(default=func.now())
+
+class LedgerTransaction(Base):
+    """
+    Every credit and debit transaction in one table, with the columns they share, so ka get can page
+    through both in date order from one index. It is kept by triggers on the two tables, in the same
+    transaction as their writes, see storage.ledger.
+    """
+    __tablename__ = "transactions"
+    __table_args__ = (Index("ix_transactions_date_of_transaction", "date_of_transaction", "id"),)
+
+    # the id of the row in credit_transactions or debit_transactions.
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True)
+    type: Mapped[str] = mapped_column(String(6))
+    date_of_transaction: Mapped[datetime]
+    amount: Mapped[float] = mapped_column(Float, nullable=False)
+    narration: Mapped[str | None] = mapped_column(String(250))
+    # the sender of a credit, or the receiver of a debit.
+    counterparty: Mapped[str | None] = mapped_column(String(100))
+    account_id: Mapped[str | None] = mapped_column(String(100))
+
+class Totals(Base):
+    """
+    The totals of the transactions of a period, kept by triggers on the transaction tables in the
+    same transaction as their writes, see storage.rollups. Each debit flag gets the total spent
+    on it, e.g. airtime_outflow.
+    """
+    __abstract__ = True
+
+    inflow: Mapped[float] = mapped_column(Float, default=0)
+    outflow: Mapped[float] = mapped_column(Float, default=0)
+    credits: Mapped[int] = mapped_column(default=0)
+    debits: Mapped[int] = mapped_column(default=0)
+    transfer_outflow: Mapped[float] = mapped_column(Float, default=0)
+    airtime_outflow: Mapped[float] = mapped_column(Float, default=0)
+    online_payment_outflow: Mapped[float] = mapped_column(Float, default=0)
+    point_of_sale_outflow: Mapped[float] = mapped_column(Float, default=0)
+    savings_outflow: Mapped[float] = mapped_column(Float, default=0)
+
+class DailyTotal(Totals):
+    __tablename__ = "daily_totals"
+
+    day: Mapped[date] = mapped_column(primary_key=True)
+
+class MonthlyTotal(Totals):
+    __tablename__ = "monthly_totals"
+
+    # the first day of the month.
+    month: Mapped[date] = mapped_column(primary_key=True)
 
 class CreditTransaction(Transaction):
     __tablename__ = "credit_transactions"
+    __table_args__ = query_indexes(__tablename__, CREDIT_FLAGS)
 
     sender: Mapped[str | None] = mapped_column(String(100))
     reversal: Mapped[bool | None]
@@ -28,6 +140,7 @@ class CreditTransaction(Transaction):
 
 class DebitTransaction(Transaction):
     __tablename__ = "debit_transactions"
+    __table_args__ = query_indexes(__tablename__, DEBIT_FLAGS)
     
     receiver: Mapped[str | None] = mapped_column(String(100))
     airtime: Mapped[bool | None]
@@ -0,0 +1,174 @@
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Set, Tuple
+from sqlalchemy import Connection, Engine, text
+
+from storage.rollups import ROLLUP_SOURCES, add_rows_sql
+from src.logger import logger
+
+# postgres advisory lock held while partitions are created, so writers reaching a new month
+# at the same time don't both try to create its partition.
+PARTITION_LOCK = 4243
+COLD_SCHEMA = "cold"
+
+# the partitions known to exist, by database and table. None for a table that isn't partitioned.
+_partitions: Dict[Tuple[str, str], Set[str] | None] = {}
+
+
+def month_of(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    """
+    Names the partition of a table holding the transactions of one month, e.g. debit_transactions_2026_01.
+    """
+    return f"{table}_{month:%Y_%m}"
+
+
+def create_partition_sql(table: str, month: date) -> str:
+    return (f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month(month):%Y-%m-%d}')")
+
+
+def row_months(rows: Iterable[Dict]) -> Set[date]:
+    return {month_of(row["date_of_transaction"]) for row in rows}
+
+
+def list_partitions(conn: Connection, table: str) -> Set[str] | None:
+    """
+    Gets the partitions attached to a table, or None if it isn't partitioned.
+    """
+    relkind = conn.execute(text("SELECT relkind::text FROM pg_class WHERE oid = to_regclass(:table)"), {"table": table}).scalar()
+    if relkind != "p":
+        return None
+    return set(conn.scalars(text("""
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = to_regclass(:table)
+    """), {"table": table}))
+
+
+def create_partitions(conn: Connection, table: str, months: Iterable[date]) -> List[str]:
+    """
+    Creates the partitions of a table for months that don't have one yet. Gets the ones it created.
+    """
+    conn.execute(text("SELECT pg_advisory_xact_lock(:lock)"), {"lock": PARTITION_LOCK})
+    existing = list_partitions(conn, table) or set()
+    created = []
+    for month in sorted(months):
+        if partition_name(table, month) not in existing:
+            conn.execute(text(create_partition_sql(table, month)))
+            created.append(partition_name(table, month))
+    if created:
+        logger.info(f"created the partitions {', '.join(created)}.")
+    return created
+
+
+def _missing_months(url: str, tables: Iterable[Tuple[str, Set[date]]], load) -> List[Tuple[str, Set[date]]]:
+    missing = []
+    for table, months in tables:
+        if (url, table) not in _partitions:
+            _partitions[url, table] = load(table)
+        known = _partitions[url, table]
+        if known is None:
+            continue
+        months = {month for month in months if partition_name(table, month) not in known}
+        if months:
+            missing.append((table, months))
+    return missing
+
+
+def ensure_partitions(bind: Engine, tables: Iterable[Tuple[str, Iterable[Dict]]]) -> None:
+    """
+    Makes sure each (table, rows) in tables has a partition for the month of every row, before the rows
+    are written. Partitions are created in a short transaction of their own, so the write that follows
+    doesn't hold a lock on the whole table. Only postgres tables are partitioned, see storage/migrations.py.
+    """
+    if bind.dialect.name != "postgresql":
+        return
+    url = bind.url.render_as_string()
+
+    def load(table):
+        with bind.connect() as conn:
+            return list_partitions(conn, table)
+
+    missing = _missing_months(url, [(table, row_months(rows)) for table, rows in tables], load)
+    if not missing:
+        return
+    with bind.begin() as conn:
+        for table, months in missing:
+            create_partitions(conn, table, months)
+            _partitions[url, table] = list_partitions(conn, table)
+
+
+async def ensure_partitions_async(bind, tables: Iterable[Tuple[str, Iterable[Dict]]]) -> None:
+    """
+    ensure_partitions over an AsyncEngine.
+    """
+    if bind.dialect.name != "postgresql":
+        return
+    url = bind.url.render_as_string()
+    tables = [(table, row_months(rows)) for table, rows in tables]
+    unknown = [table for table, _ in tables if (url, table) not in _partitions]
+    if unknown:
+        async with bind.connect() as conn:
+            for table in unknown:
+                _partitions[url, table] = await conn.run_sync(list_partitions, table)
+
+    missing = _missing_months(url, tables, lambda table: None)
+    if not missing:
+        return
+    async with bind.begin() as conn:
+        for table, months in missing:
+            await conn.run_sync(create_partitions, table, months)
+            _partitions[url, table] = await conn.run_sync(list_partitions, table)
+
+
+def forget_partitions() -> None:
+    """
+    Drops what is known about partitions, so it is looked up again.
+    """
+    _partitions.clear()
+
+
+def partition_stats(conn: Connection, table: str) -> List[Dict]:
+    """
+    Gets the month, estimated row count and size on disk of every partition of a table, oldest first.
+    """
+    rows = conn.execute(text("""
+        SELECT child.relname AS name, child.reltuples AS estimated_rows, pg_total_relation_size(child.oid) AS size
+        FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = to_regclass(:table)
+        ORDER BY child.relname
+    """), {"table": table}).mappings()
+    return [{"name": row["name"], "month": datetime.strptime(row["name"][-7:], "%Y_%m").date(),
+             "rows": max(int(row["estimated_rows"]), 0), "size": row["size"]} for row in rows]
+
+
+def detach_partitions(conn: Connection, table: str, before: date, tablespace: str | None = None) -> List[str]:
+    """
+    Detaches the partitions of a table for months before before and moves them to the cold schema,
+    and to tablespace if one is passed, e.g. one on cheaper disks. Their rows stay there as plain
+    tables, out of every query on the table, until they are attached again with ALTER TABLE ... ATTACH PARTITION.
+    Their rows are taken out of the transactions ledger and the daily and monthly totals too.
+    """
+    conn.execute(text("SELECT pg_advisory_xact_lock(:lock)"), {"lock": PARTITION_LOCK})
+    conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {COLD_SCHEMA}"))
+    detached = []
+    for partition in partition_stats(conn, table):
+        if partition["month"] >= month_of(before):
+            continue
+        conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition['name']}"))
+        conn.execute(text(f"ALTER TABLE {partition['name']} SET SCHEMA {COLD_SCHEMA}"))
+        conn.execute(text(f"DELETE FROM transactions WHERE id IN (SELECT id FROM {COLD_SCHEMA}.{partition['name']})"))
+        for statement in add_rows_sql(conn.dialect.name, dict(ROLLUP_SOURCES)[table], f"{COLD_SCHEMA}.{partition['name']}", -1):
+            conn.execute(text(statement))
+        if tablespace:
+            conn.execute(text(f"ALTER TABLE {COLD_SCHEMA}.{partition['name']} SET TABLESPACE {tablespace}"))
+        detached.append(partition["name"])
+    forget_partitions()
+    return detached
@@ -0,0 +1,153 @@
+from datetime import date, timedelta
+from typing import Dict, List
+from sqlalchemy import Connection, func, select, text
+from sqlalchemy.orm import Session
+
+from storage.models import DEBIT_FLAGS, DailyTotal, MonthlyTotal
+
+# the columns every rollup keeps, in the order they are written.
+TOTAL_COLUMNS = ["inflow", "outflow", "credits", "debits", *(f"{flag}_outflow" for flag in DEBIT_FLAGS)]
+# the transaction tables the rollups are kept from, with the type of their rows.
+ROLLUP_SOURCES = (("credit_transactions", "credit"), ("debit_transactions", "debit"))
+
+
+def rollup_values(kind: str, prefix: str = "") -> Dict[str, str]:
+    """
+    Gets what one row of a transaction table adds to each total, as SQL over its columns.
+    """
+    amount = f"{prefix}amount"
+    values = {
+        "inflow": amount if kind == "credit" else "0",
+        "outflow": amount if kind == "debit" else "0",
+        "credits": "1" if kind == "credit" else "0",
+        "debits": "1" if kind == "debit" else "0",
+    }
+    for flag in DEBIT_FLAGS:
+        values[f"{flag}_outflow"] = f"CASE WHEN {prefix}{flag} THEN {amount} ELSE 0 END" if kind == "debit" else "0"
+    return values
+
+
+def rollup_keys(dialect_name: str, prefix: str = "") -> Dict[str, tuple]:
+    """
+    Gets the rollup tables with their key column and the SQL for the key of a row of a transaction table.
+    """
+    column = f"{prefix}date_of_transaction"
+    if dialect_name == "postgresql":
+        return {"daily_totals": ("day", f"CAST({column} AS DATE)"),
+                "monthly_totals": ("month", f"CAST(date_trunc('month', {column}) AS DATE)")}
+    return {"daily_totals": ("day", f"date({column})"),
+            "monthly_totals": ("month", f"date({column}, 'start of month')")}
+
+
+def _upsert(table: str, key: str, values: str) -> str:
+    updates = ", ".join(f"{column} = {table}.{column} + excluded.{column}" for column in TOTAL_COLUMNS)
+    return (f"INSERT INTO {table} ({key}, {', '.join(TOTAL_COLUMNS)}) {values} "
+            f"ON CONFLICT ({key}) DO UPDATE SET {updates}")
+
+
+def add_row_sql(dialect_name: str, kind: str, prefix: str, sign: int) -> List[str]:
+    """
+    Builds the statements adding one row, NEW. or OLD. in a row trigger, to the rollups, or
+    taking it away again for sign -1.
+    """
+    values = rollup_values(kind, prefix)
+    return [_upsert(table, key, f"VALUES ({key_sql}, {', '.join(f'{sign} * ({values[column]})' for column in TOTAL_COLUMNS)})")
+            for table, (key, key_sql) in rollup_keys(dialect_name, prefix).items()]
+
+
+def add_rows_sql(dialect_name: str, kind: str, source: str, sign: int) -> List[str]:
+    """
+    Builds the statements adding every row of source, a transaction table or a trigger's transition
+    table, to the rollups, summed per day and month first, or taking them away again for sign -1.
+    """
+    values = rollup_values(kind)
+    sums = ", ".join(f"{sign} * sum({values[column]})" for column in TOTAL_COLUMNS)
+    # sqlite needs the WHERE to tell the ON CONFLICT of the upsert from a join's ON.
+    return [_upsert(table, key, f"SELECT {key_sql}, {sums} FROM {source} WHERE true GROUP BY 1 ORDER BY 1")
+            for table, (key, key_sql) in rollup_keys(dialect_name).items()]
+
+
+def rollup_trigger_ddl(dialect_name: str, table: str, kind: str) -> List[str]:
+    """
+    Builds the triggers that keep the rollups up to date with every insert, update and delete on a
+    transaction table, in the same transaction. On postgres they run once per statement, over all the
+    rows it wrote, so a batch updates each day and month once, always in date order.
+    """
+    if dialect_name == "postgresql":
+        removed = ";\n".join(add_rows_sql(dialect_name, kind, "old_rows", -1))
+        added = ";\n".join(add_rows_sql(dialect_name, kind, "new_rows", 1))
+        statements = [f"""
+            CREATE OR REPLACE FUNCTION {table}_rollups() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    {removed};
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    {added};
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        """]
+        # postgres only allows transition tables on triggers for a single event.
+        for event, transitions in (("INSERT", "NEW TABLE AS new_rows"), ("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+                                   ("DELETE", "OLD TABLE AS old_rows")):
+            statements += [f"DROP TRIGGER IF EXISTS {table}_rollups_{event.lower()} ON {table}", f"""
+                CREATE TRIGGER {table}_rollups_{event.lower()} AFTER {event} ON {table}
+                REFERENCING {transitions} FOR EACH STATEMENT EXECUTE FUNCTION {table}_rollups()
+            """]
+        return statements
+
+    removed = add_row_sql(dialect_name, kind, "OLD.", -1)
+    added = add_row_sql(dialect_name, kind, "NEW.", 1)
+    return [f"CREATE TRIGGER IF NOT EXISTS {table}_rollups_{event.lower()} AFTER {event} ON {table} BEGIN {'; '.join(body)}; END"
+            for event, body in (("INSERT", added), ("UPDATE", removed + added), ("DELETE", removed))]
+
+
+def rebuild_rollups(conn: Connection) -> None:
+    """
+    Recomputes the rollups from the transaction tables.
+    """
+    for table in ("daily_totals", "monthly_totals"):
+        conn.execute(text(f"DELETE FROM {table}"))
+    for table, kind in ROLLUP_SOURCES:
+        for statement in add_rows_sql(conn.dialect.name, kind, table, 1):
+            conn.execute(text(statement))
+
+
+def create_rollups(conn: Connection) -> None:
+    """
+    Starts keeping the rollups from the transaction tables, and fills them from the rows already in them.
+    """
+    for table, kind in ROLLUP_SOURCES:
+        for statement in rollup_trigger_ddl(conn.dialect.name, table, kind):
+            conn.execute(text(statement))
+    rebuild_rollups(conn)
+
+
+def _sum_totals(session: Session, model, key, start: date, end: date) -> Dict[str, float]:
+    if start >= end:
+        return {column: 0 for column in TOTAL_COLUMNS}
+    statement = (select(*(func.coalesce(func.sum(getattr(model, column)), 0).label(column) for column in TOTAL_COLUMNS))
+                 .where(key >= start, key < end))
+    return dict(session.execute(statement).one()._mapping)
+
+
+def summarize(session: Session, start: date, end: date) -> Dict[str, float]:
+    """
+    Gets the totals of the transactions from start to end, both included. The months in between
+    are read whole from monthly_totals and only the days before and after them from daily_totals,
+    so it reads at most a couple of months of days however long the range or the history is.
+    """
+    after_end = end + timedelta(days=1)
+    first_month = start if start.day == 1 else (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+    last_month = after_end.replace(day=1)
+    if first_month >= last_month:
+        parts = [_sum_totals(session, DailyTotal, DailyTotal.day, start, after_end)]
+    else:
+        parts = [
+            _sum_totals(session, DailyTotal, DailyTotal.day, start, first_month),
+            _sum_totals(session, MonthlyTotal, MonthlyTotal.month, first_month, last_month),
+            _sum_totals(session, DailyTotal, DailyTotal.day, last_month, after_end),
+        ]
+    return {column: sum(part[column] for part in parts) for column in TOTAL_COLUMNS}
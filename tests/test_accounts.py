@@ -0,0 +1,37 @@
+import os
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from src.accounts import load_accounts
+
+
+class TestLoadAccounts(unittest.TestCase):
+    def load(self, entries):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "accounts.json"
+            path.write_text(json.dumps(entries))
+            return load_accounts(path)
+
+    @patch.dict(os.environ, {"IMAP_SERVER": "imap.gmail.com", "WORK_PASSWORD": "secret"})
+    def test_defaults(self):
+        accounts = self.load([
+            {"id": "personal", "email": "me@gmail.com", "password": "pw", "max_per_minute": 600},
+            {"id": "work", "email": "me@work.com", "password_env": "WORK_PASSWORD", "imap_server": "imap.work.com",
+             "imap_ssl": False, "connections": 2},
+        ])
+
+        self.assertEqual(accounts[0], {"id": "personal", "email": "me@gmail.com", "password": "pw", "imap_server": "imap.gmail.com",
+                                       "imap_port": 993, "imap_ssl": True, "connections": 1, "max_per_minute": 600})
+        self.assertEqual((accounts[1]["password"], accounts[1]["imap_port"], accounts[1]["connections"]), ("secret", 143, 2))
+
+    def test_invalid(self):
+        self.assertIsNone(self.load([{"id": "personal"}]))
+        self.assertIsNone(self.load([{"id": "a", "email": "me@gmail.com"}, {"id": "b", "email": "me@gmail.com"}]))
+        self.assertIsNone(load_accounts(Path("/nonexistent/accounts.json")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from benchmarks.fake_imap import FakeIMAPServer, SyntheticAlerts, alert_emails
+from src.aioengine import ingest
+from src.aioimap import connect_mailbox, fetch_alerts
+from src.extract import extract_alert_text
+from src.main import classify_and_parse_alerts, to_raw_alert
+from src.metrics import Metrics
+from storage.apis import get_checkpoint_async
+from storage.base import Base, async_database_url
+from storage.models import CreditTransaction, DebitTransaction
+
+
+class FakeAsyncRedis:
+    """
+    The two hash commands checkpoints were kept with before they moved to the db, kept in a dict.
+    """
+    def __init__(self):
+        self.hashes = {}
+
+    async def hgetall(self, key):
+        return {k.encode(): str(v).encode() for k, v in self.hashes.get(key, {}).items()}
+
+    async def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(mapping)
+
+
+class TestAsyncDatabaseUrl(unittest.TestCase):
+    def test_async_database_url(self):
+        self.assertEqual(async_database_url("postgresql+psycopg2://kuda:pw@localhost/kuda"), "postgresql+asyncpg://kuda:pw@localhost/kuda")
+        self.assertEqual(async_database_url("sqlite:///kuda.db"), "sqlite+aiosqlite:///kuda.db")
+
+
+@patch.dict(os.environ, {"KUDA": "no-reply@kuda.com"})
+class TestAsyncEngine(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = patch.dict(os.environ, {"ARCHIVE_DIR": tmp.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.server = await FakeIMAPServer(alert_emails(30)).start()
+        self.addAsyncCleanup(self.server.close)
+        self.db = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        self.addAsyncCleanup(self.db.dispose)
+        async with self.db.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session_maker = async_sessionmaker(self.db)
+        self.r = FakeAsyncRedis()
+
+    def connect(self):
+        return connect_mailbox(self.server.host, "me@gmail.com", "pw", port=self.server.port, use_ssl=False)
+
+    async def ingest(self, **kwargs):
+        return await ingest(self.connect, self.r, self.session_maker, "me@gmail.com",
+                            to_raw_alert, classify_and_parse_alerts, **kwargs)
+
+    async def count(self, model):
+        async with self.session_maker() as session:
+            return await session.scalar(select(func.count()).select_from(model))
+
+    async def test_fetch_alerts(self):
+        client = await self.connect()
+        self.addAsyncCleanup(client.logout)
+
+        messages = await fetch_alerts(client, ["3", "1"], body_range=4096)
+        self.assertEqual([message.uid for message in messages], ["1", "3"])
+        self.assertEqual(extract_alert_text(messages[0].html), "John0 Doe just sent you ₦25,000.00 - Rent. Love, Kuda.")
+
+    async def test_search_replies_longer_than_a_stream_line(self):
+        # 15000 uids make a single SEARCH line of about 90KB, over asyncio's 64KB default.
+        server = await FakeIMAPServer(SyntheticAlerts(15000, pool_size=4)).start()
+        self.addAsyncCleanup(server.close)
+        connect = lambda: connect_mailbox(server.host, "me@gmail.com", "pw", port=server.port, use_ssl=False)
+
+        counts = await ingest(connect, self.r, self.session_maker, "me@gmail.com", to_raw_alert, classify_and_parse_alerts, n=10)
+        self.assertEqual((counts["processed"], counts["last_uid"]), (10, 10))
+
+    async def test_ingest(self):
+        counts = await self.ingest(connections=3, batch_size=7, shard_size=4, chunk_size=3)
+
+        self.assertEqual(counts, {"processed": 30, "debit": 15, "credit": 15, "invalid": 0, "last_uid": 30})
+        self.assertEqual((await self.count(DebitTransaction), await self.count(CreditTransaction)), (15, 15))
+        self.assertEqual(await get_checkpoint_async(self.session_maker, "sync:me@gmail.com:INBOX"), {"uidvalidity": 1, "last_uid": 30})
+
+    async def test_rows_are_tagged_with_the_account(self):
+        await self.ingest(n=4, account_id="personal")
+        # the same alerts reaching a second account are transactions of that account too.
+        await ingest(self.connect, self.r, self.session_maker, "me@work.com", to_raw_alert, classify_and_parse_alerts,
+                     n=4, account_id="work")
+
+        async with self.session_maker() as session:
+            account_ids = (await session.scalars(select(DebitTransaction.account_id))).all()
+        self.assertEqual(sorted(account_ids), ["personal", "personal", "work", "work"])
+
+    async def test_ingest_metrics(self):
+        metrics = Metrics()
+        await self.ingest(connections=2, batch_size=10, shard_size=8, metrics=metrics)
+
+        counts = {stage: sum(histogram.counts) for stage, histogram in metrics.stages.items()}
+        self.assertEqual(counts, {"fetch": 4, "extract": 30, "classify": 30, "parse": 30, "write": 2})
+        self.assertIn("parsed", metrics.queues)
+
+    async def test_resumes_from_checkpoint(self):
+        await self.ingest(n=10)
+        for message in alert_emails(2, start=30):
+            self.server.append(message)
+
+        counts = await self.ingest()
+        self.assertEqual((counts["processed"], counts["last_uid"]), (22, 32))
+        self.assertEqual(await self.count(DebitTransaction) + await self.count(CreditTransaction), 32)
+
+    async def test_resumes_after_a_crash(self):
+        parsed = []
+
+        def crash_after_two_chunks(raw_alerts):
+            if len(parsed) == 2:
+                raise RuntimeError("killed")
+            parsed.append(raw_alerts)
+            return classify_and_parse_alerts(raw_alerts)
+
+        with self.assertRaises(RuntimeError):
+            await ingest(self.connect, self.r, self.session_maker, "me@gmail.com", to_raw_alert, crash_after_two_chunks,
+                         chunk_size=5, checkpoint_every=5)
+        # every chunk parsed before the crash was committed with its checkpoint.
+        checkpoint = await get_checkpoint_async(self.session_maker, "sync:me@gmail.com:INBOX")
+        self.assertEqual(checkpoint["last_uid"], 10)
+        self.assertEqual(await self.count(DebitTransaction) + await self.count(CreditTransaction), 10)
+
+        counts = await self.ingest()
+        self.assertEqual((counts["processed"], counts["last_uid"]), (20, 30))
+        self.assertEqual(await self.count(DebitTransaction) + await self.count(CreditTransaction), 30)
+
+    async def test_resumes_from_a_redis_checkpoint(self):
+        self.r.hashes["sync:me@gmail.com:INBOX"] = {"uidvalidity": 1, "last_uid": 25}
+
+        counts = await self.ingest()
+        self.assertEqual((counts["processed"], counts["last_uid"]), (5, 30))
+
+
+if __name__ == "__main__":
+    unittest.main()
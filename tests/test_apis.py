@@ -0,0 +1,220 @@
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+from sqlalchemy import create_engine, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.orm import sessionmaker
+
+from storage.base import Base
+from storage.models import CreditTransaction, DebitTransaction, SkippedTransaction
+from storage.apis import (
+    CopyStream,
+    copy_debit_trxns,
+    get_checkpoint,
+    get_checkpoint_async,
+    insert_ignoring_duplicates,
+    replace_trxns,
+    write_credit_trxn,
+    write_credit_trxns,
+    write_debit_trxn,
+    write_debit_trxns,
+    write_trxns,
+    write_trxns_async,
+)
+
+
+def debit(amount, source_key=None, **metadata):
+    return {"date_of_transaction": datetime(2026, 1, 2), "amount": amount, "source_key": source_key, "debit_metadata": metadata}
+
+
+def credit(amount, source_key=None, **metadata):
+    return {"date_of_transaction": datetime(2026, 1, 2), "amount": amount, "source_key": source_key, "credit_metadata": metadata}
+
+
+class StorageTestCase(unittest.TestCase):
+    """
+    Runs storage.apis against a throwaway in-memory sqlite database.
+    """
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        patcher = patch("storage.apis.Session", self.Session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.engine.dispose)
+
+    def rows(self, model):
+        with self.Session() as session:
+            return session.scalars(select(model).order_by(model.amount)).all()
+
+
+class TestWriteTrxn(StorageTestCase):
+    def test_write_debit_trxn(self):
+        write_debit_trxn(debit(500, airtime=True, network="mtn", phone_number="08031234567"))
+
+        rows = self.rows(DebitTransaction)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((rows[0].amount, rows[0].airtime, rows[0].network, rows[0].transfer), (500, True, "mtn", None))
+
+    def test_write_credit_trxn(self):
+        write_credit_trxn(credit(1000, transfer=True, sender="john doe", narration=""))
+
+        rows = self.rows(CreditTransaction)
+        self.assertEqual((rows[0].amount, rows[0].transfer, rows[0].sender), (1000, True, "john doe"))
+
+
+class TestWriteTrxns(StorageTestCase):
+    def test_write_debit_trxns_in_batches(self):
+        write_debit_trxns([debit(i, point_of_sale=True) for i in range(1, 8)], batch_size=3)
+
+        rows = self.rows(DebitTransaction)
+        self.assertEqual([row.amount for row in rows], [1, 2, 3, 4, 5, 6, 7])
+        self.assertTrue(all(row.point_of_sale and row.id and row.created_at for row in rows))
+
+    def test_write_credit_trxns(self):
+        write_credit_trxns([credit(1, reversal=True), credit(2, from_savings=True, savings_account="rent")])
+
+        rows = self.rows(CreditTransaction)
+        self.assertEqual([(row.reversal, row.savings_account) for row in rows], [(True, None), (None, "rent")])
+
+    def test_bad_row_is_isolated(self):
+        # the 11 digit limit on phone_number isn't enforced by sqlite, so a missing amount breaks the batch instead.
+        trxns = [debit(1), debit(None), debit(3)]
+        write_debit_trxns(trxns, batch_size=10)
+
+        self.assertEqual([row.amount for row in self.rows(DebitTransaction)], [1, 3])
+
+    def test_duplicate_source_keys_are_skipped(self):
+        write_debit_trxns([debit(1, source_key="a"), debit(2, source_key="b")])
+        write_debit_trxns([debit(1, source_key="a"), debit(3, source_key="c"), debit(3, source_key="c")])
+        write_debit_trxn(debit(2, source_key="b"))
+
+        self.assertEqual([row.source_key for row in self.rows(DebitTransaction)], ["a", "b", "c"])
+
+    def test_no_trxns(self):
+        write_credit_trxns([])
+        self.assertEqual(self.rows(CreditTransaction), [])
+
+
+class TestCheckpoints(StorageTestCase):
+    def test_checkpoint_is_committed_with_the_rows(self):
+        self.assertIsNone(get_checkpoint("sync:me@gmail.com:INBOX"))
+        write_trxns([debit(1)], [credit(2)], checkpoint={"key": "sync:me@gmail.com:INBOX", "uidvalidity": 7, "last_uid": 2})
+        write_trxns([], [credit(3)], checkpoint={"key": "sync:me@gmail.com:INBOX", "uidvalidity": 7, "last_uid": 3})
+
+        self.assertEqual(get_checkpoint("sync:me@gmail.com:INBOX"), {"uidvalidity": 7, "last_uid": 3})
+        self.assertEqual(len(self.rows(DebitTransaction)) + len(self.rows(CreditTransaction)), 3)
+
+    def test_a_row_that_cant_be_written_is_skipped_and_recorded(self):
+        write_trxns([debit(1, "a"), debit(None, "b")], [], checkpoint={"key": "sync:me@gmail.com:INBOX", "uidvalidity": 7, "last_uid": 2})
+
+        self.assertEqual([row.amount for row in self.rows(DebitTransaction)], [1])
+        self.assertEqual([(row.type, row.source_key) for row in self.rows(SkippedTransaction)], [("debit", "b")])
+        self.assertEqual(get_checkpoint("sync:me@gmail.com:INBOX"), {"uidvalidity": 7, "last_uid": 2})
+
+    def test_other_errors_leave_the_checkpoint_where_it_was(self):
+        write_trxns([], [credit(1, "a")], checkpoint={"key": "sync:me@gmail.com:INBOX", "uidvalidity": 7, "last_uid": 1})
+        original = insert_ignoring_duplicates
+
+        def flaky(model, dialect_name):
+            # the batch fails on the bad row, then the connection drops while writing them one at a time.
+            if model is CreditTransaction:
+                raise OperationalError("INSERT", {}, Exception("server closed the connection"))
+            return original(model, dialect_name)
+
+        with patch("storage.apis.insert_ignoring_duplicates", side_effect=flaky):
+            with self.assertRaises(OperationalError):
+                write_trxns([debit(2, "b"), debit(None, "c")], [credit(3, "d")],
+                            checkpoint={"key": "sync:me@gmail.com:INBOX", "uidvalidity": 7, "last_uid": 4})
+
+        self.assertEqual(get_checkpoint("sync:me@gmail.com:INBOX"), {"uidvalidity": 7, "last_uid": 1})
+        self.assertEqual(self.rows(DebitTransaction), [])
+        self.assertEqual(self.rows(SkippedTransaction), [])
+
+
+class TestCheckpointsAsync(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.db = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        self.addAsyncCleanup(self.db.dispose)
+        async with self.db.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session_maker = async_sessionmaker(self.db)
+
+    async def test_a_row_that_cant_be_written_is_skipped_and_recorded(self):
+        await write_trxns_async(self.session_maker, [debit(1, "a"), debit(None, "b")], [],
+                                checkpoint={"key": "sync:me@gmail.com:INBOX", "uidvalidity": 7, "last_uid": 2})
+
+        async with self.session_maker() as session:
+            self.assertEqual((await session.scalars(select(DebitTransaction.amount))).all(), [1])
+            self.assertEqual((await session.scalars(select(SkippedTransaction.source_key))).all(), ["b"])
+        self.assertEqual(await get_checkpoint_async(self.session_maker, "sync:me@gmail.com:INBOX"), {"uidvalidity": 7, "last_uid": 2})
+
+    async def test_other_errors_are_raised(self):
+        with patch("storage.apis.ensure_partitions_async", side_effect=OperationalError("SELECT", {}, Exception("server closed the connection"))):
+            with self.assertRaises(OperationalError):
+                await write_trxns_async(self.session_maker, [debit(1, "a")], [],
+                                        checkpoint={"key": "sync:me@gmail.com:INBOX", "uidvalidity": 7, "last_uid": 2})
+        self.assertIsNone(await get_checkpoint_async(self.session_maker, "sync:me@gmail.com:INBOX"))
+
+
+class TestReplaceTrxns(StorageTestCase):
+    def test_reparsed_trxns_replace_old_rows(self):
+        write_debit_trxns([debit(1, source_key="a"), debit(2, source_key="b"), debit(3)])
+        replace_trxns([debit(10, source_key="a", transfer=True, receiver="jane", narration="rent")], [credit(2, source_key="b", reversal=True)])
+
+        self.assertEqual([(row.amount, row.transfer) for row in self.rows(DebitTransaction)], [(3, None), (10, True)])
+        self.assertEqual([(row.source_key, row.reversal) for row in self.rows(CreditTransaction)], [("b", True)])
+
+    def test_a_row_that_cant_be_written_is_skipped_and_recorded(self):
+        write_debit_trxns([debit(1, source_key="a"), debit(2, source_key="b")])
+        replace_trxns([debit(10, source_key="a"), debit(None, source_key="b")], [])
+
+        self.assertEqual([(row.source_key, row.amount) for row in self.rows(DebitTransaction)], [("a", 10)])
+        self.assertEqual([(row.type, row.source_key) for row in self.rows(SkippedTransaction)], [("debit", "b")])
+
+    def test_other_errors_are_raised_with_nothing_replaced(self):
+        write_debit_trxns([debit(1, source_key="a")])
+        with patch("storage.apis.insert_ignoring_duplicates", side_effect=OperationalError("INSERT", {}, Exception("database is locked"))):
+            with self.assertRaises(OperationalError):
+                replace_trxns([debit(10, source_key="a")], [])
+
+        self.assertEqual([(row.source_key, row.amount) for row in self.rows(DebitTransaction)], [("a", 1)])
+
+    def test_rows_of_alerts_that_are_no_longer_transactions_are_removed(self):
+        write_debit_trxns([debit(1, source_key="a"), debit(2, source_key="b")])
+        replace_trxns([debit(3, source_key="b")], [], source_keys=["a", "b"])
+
+        self.assertEqual([(row.source_key, row.amount) for row in self.rows(DebitTransaction)], [("b", 3)])
+
+
+class TestCopyStream(unittest.TestCase):
+    def test_rows_are_escaped(self):
+        rows = [
+            {"amount": 1.5, "date_of_transaction": datetime(2026, 1, 2, 3, 4), "sender": "a\tb\\c\nd", "reversal": None},
+            {"amount": 2.0, "date_of_transaction": datetime(2026, 1, 3), "sender": "", "reversal": True},
+        ]
+        stream = CopyStream(rows, ["amount", "date_of_transaction", "sender", "reversal"])
+        self.assertEqual(stream.read(), (
+            "1.5\t2026-01-02 03:04:00\ta\\tb\\\\c\\nd\t\\N\n"
+            "2.0\t2026-01-03 00:00:00\t\tt\n"
+        ))
+
+    def test_read_in_chunks(self):
+        rows = [{"amount": i} for i in range(100)]
+        stream = CopyStream(rows, ["amount"])
+        chunks = iter(lambda: stream.read(7), "")
+        self.assertEqual("".join(chunks), "".join(f"{i}\n" for i in range(100)))
+
+
+class TestCopyTrxns(StorageTestCase):
+    def test_falls_back_to_inserts_off_postgres(self):
+        copy_debit_trxns([debit(1, transfer=True, receiver="jane", narration="rent"), debit(2)])
+
+        self.assertEqual([(row.amount, row.receiver) for row in self.rows(DebitTransaction)], [(1, "jane"), (2, None)])
+
+
+if __name__ == "__main__":
+    unittest.main()
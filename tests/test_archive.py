@@ -0,0 +1,140 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from src.archive import INDEX_ENTRY, ArchiveWriter, archive_dir, archive_dirs, read_archive
+from src.fetcher import AlertMessage
+from src.main import reparse_archive
+from storage.apis import write_debit_trxns
+from storage.models import DebitTransaction
+from tests.test_apis import StorageTestCase, debit
+from utils.utils import get_account_source_key, get_source_key
+
+
+def alert(uid):
+    return AlertMessage(str(uid), datetime(2026, 1, 2, 10, uid % 60, tzinfo=timezone.utc), f"<{uid}@kuda.com>",
+                        f"<html><span>You just sent ₦{uid} to John - Rent. Love</span></html>")
+
+
+class ArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name) / "archive"
+
+
+class TestArchive(ArchiveTestCase):
+    def test_read_back_in_uid_order(self):
+        writer = ArchiveWriter(self.path)
+        list(writer.archive(alert(uid) for uid in [5, 3, 9]))
+        writer.close()
+
+        res = list(read_archive(self.path))
+        self.assertEqual([message.uid for message in res], ["3", "5", "9"])
+        self.assertEqual((res[0].date, res[0].message_id, res[0].html), (alert(3).date, "<3@kuda.com>", alert(3).html))
+
+    def test_segments_roll_over(self):
+        writer = ArchiveWriter(self.path, segment_size=300)
+        for uid in range(1, 11):
+            writer.append(alert(uid))
+        writer.close()
+
+        self.assertGreater(len(list(self.path.glob("*.seg"))), 1)
+        self.assertEqual([message.uid for message in read_archive(self.path)], [str(uid) for uid in range(1, 11)])
+
+    def test_archived_uids_are_skipped_after_reopening(self):
+        writer = ArchiveWriter(self.path)
+        writer.append(alert(1))
+        writer.close()
+
+        writer = ArchiveWriter(self.path)
+        writer.append(alert(1))
+        writer.append(alert(2))
+        writer.close()
+
+        self.assertEqual([message.uid for message in read_archive(self.path)], ["1", "2"])
+
+    def test_named_writers_keep_their_own_segments(self):
+        first, second = ArchiveWriter(self.path, name="host-1"), ArchiveWriter(self.path, name="host-2")
+        first.append(alert(1))
+        second.append(alert(2))
+        first.close()
+        second.close()
+
+        writer = ArchiveWriter(self.path)
+        writer.append(alert(3))
+        writer.close()
+
+        self.assertEqual(sorted(segment.name for segment in self.path.glob("*.seg")),
+                         ["000001.seg", "host-1-000001.seg", "host-2-000001.seg"])
+        self.assertEqual([message.uid for message in read_archive(self.path)], ["1", "2", "3"])
+
+    def test_partly_written_alerts_are_ignored(self):
+        writer = ArchiveWriter(self.path)
+        writer.append(alert(1))
+        writer.append(alert(2))
+        writer.close()
+
+        # a crash can leave an index entry half written, or pointing past the end of the segment.
+        segment, index = self.path / "000001.seg", self.path / "000001.idx"
+        with open(segment, "r+b") as f:
+            f.truncate(segment.stat().st_size - 1)
+        with open(index, "ab") as f:
+            f.write(INDEX_ENTRY.pack(3, 0, 10)[:5])
+
+        self.assertEqual([message.uid for message in read_archive(self.path)], ["1"])
+
+
+class TestArchiveDirs(ArchiveTestCase):
+    def test_archive_dirs(self):
+        with patch.dict(os.environ, {"ARCHIVE_DIR": str(self.path)}):
+            for folder, uidvalidity in [("INBOX", 1), ("[Gmail]/All Mail", 7)]:
+                writer = ArchiveWriter(archive_dir("me@gmail.com", folder, uidvalidity))
+                writer.append(alert(1))
+                writer.close()
+
+            self.assertEqual(archive_dirs("me@gmail.com"), [
+                self.path / "me@gmail.com" / "%5BGmail%5D%2FAll%20Mail" / "7",
+                self.path / "me@gmail.com" / "INBOX" / "1",
+            ])
+            self.assertEqual(archive_dirs("you@gmail.com"), [])
+
+
+@patch.dict(os.environ, {"KUDA": "no-reply@kuda.com"})
+class TestReparseArchive(StorageTestCase, ArchiveTestCase):
+    def setUp(self):
+        StorageTestCase.setUp(self)
+        ArchiveTestCase.setUp(self)
+        patcher = patch.dict(os.environ, {"ARCHIVE_DIR": str(self.path)})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # the second alert was once parsed into a transaction, but the parsers no longer see one in it.
+        no_longer_a_trxn = AlertMessage("2", alert(2).date, "<2@kuda.com>", "<html><span>Your statement is ready. Love</span></html>")
+        writer = ArchiveWriter(archive_dir("me@gmail.com", "INBOX", 1))
+        list(writer.archive([alert(1), no_longer_a_trxn]))
+        writer.close()
+
+    def keys(self):
+        return [(row.source_key, row.account_id) for row in self.rows(DebitTransaction)]
+
+    def test_rows_of_alerts_that_no_longer_parse_are_removed(self):
+        write_debit_trxns([debit(2, get_source_key("<2@kuda.com>", "", ""))])
+        with patch.dict(os.environ, {"EMAIL": "me@gmail.com"}):
+            reparse_archive()
+
+        self.assertEqual(self.keys(), [(get_source_key("<1@kuda.com>", "", ""), None)])
+
+    def test_rows_of_an_account_are_scoped_to_it(self):
+        scoped = get_account_source_key(get_source_key("<2@kuda.com>", "", ""), "personal")
+        write_debit_trxns([dict(debit(2, scoped), account_id="personal")])
+        reparse_archive(account={"id": "personal", "email": "me@gmail.com"})
+
+        self.assertEqual(self.keys(), [(get_account_source_key(get_source_key("<1@kuda.com>", "", ""), "personal"), "personal")])
+
+
+if __name__ == "__main__":
+    unittest.main()
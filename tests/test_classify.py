@@ -0,0 +1,71 @@
+import unittest
+from datetime import datetime
+
+from src.classify import classify_and_parse_transaction, classify_statement, scan_statement
+
+
+class TestScanStatement(unittest.TestCase):
+    def test_scan_statement(self):
+        phrases, amount = scan_statement("you just sent ₦1,000.00 to john doe - rent. love")
+        self.assertEqual(phrases, {"you just sent": 0})
+        self.assertEqual(amount, "1,000.00")
+
+    def test_first_amount(self):
+        self.assertEqual(scan_statement("we moved ₦1,000 and then ₦2,000")[1], "1,000")
+
+    def test_overlapping_phrases(self):
+        phrases, _ = scan_statement("you just sent you ₦3")
+        self.assertEqual(phrases, {"you just sent": 0, "just sent you": 4})
+
+    def test_no_phrases(self):
+        self.assertEqual(scan_statement("your statement is ready"), ({}, None))
+
+
+class TestClassifyStatement(unittest.TestCase):
+    def test_debit_phrases_win(self):
+        self.assertEqual(classify_statement(scan_statement("bob just sent you ₦5 and you just sent ₦4")[0]), "debit")
+
+    def test_credit(self):
+        self.assertEqual(classify_statement(scan_statement("you took out ₦5 from your rent savings")[0]), "credit")
+
+    def test_invalid(self):
+        self.assertEqual(classify_statement(scan_statement("your statement is ready")[0]), None)
+
+
+class TestClassifyAndParseTransaction(unittest.TestCase):
+    def test_debit_with_several_rules(self):
+        transaction = {
+            "trxn_statement": "You just recharged MTN NG VTU 08031234567 - Airtime with ₦500.00 and we moved ₦20 to savings",
+            "date": "2026-01-02"
+        }
+        self.assertEqual(classify_and_parse_transaction(transaction), ("debit", {
+            "date_of_transaction": datetime(2026, 1, 2),
+            "amount": 500.0,
+            "debit_metadata": {"airtime": True, "network": "mtn ng vtu", "phone_number": "08031234567", "savings": True},
+        }))
+
+    def test_credit(self):
+        transaction = {"trxn_statement": "You took out ₦1,000,000 from your personal savings.", "date": "2026-01-02"}
+        self.assertEqual(classify_and_parse_transaction(transaction), ("credit", {
+            "date_of_transaction": datetime(2026, 1, 2),
+            "amount": 1000000.0,
+            "credit_metadata": {"from_savings": True, "savings_account": "personal"},
+        }))
+
+    def test_invalid(self):
+        self.assertEqual(classify_and_parse_transaction({"trxn_statement": "Hello", "date": "2026-01-02"}), (None, None))
+
+    def test_stages_are_timed(self):
+        stages = []
+        classify_and_parse_transaction({"trxn_statement": "You took out ₦1,000 from your personal savings.", "date": "2026-01-02"},
+                                       lambda stage, seconds: stages.append(stage))
+        classify_and_parse_transaction({"trxn_statement": "Hello", "date": "2026-01-02"}, lambda stage, seconds: stages.append(stage))
+        self.assertEqual(stages, ["classify", "parse", "classify"])
+
+    def test_missing_amount(self):
+        with self.assertRaises(ValueError):
+            classify_and_parse_transaction({"trxn_statement": "You just sent money", "date": "2026-01-02"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+from benchmarks.bench_parsers import check_baseline
+from benchmarks.corpus import TEMPLATES, alert_corpus, alert_statements
+from src.extract import extract_alert_text
+from src.main import parse_credit_transaction, parse_debit_transaction
+from utils.utils import get_amount
+
+
+# the metadata flag each template's parse rule sets.
+FLAGS = {
+    "transfer_in": "transfer",
+    "transfer_out": "transfer",
+    "airtime": "airtime",
+    "card_online": "online_payment",
+    "card_pos": "point_of_sale",
+    "spend_and_save": "savings",
+    "savings_withdrawal": "from_savings",
+    "reversal": "reversal",
+}
+
+
+class TestCorpus(unittest.TestCase):
+    def test_reproducible(self):
+        self.assertEqual(alert_statements(20, seed=7), alert_statements(20, seed=7))
+        self.assertNotEqual(alert_statements(20, seed=7), alert_statements(20, seed=8))
+
+    def test_every_template_parses(self):
+        corpus = alert_corpus(len(TEMPLATES) * 3, seed=1)
+        self.assertEqual({template for template, _ in corpus}, set(TEMPLATES))
+
+        for template, html in corpus:
+            trxn_type = TEMPLATES[template][0]
+            statement = extract_alert_text(html)
+            parse = parse_debit_transaction if trxn_type == "debit" else parse_credit_transaction
+            trxn = parse({"trxn_statement": statement, "date": "2026-01-02"})
+
+            self.assertTrue(trxn[f"{trxn_type}_metadata"][FLAGS[template]], statement)
+            self.assertEqual(trxn["amount"], float(get_amount(statement.lower()).replace(",", "")))
+
+
+class TestCheckBaseline(unittest.TestCase):
+    def test_check_baseline(self):
+        baseline = {"get_amount": 1000.0, "parse_debit": 100.0, "removed": 5.0}
+        self.assertEqual(check_baseline({"get_amount": 800.0, "parse_debit": 95.0}, baseline, 0.15), ["get_amount"])
+
+
+if __name__ == "__main__":
+    unittest.main()
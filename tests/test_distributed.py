@@ -0,0 +1,145 @@
+import os
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import patch
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from benchmarks.fake_imap import FakeIMAPServer, alert_emails
+from src.aioimap import connect_mailbox
+from src.distributed import GROUP, coordinate, dead_letter_key, publish, stream_key, work
+from src.main import classify_and_parse_alerts, to_raw_alert
+from storage.apis import get_checkpoint_async
+from storage.partitions import ensure_partitions_async
+from storage.base import Base
+from storage.models import CreditTransaction, DebitTransaction
+
+try:
+    from fakeredis import aioredis as fakeredis
+except ImportError:
+    fakeredis = None
+
+
+@unittest.skipUnless(fakeredis, "needs fakeredis for redis streams")
+@patch.dict(os.environ, {"KUDA": "no-reply@kuda.com"})
+class TestDistributed(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = patch.dict(os.environ, {"ARCHIVE_DIR": tmp.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.server = await FakeIMAPServer(alert_emails(30)).start()
+        self.addAsyncCleanup(self.server.close)
+        # a file, so the workers and the test don't share one connection.
+        self.db = create_async_engine(f"sqlite+aiosqlite:///{tmp.name}/kuda.db")
+        self.addAsyncCleanup(self.db.dispose)
+        async with self.db.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session_maker = async_sessionmaker(self.db)
+        self.r = fakeredis.FakeRedis()
+        self.addAsyncCleanup(self.r.aclose)
+        self.stop = asyncio.Event()
+        self.stream = stream_key("me@gmail.com")
+
+    def connect(self):
+        return connect_mailbox(self.server.host, "me@gmail.com", "pw", port=self.server.port, use_ssl=False)
+
+    def start_worker(self, consumer, process_chunk=classify_and_parse_alerts, **kwargs):
+        task = asyncio.create_task(work(self.connect, self.r, self.session_maker, "me@gmail.com", to_raw_alert,
+                                        process_chunk, consumer=consumer, block=0.05, stop=self.stop, **kwargs))
+        self.addAsyncCleanup(asyncio.wait_for, task, 5)
+        self.addCleanup(self.stop.set)
+        return task
+
+    async def coordinate(self, **kwargs):
+        return await asyncio.wait_for(coordinate(self.connect, self.r, self.session_maker, "me@gmail.com",
+                                                 poll=0.05, **kwargs), 10)
+
+    async def count(self):
+        async with self.session_maker() as session:
+            return (await session.scalar(select(func.count()).select_from(DebitTransaction))
+                    + await session.scalar(select(func.count()).select_from(CreditTransaction)))
+
+    async def test_workers_share_the_ranges(self):
+        first, second = self.start_worker("first"), self.start_worker("second")
+
+        counts = await self.coordinate(range_size=4)
+        self.assertEqual(counts, {"processed": 30, "debit": 15, "credit": 15, "invalid": 0, "failed": 0, "last_uid": 30})
+        self.assertEqual(await self.count(), 30)
+        self.assertEqual(await get_checkpoint_async(self.session_maker, "sync:me@gmail.com:INBOX"), {"uidvalidity": 1, "last_uid": 30})
+        # the finished ranges are removed from the stream.
+        self.assertEqual(await self.r.xlen(self.stream), 0)
+
+        self.stop.set()
+        totals = [await asyncio.wait_for(task, 5) for task in (first, second)]
+        self.assertEqual(sum(total["processed"] for total in totals), 30)
+        self.assertTrue(all(total["processed"] for total in totals))
+
+    async def test_ranges_of_a_crashed_worker_are_reclaimed(self):
+        await publish(self.r, "me@gmail.com", "INBOX", 1, [str(uid) for uid in range(1, 31)], range_size=10)
+        # a worker that took a range and died before acknowledging it.
+        await self.r.xreadgroup(GROUP, "crashed", {self.stream: ">"}, count=1)
+
+        self.start_worker("survivor", reclaim_after=0)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + 5
+        while await self.count() != 30 and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        self.assertEqual(await self.count(), 30)
+        self.assertFalse(await self.r.xpending_range(self.stream, GROUP, min="-", max="+", count=10))
+
+    async def test_failing_ranges_are_dead_lettered(self):
+        def fail_on_uid_5(raw_alerts):
+            if any(uid == "5" for uid, *_ in raw_alerts):
+                raise RuntimeError("unparseable")
+            return classify_and_parse_alerts(raw_alerts)
+
+        self.start_worker("worker", fail_on_uid_5, reclaim_after=0, max_deliveries=2)
+        with patch("src.distributed.MAX_BACKOFF", 0):
+            counts = await self.coordinate(range_size=4)
+
+        self.assertEqual((counts["processed"], counts["failed"]), (26, 1))
+        [(_, fields)] = await self.r.xrange(dead_letter_key(self.stream))
+        self.assertEqual(fields[b"uids"], b"5,6,7,8")
+        # the checkpoint stays before the failed range, so the next run publishes it again.
+        self.assertEqual((await get_checkpoint_async(self.session_maker, "sync:me@gmail.com:INBOX"))["last_uid"], 4)
+
+    async def test_ranges_that_fail_to_write_are_retried(self):
+        original = ensure_partitions_async
+        calls = []
+
+        async def drop_the_first_write(bind, tables):
+            calls.append(tables)
+            if len(calls) == 1:
+                raise OperationalError("INSERT", {}, Exception("server closed the connection"))
+            return await original(bind, tables)
+
+        self.start_worker("worker", reclaim_after=0)
+        with patch("storage.apis.ensure_partitions_async", side_effect=drop_the_first_write), patch("src.distributed.MAX_BACKOFF", 0):
+            counts = await self.coordinate(range_size=10)
+
+        # the range whose write failed was left pending, then written when it was reclaimed.
+        self.assertEqual((counts["processed"], counts["failed"]), (30, 0))
+        self.assertEqual(await self.count(), 30)
+        self.assertEqual(await self.r.xlen(dead_letter_key(self.stream)), 0)
+
+    async def test_stale_ranges_are_dead_lettered(self):
+        await publish(self.r, "me@gmail.com", "INBOX", 7, ["1", "2"])
+        task = self.start_worker("worker")
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + 5
+        while not await self.r.xlen(dead_letter_key(self.stream)) and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        self.stop.set()
+        self.assertEqual((await asyncio.wait_for(task, 5))["processed"], 0)
+        [(_, fields)] = await self.r.xrange(dead_letter_key(self.stream))
+        self.assertIn(b"UIDVALIDITY 1", fields[b"reason"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+from unittest.mock import patch
+from bs4 import BeautifulSoup
+
+from src.extract import extract_alert_text, find_first_span_text
+
+
+def beautifulsoup_span_text(html):
+    return BeautifulSoup(html, 'html.parser').span.get_text()
+
+
+class TestFindFirstSpanText(unittest.TestCase):
+    def assertSameAsBeautifulSoup(self, html):
+        self.assertEqual(find_first_span_text(html), beautifulsoup_span_text(html))
+
+    def test_simple_span(self):
+        self.assertSameAsBeautifulSoup("<html><body><span>John Doe just sent you ₦1,000</span></body></html>")
+
+    def test_entities(self):
+        html = "<span>You tried to send &#8358;1,000 &amp; it didn&#39;t go through so we&#39;ve reversed it.</span>"
+        self.assertSameAsBeautifulSoup(html)
+        self.assertEqual(find_first_span_text(html), "You tried to send ₦1,000 & it didn't go through so we've reversed it.")
+
+    def test_attributes_and_upper_case(self):
+        self.assertSameAsBeautifulSoup('<td><SPAN style="font-size:16px" class="x">You just sent ₦500</SPAN></td>')
+
+    def test_nested_tags(self):
+        self.assertSameAsBeautifulSoup("<span>You just sent <b>₦500</b> to <span>Jane</span> Doe<br> - Lunch</span><span>no</span>")
+
+    def test_skips_comments_styles_and_scripts(self):
+        html = (
+            "<head><style>p { content: '<span>style</span>'; }</style>"
+            "<script>var s = '<span>script</span>';</script></head>"
+            "<body><!--[if mso]><span>Kuda Bank</span><![endif]--><span>We moved ₦1,000</span></body>"
+        )
+        self.assertSameAsBeautifulSoup(html)
+        self.assertEqual(find_first_span_text(html), "We moved ₦1,000")
+
+    def test_comment_inside_span(self):
+        self.assertSameAsBeautifulSoup("<span>You took out <!-- amount -->₦1,000</span>")
+
+    def test_no_span(self):
+        self.assertEqual(find_first_span_text("<html><body><p>hello</p></body></html>"), None)
+
+    def test_unclosed_span(self):
+        self.assertEqual(find_first_span_text("<html><body><span>hello</body></html>"), None)
+
+
+class TestExtractAlertText(unittest.TestCase):
+    @patch("src.extract.BeautifulSoup")
+    def test_fast_path(self, soup):
+        self.assertEqual(extract_alert_text("<span>We moved ₦1,000</span>"), "We moved ₦1,000")
+        soup.assert_not_called()
+
+    def test_falls_back_to_beautifulsoup(self):
+        self.assertEqual(extract_alert_text("<html><body><span>We moved ₦1,000</body></html>"), "We moved ₦1,000")
+
+    def test_no_span(self):
+        self.assertEqual(extract_alert_text("<p>hello</p>"), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
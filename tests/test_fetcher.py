@@ -0,0 +1,150 @@
+import quopri
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+from src.fetcher import (
+    AlertMessage,
+    MailBoxPool,
+    decode_part,
+    fetch_alerts,
+    fetch_shard,
+    fetch_sharded,
+    find_html_part,
+    parse_fetch_response,
+    shard_uids,
+)
+
+
+HTML = '<html><head><style>p {}</style></head><body><span>John Doe just sent you ₦1,000 - Rent.</span></body></html>'
+HEADERS = b"Date: Fri, 02 Jan 2026 10:00:00 +0000\r\nMessage-ID: <abc@kuda.com>\r\n\r\n"
+
+# multipart/alternative with the html part second.
+ALTERNATIVE = (
+    b'("text" "plain" ("charset" "utf-8") NIL NIL "7bit" 20 1 NIL NIL NIL NIL)'
+    b'("text" "html" ("charset" "utf-8") NIL NIL "quoted-printable" 120 3 NIL NIL NIL NIL) "alternative" ("boundary" "b1") NIL NIL NIL'
+)
+# multipart/mixed holding the alternative part and a pdf attachment.
+MIXED = (
+    b'(' + ALTERNATIVE + b')'
+    b'("application" "pdf" ("name" "statement.pdf") NIL NIL "base64" 90000 NIL ("attachment" ("filename" "statement.pdf")) NIL NIL) "mixed" ("boundary" "b0") NIL NIL NIL'
+)
+
+
+def fake_fetch_alerts(conn, uids, bulk=100):
+    if conn.broken:
+        raise ConnectionResetError("connection reset")
+    return iter([AlertMessage(uid, None, "", "") for uid in sorted(uids, key=int)])
+
+
+class TestShardUids(unittest.TestCase):
+    def test_shard_uids(self):
+        self.assertEqual(shard_uids(["1", "2", "3", "4", "5"], 2), [["1", "2"], ["3", "4"], ["5"]])
+
+    def test_shard_no_uids(self):
+        self.assertEqual(shard_uids([], 2), [])
+
+
+class TestParseFetchResponse(unittest.TestCase):
+    def test_parse_fetch_response(self):
+        data = [
+            (b'1 (UID 5 BODYSTRUCTURE (' + ALTERNATIVE + b') BODY[HEADER.FIELDS (DATE MESSAGE-ID)] {%d}' % len(HEADERS), HEADERS),
+            b')',
+            b'2 (UID 9 FLAGS (\\Seen))',
+        ]
+        res = parse_fetch_response(data)
+
+        self.assertEqual(set(res), {"5", "9"})
+        self.assertEqual(res["5"]["BODY[HEADER.FIELDS (DATE MESSAGE-ID)]"], HEADERS)
+        self.assertEqual(res["5"]["BODYSTRUCTURE"][1][1], "html")
+        self.assertEqual(res["9"]["FLAGS"], ["\\Seen"])
+
+
+class TestFindHtmlPart(unittest.TestCase):
+    def test_single_part(self):
+        structure = parse_fetch_response([b'1 (UID 1 BODYSTRUCTURE ("text" "html" ("charset" "iso-8859-1") NIL NIL "base64" 400 6 NIL NIL NIL NIL))'])["1"]["BODYSTRUCTURE"]
+        self.assertEqual(find_html_part(structure), ("1", "base64", "iso-8859-1", 400))
+
+    def test_alternative(self):
+        structure = parse_fetch_response([b'1 (UID 1 BODYSTRUCTURE (' + ALTERNATIVE + b'))'])["1"]["BODYSTRUCTURE"]
+        self.assertEqual(find_html_part(structure), ("2", "quoted-printable", "utf-8", 120))
+
+    def test_nested_with_attachment(self):
+        structure = parse_fetch_response([b'1 (UID 1 BODYSTRUCTURE (' + MIXED + b'))'])["1"]["BODYSTRUCTURE"]
+        self.assertEqual(find_html_part(structure), ("1.2", "quoted-printable", "utf-8", 120))
+
+    def test_no_html(self):
+        structure = parse_fetch_response([b'1 (UID 1 BODYSTRUCTURE ("text" "plain" NIL NIL NIL "7bit" 20 1 NIL NIL NIL NIL))'])["1"]["BODYSTRUCTURE"]
+        self.assertEqual(find_html_part(structure), None)
+
+
+class TestDecodePart(unittest.TestCase):
+    def test_decode_truncated_base64(self):
+        self.assertEqual(decode_part(b"PHNwYW4+aGk8L3NwYW4+PC9i\r\nb2R", "base64", "utf-8"), "<span>hi</span></b")
+
+    def test_decode_quoted_printable(self):
+        self.assertEqual(decode_part(b"=E2=82=A61,000", "quoted-printable", "utf-8"), "₦1,000")
+
+
+class TestFetchAlerts(unittest.TestCase):
+    def test_fetch_alerts(self):
+        conn = MagicMock()
+        html = quopri.encodestring(HTML.encode())
+
+        def uid(command, uids, message_parts):
+            if "BODYSTRUCTURE" in message_parts:
+                return "OK", [
+                    (b'2 (UID 12 BODYSTRUCTURE (' + MIXED + b') BODY[HEADER.FIELDS (DATE MESSAGE-ID)] {%d}' % len(HEADERS), HEADERS), b')',
+                    (b'1 (UID 7 BODYSTRUCTURE (' + ALTERNATIVE + b') BODY[HEADER.FIELDS (DATE MESSAGE-ID)] {%d}' % len(HEADERS), HEADERS), b')',
+                ]
+            section = message_parts.split("[")[1].split("]")[0]
+            data = []
+            for idx, uid in enumerate(uids.split(","), start=1):
+                data += [(b'%d (UID %s BODY[%s]<0> {%d}' % (idx, uid.encode(), section.encode(), len(html)), html), b')']
+            return "OK", data
+
+        conn.client.uid.side_effect = uid
+        res = list(fetch_alerts(conn, ["12", "7"]))
+
+        self.assertEqual([trxn.uid for trxn in res], ["7", "12"])
+        self.assertEqual(res[0].date, datetime(2026, 1, 2, 10, 0, tzinfo=timezone.utc))
+        self.assertEqual(res[0].message_id, "<abc@kuda.com>")
+        self.assertIn("<span>John Doe just sent you ₦1,000 - Rent.</span>", res[1].html)
+        requested = [c.args[2] for c in conn.client.uid.call_args_list]
+        self.assertEqual(requested[1:], ["(UID BODY.PEEK[1.2]<0.65536>)", "(UID BODY.PEEK[2]<0.65536>)"])
+
+
+@patch("src.fetcher.fetch_alerts", fake_fetch_alerts)
+class TestFetchSharded(unittest.TestCase):
+    def test_fetch_sharded_is_ordered(self):
+        pool = MailBoxPool(lambda: MagicMock(broken=False), 3)
+        uids = [str(uid) for uid in range(1, 50)]
+
+        res = [trxn.uid for trxn in fetch_sharded(pool, uids, shard_size=4)]
+
+        self.assertEqual(res, uids)
+
+    @patch("src.fetcher.time.sleep")
+    def test_fetch_shard_reconnects_after_failure(self, sleep):
+        broken = MagicMock(broken=True)
+        connect = MagicMock(side_effect=[broken, MagicMock(broken=False)])
+        pool = MailBoxPool(connect, 1)
+
+        res = fetch_shard(pool, ["3", "4"], retries=2, backoff=0.5)
+
+        self.assertEqual([trxn.uid for trxn in res], ["3", "4"])
+        broken.logout.assert_called_once()
+        sleep.assert_called_once_with(0.5)
+
+    @patch("src.fetcher.time.sleep")
+    def test_fetch_shard_gives_up(self, sleep):
+        broken = MagicMock(broken=True)
+        pool = MailBoxPool(lambda: broken, 1)
+
+        with self.assertRaises(ConnectionResetError):
+            fetch_shard(pool, ["3"], retries=2, backoff=1)
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import os
+import unittest
+from unittest.mock import patch
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, insert, select, text
+from sqlalchemy.orm import sessionmaker
+
+from storage.apis import page_statement, replace_trxns, write_trxns
+from storage.base import Base
+from storage.migrations import migrate
+from storage.models import CreditTransaction, DebitTransaction, LedgerTransaction
+from storage.partitions import ensure_partitions
+from tests.test_apis import credit, debit
+from tests.test_partitions import reset_postgres
+from utils.utils import decode_cursor, encode_cursor
+
+START, END = datetime(2026, 1, 1), datetime(2026, 2, 1)
+
+
+class LedgerTestCase(unittest.TestCase):
+    """
+    Runs storage.apis against a throwaway database with the ledger triggers, sqlite unless url is set.
+    """
+    url = "sqlite://"
+
+    def setUp(self):
+        self.engine = create_engine(self.url)
+        self.addCleanup(self.engine.dispose)
+        if self.engine.dialect.name == "postgresql":
+            reset_postgres(self.engine)
+        migrate(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        for target, value in (("storage.apis.Session", self.Session), ("storage.apis.engine", self.engine)):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def ledger(self):
+        with self.Session() as session:
+            return [(row.type, row.amount, row.counterparty) for row in
+                    session.scalars(select(LedgerTransaction).order_by(LedgerTransaction.amount))]
+
+    def pages(self, model, n):
+        pages, after = [], None
+        with self.Session() as session:
+            while True:
+                page = session.scalars(page_statement(model, START, END, n, after)).all()
+                if not page:
+                    return pages
+                pages.append([row.id for row in page])
+                after = page[-1].date_of_transaction, page[-1].id
+
+    def plan(self, statement):
+        sql = str(statement.compile(self.engine, compile_kwargs={"literal_binds": True}))
+        with self.engine.connect() as conn:
+            if self.engine.dialect.name == "postgresql":
+                conn.execute(text("SET enable_seqscan = off"))
+                plan = "\n".join(conn.scalars(text(f"EXPLAIN {sql}")))
+                # the indexes of each partition, named after the index they were created from.
+                for child, parent in conn.execute(text("""
+                    SELECT child.relname, parent.relname FROM pg_inherits
+                    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                    JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+                    WHERE child.relkind = 'i'
+                """)):
+                    plan = plan.replace(f" {child} ", f" {parent} ")
+                return plan
+            return " | ".join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+
+
+class TestLedger(LedgerTestCase):
+    def test_writes_are_kept_in_the_ledger(self):
+        debits = [debit(1.0, "a", transfer=True, receiver="shop", narration="bread")]
+        credits = [credit(2.0, "b", transfer=True, sender="ada", narration="rent")]
+        write_trxns(debits, credits)
+        # the same alerts again are skipped, and so is their copy in the ledger.
+        write_trxns(debits, credits)
+        self.assertEqual(self.ledger(), [("debit", 1.0, "shop"), ("credit", 2.0, "ada")])
+
+    def test_replaced_rows_are_replaced_in_the_ledger(self):
+        write_trxns([debit(1.0, "a")], [])
+        replace_trxns([debit(3.0, "a")], [])
+        self.assertEqual(self.ledger(), [("debit", 3.0, None)])
+
+    def test_rows_written_before_the_ledger_are_filled_in(self):
+        engine = create_engine("sqlite://")
+        self.addCleanup(engine.dispose)
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(CreditTransaction), [{"amount": 1.0, "date_of_transaction": START, "source_key": "a"}])
+
+        migrate(engine)
+        with engine.connect() as conn:
+            self.assertEqual(conn.execute(select(LedgerTransaction.type, LedgerTransaction.amount)).all(), [("credit", 1.0)])
+
+    def test_pages_cover_every_row_once(self):
+        rows = [credit(float(i), str(i)) for i in range(7)]
+        for i, row in enumerate(rows):
+            # a few transactions share a date, so only the id tells them apart.
+            row["date_of_transaction"] = START + timedelta(hours=i // 2)
+        write_trxns([debit(9.0, "d")], rows)
+
+        for model, count in ((LedgerTransaction, 8), (CreditTransaction, 7)):
+            pages = self.pages(model, 3)
+            self.assertEqual([len(page) for page in pages], [3, 3, count - 6])
+            self.assertEqual(len({id for page in pages for id in page}), count)
+
+    def test_pages_are_read_in_index_order(self):
+        after = (START, CreditTransaction.id.type.python_type(int=1))
+        for model in (LedgerTransaction, CreditTransaction, DebitTransaction):
+            plan = self.plan(page_statement(model, START, END, 10, after))
+            self.assertIn(f"ix_{model.__tablename__}_date_of_transaction", plan)
+            self.assertNotIn("TEMP B-TREE", plan)
+            self.assertNotIn("Sort", plan)
+
+
+class TestCursor(unittest.TestCase):
+    def test_cursors_round_trip(self):
+        after = (datetime(2026, 1, 2, 9, 30), CreditTransaction.id.type.python_type(int=7))
+        self.assertEqual(decode_cursor(encode_cursor(*after)), after)
+
+    def test_bad_cursors_are_rejected(self):
+        self.assertIsNone(decode_cursor("yesterday"))
+
+
+@unittest.skipUnless(os.getenv("TEST_POSTGRES_URL"), "set TEST_POSTGRES_URL to an empty postgres database")
+class TestLedgerPostgres(TestLedger):
+    url = os.getenv("TEST_POSTGRES_URL")
+
+    def setUp(self):
+        super().setUp()
+        ensure_partitions(self.engine, [(table, [{"date_of_transaction": START}]) for table in ("credit_transactions", "debit_transactions")])
+
+    def test_rows_written_before_the_ledger_are_filled_in(self):
+        with self.engine.begin() as conn:
+            conn.execute(text("DROP TRIGGER credit_transactions_ledger ON credit_transactions"))
+            conn.execute(insert(CreditTransaction), [{"amount": 1.0, "date_of_transaction": START, "source_key": "a"}])
+            conn.execute(text("DELETE FROM schema_migrations WHERE version = 6"))
+
+        migrate(self.engine)
+        self.assertEqual(self.ledger(), [("credit", 1.0, None)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import utils.utils as utils
+from benchmarks.fake_imap import FakeIMAPServer, SyntheticAlerts
+from benchmarks.fake_smtp import FakeSMTPServer
+from benchmarks.loadtest import check_baseline
+from src.main import imap_settings
+
+
+class TestSyntheticAlerts(unittest.TestCase):
+    def test_every_uid_is_its_own_alert(self):
+        alerts = SyntheticAlerts(1000, pool_size=8)
+        self.assertEqual(len(alerts), 1000)
+        self.assertNotIn(1001, alerts)
+        # uids 1 and 33 share a body, but not a message id or date.
+        first, other = alerts[1], alerts[33]
+        self.assertEqual(first.section("1.2"), other.section("1.2"))
+        self.assertNotEqual(first.header_fields(["Message-ID"]), other.header_fields(["Message-ID"]))
+        self.assertLess(first.date, other.date)
+
+    def test_search(self):
+        server = FakeIMAPServer(SyntheticAlerts(50, pool_size=8))
+        self.assertEqual(server.search('UID 41:* FROM "no-reply@kuda.com"'), list(range(41, 51)))
+
+
+class TestFakeSMTPServer(unittest.TestCase):
+    def test_send_email(self):
+        with tempfile.TemporaryDirectory() as tmp, FakeSMTPServer().serve_in_thread() as server, \
+                patch("utils.utils.Path.cwd", return_value=utils.Path(tmp)), \
+                patch.multiple(utils, smtp_server=server.host, smtp_port=server.port, smtp_ssl=False,
+                               sender="me@example.com", password="pw"):
+            utils.convert_to_excel([{"DATE": "2026-01-02", "AMOUNT": "₦1,000.00"}], "credit", "2026-01-01", "2026-02-01")
+            utils.send_email("sink@example.com", "credit", "2026-01-01", "2026-02-01")
+
+        [(sender, recipients, message)] = server.messages
+        self.assertEqual((sender, recipients), ("me@example.com", ["sink@example.com"]))
+        attachment = next(part for part in message.walk() if part.get_filename())
+        self.assertEqual(attachment.get_filename(), "credit_2026-01-01_2026-02-01.xlsx")
+        self.assertTrue(attachment.get_payload(decode=True).startswith(b"PK"))
+
+
+class TestLoadTest(unittest.TestCase):
+    def test_imap_settings(self):
+        with patch.dict(os.environ, {"IMAP_SSL": "false", "IMAP_PORT": ""}):
+            self.assertEqual(imap_settings(), (143, False))
+        with patch.dict(os.environ, {"IMAP_PORT": "1993"}):
+            os.environ.pop("IMAP_SSL", None)
+            self.assertEqual(imap_settings(), (1993, True))
+
+    def test_check_baseline(self):
+        baseline = {"init n=1000": {"rows_per_s": 100.0, "peak_rss_mb": 100.0},
+                    "export n=1000": {"rows_per_s": 100.0, "peak_rss_mb": 100.0}}
+        results = {"init n=1000": {"rows_per_s": 95.0, "peak_rss_mb": 140.0},
+                   "export n=1000": {"rows_per_s": 90.0, "peak_rss_mb": 110.0}}
+        self.assertEqual(check_baseline(results, baseline, 0.25), ["init n=1000"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -21,7 +21,7 @@ class TestIMAPConnection(unittest.TestCase):
 
         res = login("imap.gmail.com", "john", "testing321")
         
-        mailbox.assert_called_once_with("imap.gmail.com")
+        mailbox.assert_called_once_with("imap.gmail.com", 993)
         fake_mailbox.login.assert_called_once_with("john", "testing321")
 
         self.assertEqual(res, fake_mailbox)
@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.main import classify_and_parse_alerts
+from src.metrics import HISTORY, Metrics, measure_chunk, parse_metrics, quantile, read_runs, summarize_stages, summarize_throughput, write_metrics
+from src.pipeline import run_pipeline
+from tests.test_pipeline import double
+
+
+RAW_ALERTS = [
+    ("7", "2026-01-02", "<html><body><span>You just sent ₦1,000 to John Doe - Rent. Love</span></body></html>",
+     "<7@kuda.com>", "2026-01-02T10:00:00+01:00"),
+    ("8", "2026-01-03", "<html><body><span>Your statement is ready.</span></body></html>",
+     "<8@kuda.com>", "2026-01-03T10:00:00+01:00"),
+]
+
+
+class TestQuantile(unittest.TestCase):
+    def test_interpolates_within_a_bucket(self):
+        buckets = [(0.1, 0.0), (0.2, 100.0), (float("inf"), 100.0)]
+        self.assertAlmostEqual(quantile(0.5, buckets), 0.15)
+        self.assertAlmostEqual(quantile(0.99, buckets), 0.199)
+
+    def test_past_the_last_bucket(self):
+        self.assertEqual(quantile(0.99, [(0.1, 1.0), (float("inf"), 10.0)]), 0.1)
+
+    def test_empty(self):
+        self.assertIsNone(quantile(0.5, [(0.1, 0.0), (float("inf"), 0.0)]))
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = patch.dict(os.environ, {"METRICS_DIR": tmp.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_measure_chunk_times_each_stage(self):
+        res, metrics = measure_chunk(classify_and_parse_alerts, RAW_ALERTS)
+
+        self.assertEqual(res, classify_and_parse_alerts(RAW_ALERTS))
+        counts = {stage: sum(histogram.counts) for stage, histogram in metrics.stages.items()}
+        # the second alert isn't a transaction, so it is never parsed.
+        self.assertEqual(counts, {"fetch": 0, "extract": 2, "classify": 2, "parse": 1, "write": 0})
+
+    def test_pipeline_collects_worker_metrics(self):
+        for workers in (1, 2):
+            metrics = Metrics()
+            written = []
+            run_pipeline(range(20), lambda m: m, double, written.extend, workers=workers, chunk_size=5, metrics=metrics)
+
+            self.assertEqual(written, [i * 2 for i in range(20)])
+            self.assertEqual(sum(metrics.stages["fetch"].counts), 4)
+            self.assertEqual(metrics.queues["raw"][2], 4)
+
+    def test_render_round_trip(self):
+        metrics = Metrics()
+        for seconds in (0.00003, 0.00004, 0.0003):
+            metrics.observe("extract", seconds)
+        metrics.sample_queue("raw", 3)
+        metrics.finish({"processed": 3, "debit": 2, "credit": 1, "invalid": 0, "last_uid": 9})
+
+        samples = parse_metrics(metrics.render())
+        self.assertEqual(samples[("kuda_stage_seconds_count", frozenset({("stage", "extract")}))], 3)
+        self.assertEqual(samples[("kuda_stage_seconds_bucket", frozenset({("stage", "extract"), ("le", "5e-05")}))], 2)
+        self.assertEqual(samples[("kuda_messages_total", frozenset({("type", "debit")}))], 2)
+        self.assertEqual(samples[("kuda_queue_depth_max", frozenset({("queue", "raw")}))], 3)
+
+    def test_summarize_runs(self):
+        for seconds in (0.001, 0.003):
+            metrics = Metrics()
+            metrics.started += seconds # give each run its own history file.
+            for _ in range(50):
+                metrics.observe("write", seconds)
+            metrics.finish({"processed": 50, "debit": 50, "credit": 0, "invalid": 0})
+            write_metrics(metrics)
+
+        runs = read_runs()
+        self.assertEqual(len(runs), 2)
+        write = {row["stage"]: row for row in summarize_stages(runs)}["write"]
+        self.assertEqual(write["count"], 100)
+        self.assertAlmostEqual(write["mean"], 0.002)
+        self.assertTrue(0.0005 < write["p50"] <= 0.001 < 0.002 < write["p95"] <= 0.005)
+        self.assertEqual([run["processed"] for run in summarize_throughput(runs)], [50, 50])
+        self.assertEqual(read_runs(1), runs[1:])
+
+    def test_history_is_capped(self):
+        for i in range(HISTORY + 3):
+            metrics = Metrics()
+            metrics.started += i
+            write_metrics(metrics)
+        self.assertEqual(len(read_runs(HISTORY * 2)), HISTORY)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import os
+import unittest
+from unittest.mock import patch
+from datetime import datetime
+from sqlalchemy import create_engine, func, inspect, literal_column, select, text, union_all
+
+from storage.migrations import MIGRATIONS, migrate, pending_migrations
+from storage.models import CreditTransaction, DebitTransaction
+from storage.partitions import ensure_partitions
+
+START, END = datetime(2026, 1, 1), datetime(2026, 2, 1)
+
+# the statements ka get and typical ka chat questions run.
+CREDITS_IN_RANGE = (select(CreditTransaction)
+                    .where(CreditTransaction.date_of_transaction >= START, CreditTransaction.date_of_transaction <= END)
+                    .order_by(CreditTransaction.date_of_transaction.asc()).limit(10))
+COMBINED = union_all(
+    select(CreditTransaction.id, CreditTransaction.amount, CreditTransaction.date_of_transaction,
+           literal_column("'credit'").label("type")).where(CreditTransaction.date_of_transaction.between(START, END)),
+    select(DebitTransaction.id, DebitTransaction.amount, DebitTransaction.date_of_transaction,
+           literal_column("'debit'").label("type")).where(DebitTransaction.date_of_transaction.between(START, END)),
+).order_by(literal_column("date_of_transaction").asc()).limit(10)
+AIRTIME_SPEND = select(func.sum(DebitTransaction.amount)).where(
+    DebitTransaction.airtime == True, DebitTransaction.date_of_transaction.between(START, END))
+REVERSED = select(func.count()).select_from(CreditTransaction).where(CreditTransaction.reversal == True)
+
+# the tables as they were before source_key, account_id and the indexes were added.
+LEGACY_TABLES = [
+    "CREATE TABLE credit_transactions (id CHAR(32) PRIMARY KEY, transfer BOOLEAN, narration VARCHAR(250), "
+    "date_of_transaction DATETIME NOT NULL, amount FLOAT NOT NULL, created_at DATETIME NOT NULL, sender VARCHAR(100), "
+    "reversal BOOLEAN, from_savings BOOLEAN, savings_account VARCHAR)",
+    "CREATE TABLE debit_transactions (id CHAR(32) PRIMARY KEY, transfer BOOLEAN, narration VARCHAR(250), "
+    "date_of_transaction DATETIME NOT NULL, amount FLOAT NOT NULL, created_at DATETIME NOT NULL, receiver VARCHAR(100), "
+    "airtime BOOLEAN, phone_number VARCHAR(11), network VARCHAR(10), online_payment BOOLEAN, "
+    "service_for_online_payment VARCHAR(150), point_of_sale BOOLEAN, savings BOOLEAN)",
+]
+
+
+class TestMigrate(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        self.addCleanup(self.engine.dispose)
+
+    def index_names(self, table):
+        return {index["name"] for index in inspect(self.engine).get_indexes(table)}
+
+    def test_new_databases_are_created_up_to_date(self):
+        self.assertEqual(migrate(self.engine), [version for version, _, _ in MIGRATIONS])
+        self.assertEqual(pending_migrations(self.engine), [])
+        self.assertEqual(migrate(self.engine), [])
+
+    def test_older_databases_are_upgraded(self):
+        with self.engine.begin() as conn:
+            for statement in LEGACY_TABLES:
+                conn.execute(text(statement))
+
+        migrate(self.engine)
+        for model in (CreditTransaction, DebitTransaction):
+            table = model.__tablename__
+            columns = {column["name"] for column in inspect(self.engine).get_columns(table)}
+            self.assertLessEqual({"source_key", "account_id"}, columns)
+            self.assertEqual(self.index_names(table), {index.name for index in model.__table__.indexes})
+        self.assertEqual(pending_migrations(self.engine), [])
+
+    def test_a_failed_migration_is_retried(self):
+        def broken(conn):
+            raise RuntimeError("interrupted")
+
+        with patch("storage.migrations.MIGRATIONS", MIGRATIONS + [(99, "broken", broken)]):
+            with self.assertRaises(RuntimeError):
+                migrate(self.engine)
+            self.assertEqual([version for version, _, _ in pending_migrations(self.engine)], [99])
+
+
+class TestQueryPlansSqlite(unittest.TestCase):
+    """
+    Checks the query paths use the indexes, with sqlite's EXPLAIN QUERY PLAN.
+    """
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        self.addCleanup(self.engine.dispose)
+        migrate(self.engine)
+
+    def plan(self, statement):
+        sql = str(statement.compile(self.engine, compile_kwargs={"literal_binds": True}))
+        with self.engine.connect() as conn:
+            return " | ".join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+
+    def test_date_range(self):
+        plan = self.plan(CREDITS_IN_RANGE)
+        self.assertIn("SEARCH credit_transactions USING INDEX ix_credit_transactions_date_of_transaction", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_combined_statement_is_covered(self):
+        plan = self.plan(COMBINED)
+        self.assertIn("USING COVERING INDEX ix_credit_transactions_date_of_transaction", plan)
+        self.assertIn("USING COVERING INDEX ix_debit_transactions_date_of_transaction", plan)
+
+    def test_flags_use_partial_indexes(self):
+        self.assertIn("USING INDEX ix_debit_transactions_airtime", self.plan(AIRTIME_SPEND))
+        self.assertIn("ix_credit_transactions_reversal", self.plan(REVERSED))
+
+
+@unittest.skipUnless(os.getenv("TEST_POSTGRES_URL"), "set TEST_POSTGRES_URL to an empty postgres database")
+class TestQueryPlansPostgres(unittest.TestCase):
+    """
+    Checks the query paths can use the indexes, with postgres' EXPLAIN. The tables are empty, so
+    sequential scans are turned off to see which index the planner would pick over them.
+    """
+    def setUp(self):
+        self.engine = create_engine(os.getenv("TEST_POSTGRES_URL"))
+        self.addCleanup(self.engine.dispose)
+        migrate(self.engine)
+        ensure_partitions(self.engine, [(table, [{"date_of_transaction": START}]) for table in ("credit_transactions", "debit_transactions")])
+
+    def plan(self, statement):
+        """
+        Gets the plan of statement, with the indexes of each partition named after the index they were created from.
+        """
+        with self.engine.connect() as conn:
+            conn.execute(text("SET enable_seqscan = off"))
+            plan = "\n".join(conn.scalars(text(f"EXPLAIN {statement.compile(self.engine, compile_kwargs={'literal_binds': True})}")))
+            for child, parent in conn.execute(text("""
+                SELECT child.relname, parent.relname FROM pg_inherits
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+                WHERE child.relkind = 'i'
+            """)):
+                plan = plan.replace(f" {child} ", f" {parent} ")
+            return plan
+
+    def test_date_range(self):
+        self.assertIn("Index Scan using ix_credit_transactions_date_of_transaction", self.plan(CREDITS_IN_RANGE))
+
+    def test_combined_statement_is_covered(self):
+        plan = self.plan(COMBINED)
+        self.assertIn("Index Only Scan using ix_credit_transactions_date_of_transaction", plan)
+        self.assertIn("Index Only Scan using ix_debit_transactions_date_of_transaction", plan)
+
+    def test_flags_use_partial_indexes(self):
+        self.assertIn("ix_debit_transactions_airtime", self.plan(AIRTIME_SPEND))
+        self.assertIn("ix_credit_transactions_reversal", self.plan(REVERSED))
+
+
+if __name__ == "__main__":
+    unittest.main()
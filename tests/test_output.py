@@ -0,0 +1,73 @@
+import io
+import json
+import unittest
+import uuid
+from datetime import datetime
+from unittest.mock import patch
+from rich.console import Console
+
+from storage.models import CreditTransaction, DebitTransaction, LedgerTransaction
+from storage.apis import page_statement, write_trxns
+from src.output import print_tables, write_rows
+from tests.test_apis import credit
+from tests.test_ledger import END, START, LedgerTestCase
+
+ROWS = [
+    LedgerTransaction(id=uuid.UUID(int=1), type="credit", date_of_transaction=datetime(2026, 1, 2, 9, 30), amount=5000.0,
+                      narration="rent, january", counterparty="Ada", account_id=None),
+    LedgerTransaction(id=uuid.UUID(int=2), type="debit", date_of_transaction=datetime(2026, 1, 3), amount=200.0,
+                      narration=None, counterparty=None, account_id="personal"),
+]
+
+
+class TestWriteRows(unittest.TestCase):
+    def write(self, format):
+        out = io.StringIO()
+        self.assertEqual(write_rows(LedgerTransaction, iter(ROWS), format, out), (2, ROWS[1]))
+        return out.getvalue().splitlines()
+
+    def test_jsonl(self):
+        first = json.loads(self.write("jsonl")[0])
+        self.assertEqual(first["id"], str(uuid.UUID(int=1)))
+        self.assertEqual(first["date_of_transaction"], "2026-01-02T09:30:00")
+        self.assertIsNone(first["account_id"])
+
+    def test_csv_quotes_and_leads_with_the_key_columns(self):
+        lines = self.write("csv")
+        self.assertEqual(lines[0], "id,date_of_transaction,amount,type,narration,counterparty,account_id")
+        self.assertIn('"rent, january"', lines[1])
+
+    def test_tsv(self):
+        self.assertEqual(self.write("tsv")[2].split("\t")[1:], ["2026-01-03T00:00:00", "200.0", "debit", "", "", "personal"])
+
+    def test_every_column_of_the_transaction_tables(self):
+        for model in (CreditTransaction, DebitTransaction):
+            out = io.StringIO()
+            write_rows(model, [], "csv", out)
+            self.assertEqual(set(out.getvalue().strip().split(",")), {column.key for column in model.__table__.columns})
+
+
+class TestPrintTables(unittest.TestCase):
+    def setUp(self):
+        self.console = Console(file=io.StringIO(), width=120)
+
+    def test_a_table_per_window(self):
+        self.assertEqual(print_tables(self.console, LedgerTransaction, [ROWS[:1], ROWS[1:]], False), (2, ROWS[1], False))
+        self.assertEqual(self.console.file.getvalue().count("Combined Bank Statement"), 2)
+
+    def test_quitting_stops_before_the_next_window(self):
+        with patch.object(self.console, "input", return_value="q"):
+            self.assertEqual(print_tables(self.console, LedgerTransaction, [ROWS[:1], ROWS[1:]], True), (1, ROWS[0], True))
+
+
+class TestStreaming(LedgerTestCase):
+    def test_rows_are_streamed_in_windows(self):
+        rows = [credit(float(i), str(i)) for i in range(5)]
+        write_trxns([], rows)
+        with self.Session() as session:
+            result = session.scalars(page_statement(LedgerTransaction, START, END, 10), execution_options={"yield_per": 2})
+            self.assertEqual([len(window) for window in result.partitions(2)], [2, 2, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
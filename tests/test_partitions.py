@@ -0,0 +1,147 @@
+import os
+import asyncio
+import unittest
+from datetime import date, datetime
+from unittest.mock import patch
+from sqlalchemy import create_engine, func, insert, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from storage.apis import write_trxns, write_trxns_async
+from storage.base import Base, async_database_url
+from storage.migrations import migrate
+from storage.models import CreditTransaction, DebitTransaction, LedgerTransaction
+from storage.partitions import (
+    COLD_SCHEMA,
+    create_partition_sql,
+    detach_partitions,
+    ensure_partitions,
+    forget_partitions,
+    list_partitions,
+    next_month,
+    partition_stats
+)
+from tests.test_apis import credit, debit
+
+
+class TestPartitionNames(unittest.TestCase):
+    def test_next_month(self):
+        self.assertEqual(next_month(date(2026, 1, 1)), date(2026, 2, 1))
+        self.assertEqual(next_month(date(2026, 12, 1)), date(2027, 1, 1))
+
+    def test_create_partition_sql(self):
+        self.assertEqual(create_partition_sql("debit_transactions", date(2026, 12, 1)),
+                         "CREATE TABLE IF NOT EXISTS debit_transactions_2026_12 PARTITION OF debit_transactions "
+                         "FOR VALUES FROM ('2026-12-01') TO ('2027-01-01')")
+
+    def test_nothing_is_partitioned_on_sqlite(self):
+        engine = create_engine("sqlite://")
+        self.addCleanup(engine.dispose)
+        migrate(engine)
+        ensure_partitions(engine, [("debit_transactions", [{"date_of_transaction": datetime(2026, 1, 2)}])])
+        with engine.connect() as conn:
+            tables = set(conn.scalars(text("SELECT name FROM sqlite_master WHERE type = 'table'")))
+        self.assertNotIn("debit_transactions_2026_01", tables)
+
+
+def reset_postgres(engine) -> None:
+    """
+    Empties the test database, so every test starts from no tables at all.
+    """
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {COLD_SCHEMA} CASCADE"))
+        conn.execute(text("DROP SCHEMA public CASCADE"))
+        conn.execute(text("CREATE SCHEMA public"))
+    forget_partitions()
+
+
+@unittest.skipUnless(os.getenv("TEST_POSTGRES_URL"), "set TEST_POSTGRES_URL to an empty postgres database")
+class TestPartitionsPostgres(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine(os.getenv("TEST_POSTGRES_URL"))
+        self.addCleanup(self.engine.dispose)
+        reset_postgres(self.engine)
+        for target, value in (("storage.apis.Session", sessionmaker(bind=self.engine)), ("storage.apis.engine", self.engine)):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def count(self, model):
+        with self.engine.connect() as conn:
+            return conn.scalar(select(func.count()).select_from(model))
+
+    def test_existing_rows_are_moved_into_partitions(self):
+        Base.metadata.create_all(self.engine)
+        with self.engine.begin() as conn:
+            conn.execute(insert(CreditTransaction), [
+                {"amount": 1.0, "date_of_transaction": datetime(2026, 1, 2), "source_key": "a"},
+                {"amount": 2.0, "date_of_transaction": datetime(2026, 3, 4), "source_key": "b"},
+            ])
+
+        migrate(self.engine)
+        with self.engine.connect() as conn:
+            self.assertEqual(list_partitions(conn, "credit_transactions"), {"credit_transactions_2026_01", "credit_transactions_2026_03"})
+            self.assertEqual(list_partitions(conn, "debit_transactions"), set())
+        self.assertEqual(self.count(CreditTransaction), 2)
+
+    def test_writes_create_the_partitions_they_need(self):
+        migrate(self.engine)
+        rows = [debit(1.0, "a"), debit(2.0, "b", point_of_sale=True)]
+        rows[1]["date_of_transaction"] = datetime(2026, 2, 10)
+        write_trxns(rows, [credit(3.0, "c")])
+        write_trxns(rows, [credit(3.0, "c")])
+
+        with self.engine.connect() as conn:
+            self.assertEqual(list_partitions(conn, "debit_transactions"), {"debit_transactions_2026_01", "debit_transactions_2026_02"})
+        # rows already in their partition are still skipped.
+        self.assertEqual((self.count(DebitTransaction), self.count(CreditTransaction)), (2, 1))
+
+    def test_async_writes_create_the_partitions_they_need(self):
+        migrate(self.engine)
+
+        async def write():
+            db = create_async_engine(async_database_url(os.getenv("TEST_POSTGRES_URL")))
+            try:
+                await write_trxns_async(async_sessionmaker(db), [], [credit(3.0, "c"), credit(4.0, "d")])
+            finally:
+                await db.dispose()
+
+        asyncio.run(write())
+        self.assertEqual(self.count(CreditTransaction), 2)
+
+    def test_range_queries_are_pruned(self):
+        migrate(self.engine)
+        rows = [credit(float(month), str(month)) for month in range(1, 7)]
+        for month, row in enumerate(rows, 1):
+            row["date_of_transaction"] = datetime(2026, month, 2)
+        write_trxns([], rows)
+
+        statement = (select(CreditTransaction)
+                     .where(CreditTransaction.date_of_transaction >= datetime(2026, 2, 1),
+                            CreditTransaction.date_of_transaction <= datetime(2026, 3, 31))
+                     .order_by(CreditTransaction.date_of_transaction).limit(10))
+        sql = statement.compile(self.engine, compile_kwargs={"literal_binds": True})
+        with self.engine.connect() as conn:
+            plan = "\n".join(conn.scalars(text(f"EXPLAIN {sql}")))
+        self.assertIn("credit_transactions_2026_02", plan)
+        self.assertIn("credit_transactions_2026_03", plan)
+        for month in (1, 4, 5, 6):
+            self.assertNotIn(f"credit_transactions_2026_0{month}", plan)
+
+    def test_old_partitions_are_detached_to_cold_storage(self):
+        migrate(self.engine)
+        rows = [credit(1.0, "a"), credit(2.0, "b")]
+        rows[1]["date_of_transaction"] = datetime(2026, 5, 2)
+        write_trxns([], rows)
+
+        with self.engine.begin() as conn:
+            self.assertEqual(detach_partitions(conn, "credit_transactions", date(2026, 3, 1)), ["credit_transactions_2026_01"])
+        with self.engine.connect() as conn:
+            self.assertEqual([partition["name"] for partition in partition_stats(conn, "credit_transactions")], ["credit_transactions_2026_05"])
+            self.assertEqual(conn.scalar(text(f"SELECT count(*) FROM {COLD_SCHEMA}.credit_transactions_2026_01")), 1)
+        self.assertEqual(self.count(CreditTransaction), 1)
+        self.assertEqual(self.count(LedgerTransaction), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+
+from src.main import classify_and_parse_alerts
+from utils.utils import get_source_key
+from src.pipeline import run_pipeline
+
+
+def double(chunk):
+    return [item * 2 for item in chunk]
+
+
+def failing_messages():
+    yield 1
+    yield 2
+    raise ConnectionResetError("connection reset")
+
+
+class TestRunPipeline(unittest.TestCase):
+    def run_and_collect(self, messages, workers, chunk_size=3):
+        written = []
+        run_pipeline(messages, lambda m: m, double, written.extend, workers=workers, chunk_size=chunk_size, queue_size=2)
+        return written
+
+    def test_inline(self):
+        self.assertEqual(self.run_and_collect(range(10), workers=1), [i * 2 for i in range(10)])
+
+    def test_worker_processes_keep_order(self):
+        self.assertEqual(self.run_and_collect(range(200), workers=3, chunk_size=7), [i * 2 for i in range(200)])
+
+    def test_no_messages(self):
+        self.assertEqual(self.run_and_collect([], workers=2), [])
+
+    def test_fetch_error_is_raised(self):
+        with self.assertRaises(ConnectionResetError):
+            self.run_and_collect(failing_messages(), workers=1, chunk_size=1)
+
+    def test_write_error_is_raised(self):
+        def write(results):
+            raise ValueError("db is down")
+
+        with self.assertRaises(ValueError):
+            run_pipeline(range(100), lambda m: m, double, write, workers=1, chunk_size=1, queue_size=1)
+
+
+class TestClassifyAndParseAlerts(unittest.TestCase):
+    def test_classify_and_parse_alerts(self):
+        raw_alerts = [
+            ("7", "2026-01-02", "<html><body><span>You just sent ₦1,000 to John Doe - Rent. Love</span></body></html>",
+             "<7@kuda.com>", "2026-01-02T10:00:00+01:00"),
+            ("8", "2026-01-03", "<html><body><span>Your statement is ready.</span></body></html>",
+             "<8@kuda.com>", "2026-01-03T10:00:00+01:00"),
+        ]
+        res = classify_and_parse_alerts(raw_alerts)
+
+        self.assertEqual(res[0][:2], ("7", "debit"))
+        self.assertEqual(res[0][2]["debit_metadata"], {"transfer": True, "receiver": "john doe", "narration": "rent"})
+        self.assertEqual(res[0][2]["source_key"], get_source_key("<7@kuda.com>", "", ""))
+        self.assertEqual(res[1], ("8", None, None))
+
+    def test_an_alert_that_cant_be_parsed_is_skipped(self):
+        raw_alerts = [
+            (str(uid), "2026-01-02", f"<html><body><span>{statement}</span></body></html>", f"<{uid}@kuda.com>", "2026-01-02T10:00:00+01:00")
+            for uid, statement in ((7, "You just sent ₦1,000 to John Doe - Rent. Love"),
+                                   (8, "You just sent NGN1,500.00 to Jane Doe"),
+                                   (9, "You just sent ₦2,000 to Ada - Food. Love"))
+        ]
+        written = []
+        run_pipeline(raw_alerts, lambda m: m, classify_and_parse_alerts, written.extend, workers=1, chunk_size=3)
+
+        self.assertEqual([(uid, trxn_type) for uid, trxn_type, _ in written], [("7", "debit"), ("8", None), ("9", "debit")])
+
+
+if __name__ == "__main__":
+    unittest.main()
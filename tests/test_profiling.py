@@ -0,0 +1,42 @@
+import sys
+import unittest
+from sqlalchemy import column, select, table
+
+from src.profiling import hotspots, slowest_imports, start_profiling, stop_profiling, time_by_category
+
+
+class TestProfiling(unittest.TestCase):
+    def profile(self, func):
+        start_profiling()
+        try:
+            func()
+        finally:
+            stats = stop_profiling()
+        return stats
+
+    def test_not_started(self):
+        self.assertIsNone(stop_profiling())
+
+    def test_time_by_category(self):
+        def work():
+            sys.modules.pop("xml.dom.minidom", None)
+            __import__("xml.dom.minidom")
+            for _ in range(200):
+                str(select(column("amount")).select_from(table("debit_transactions")))
+
+        stats = self.profile(work)
+        times = time_by_category(stats)
+        self.assertGreater(times["importing modules"], 0)
+        self.assertGreater(times["sqlalchemy"], 0)
+        self.assertEqual(times["rich rendering"], 0)
+        self.assertLessEqual(times["sqlalchemy"], times["total"])
+        self.assertTrue(any(row["module"].endswith("minidom.py") for row in slowest_imports(stats, 50)))
+
+    def test_hotspots_by_own_time(self):
+        rows = hotspots(self.profile(lambda: sorted(range(100000), key=lambda i: -i)), top=3)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows, sorted(rows, key=lambda row: row["own"], reverse=True))
+
+
+if __name__ == "__main__":
+    unittest.main()
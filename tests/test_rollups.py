@@ -0,0 +1,110 @@
+import os
+import unittest
+from datetime import date, datetime
+from sqlalchemy import create_engine, insert, select, text, update
+
+from storage.base import Base
+from storage.migrations import migrate
+from storage.models import CreditTransaction, DailyTotal, DebitTransaction, MonthlyTotal
+from storage.partitions import detach_partitions, ensure_partitions
+from storage.apis import replace_trxns, write_trxns
+from storage.rollups import rebuild_rollups, summarize
+from tests.test_apis import credit, debit
+from tests.test_ledger import LedgerTestCase
+
+
+def on(day, row):
+    row["date_of_transaction"] = datetime.combine(day, datetime.min.time()).replace(hour=12)
+    return row
+
+
+class TestRollups(LedgerTestCase):
+    def totals(self, model, key):
+        with self.Session() as session:
+            return {getattr(row, key): (row.inflow, row.outflow, row.credits, row.debits, row.airtime_outflow)
+                    for row in session.scalars(select(model))}
+
+    def summary(self, start, end):
+        with self.Session() as session:
+            return summarize(session, start, end)
+
+    def test_writes_are_added_to_the_totals(self):
+        write_trxns([on(date(2026, 1, 2), debit(100.0, "a", airtime=True, phone_number="08012345678", network="mtn")),
+                     on(date(2026, 1, 2), debit(50.0, "b", point_of_sale=True))],
+                    [on(date(2026, 1, 3), credit(1000.0, "c"))])
+        # the same alerts again are skipped, and add nothing.
+        write_trxns([on(date(2026, 1, 2), debit(100.0, "a"))], [])
+
+        self.assertEqual(self.totals(DailyTotal, "day"), {date(2026, 1, 2): (0.0, 150.0, 0, 2, 100.0),
+                                                          date(2026, 1, 3): (1000.0, 0.0, 1, 0, 0.0)})
+        self.assertEqual(self.totals(MonthlyTotal, "month"), {date(2026, 1, 1): (1000.0, 150.0, 1, 2, 100.0)})
+
+    def test_replaced_and_updated_rows_move_their_totals(self):
+        write_trxns([on(date(2026, 1, 2), debit(100.0, "a"))], [])
+        replace_trxns([on(date(2026, 1, 2), debit(30.0, "a"))], [])
+        ensure_partitions(self.engine, [("debit_transactions", [{"date_of_transaction": datetime(2026, 2, 5)}])])
+        with self.engine.begin() as conn:
+            conn.execute(update(DebitTransaction).values(date_of_transaction=datetime(2026, 2, 5)))
+
+        self.assertEqual(self.totals(DailyTotal, "day"), {date(2026, 1, 2): (0.0, 0.0, 0, 0, 0.0),
+                                                          date(2026, 2, 5): (0.0, 30.0, 0, 1, 0.0)})
+        self.assertEqual(self.totals(MonthlyTotal, "month")[date(2026, 2, 1)], (0.0, 30.0, 0, 1, 0.0))
+
+    def test_rebuilding_matches_the_triggers(self):
+        write_trxns([on(date(2026, 1, 2), debit(100.0, "a"))], [on(date(2026, 3, 3), credit(5.0, "b"))])
+        before = self.totals(MonthlyTotal, "month")
+        with self.engine.begin() as conn:
+            rebuild_rollups(conn)
+        self.assertEqual(self.totals(MonthlyTotal, "month"), before)
+
+    def test_summary_adds_whole_months_and_the_days_around_them(self):
+        write_trxns([on(date(2026, 1, 30), debit(1.0, "a")), on(date(2026, 1, 31), debit(2.0, "b")),
+                     on(date(2026, 2, 14), debit(4.0, "c")), on(date(2026, 3, 1), debit(8.0, "d")),
+                     on(date(2026, 3, 2), debit(16.0, "e"))], [on(date(2026, 2, 1), credit(500.0, "f"))])
+
+        self.assertEqual(self.summary(date(2026, 1, 31), date(2026, 3, 1))["outflow"], 14.0)
+        self.assertEqual(self.summary(date(2026, 1, 31), date(2026, 3, 1))["inflow"], 500.0)
+        self.assertEqual(self.summary(date(2026, 2, 1), date(2026, 2, 28))["debits"], 1)
+        self.assertEqual(self.summary(date(2026, 1, 30), date(2026, 1, 30))["outflow"], 1.0)
+        self.assertEqual(self.summary(date(2025, 1, 1), date(2027, 12, 31))["outflow"], 31.0)
+        self.assertEqual(self.summary(date(2024, 1, 1), date(2024, 1, 31))["outflow"], 0)
+
+    def test_rows_written_before_the_rollups_are_counted(self):
+        engine = create_engine("sqlite://")
+        self.addCleanup(engine.dispose)
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(CreditTransaction), [{"amount": 1.0, "date_of_transaction": datetime(2026, 1, 2), "source_key": "a"}])
+
+        migrate(engine)
+        with engine.connect() as conn:
+            self.assertEqual(conn.execute(select(DailyTotal.day, DailyTotal.inflow)).all(), [(date(2026, 1, 2), 1.0)])
+
+
+@unittest.skipUnless(os.getenv("TEST_POSTGRES_URL"), "set TEST_POSTGRES_URL to an empty postgres database")
+class TestRollupsPostgres(TestRollups):
+    url = os.getenv("TEST_POSTGRES_URL")
+
+    def setUp(self):
+        super().setUp()
+        ensure_partitions(self.engine, [("credit_transactions", [{"date_of_transaction": datetime(2026, 1, 2)}])])
+
+    def test_rows_written_before_the_rollups_are_counted(self):
+        with self.engine.begin() as conn:
+            conn.execute(text("DROP TRIGGER credit_transactions_rollups_insert ON credit_transactions"))
+            conn.execute(text("DROP TRIGGER credit_transactions_ledger ON credit_transactions"))
+            conn.execute(insert(CreditTransaction), [{"amount": 1.0, "date_of_transaction": datetime(2026, 1, 2), "source_key": "a"}])
+            conn.execute(text("DELETE FROM schema_migrations WHERE version IN (6, 7)"))
+
+        migrate(self.engine)
+        self.assertEqual(self.totals(DailyTotal, "day"), {date(2026, 1, 2): (1.0, 0.0, 1, 0, 0.0)})
+
+    def test_detached_months_are_taken_out_of_the_totals(self):
+        write_trxns([], [on(date(2026, 1, 2), credit(1.0, "a")), on(date(2026, 5, 2), credit(2.0, "b"))])
+        with self.engine.begin() as conn:
+            detach_partitions(conn, "credit_transactions", date(2026, 3, 1))
+        self.assertEqual(self.summary(date(2026, 1, 1), date(2026, 12, 31))["inflow"], 2.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
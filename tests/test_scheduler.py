@@ -0,0 +1,75 @@
+import time
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from src.scheduler import schedule, slice_delay, slice_size
+
+
+class FakeMailboxes:
+    """
+    Stands in for ingest_account: each account has a number of new alerts, and a slice takes
+    up to size of them, all debits. Every slice is logged as (account id, size taken).
+    """
+    def __init__(self, alerts, fail=()):
+        self.alerts = dict(alerts)
+        self.fail = set(fail)
+        self.slices = []
+        self.lock = threading.Lock()
+
+    def __call__(self, account, size):
+        if account["id"] in self.fail:
+            raise ConnectionError("login failed")
+        with self.lock:
+            taken = min(size, self.alerts[account["id"]])
+            self.alerts[account["id"]] -= taken
+            self.slices.append((account["id"], taken, time.monotonic()))
+        return {"processed": taken, "debit": taken, "credit": 0, "invalid": 0}
+
+
+class TestSchedule(unittest.TestCase):
+    def run_schedule(self, mailboxes, accounts, processes=1, **kwargs):
+        with ThreadPoolExecutor(processes) as executor:
+            return schedule(accounts, mailboxes, processes=processes, executor=executor, **kwargs)
+
+    def test_accounts_take_turns(self):
+        mailboxes = FakeMailboxes({"big": 45, "small": 15})
+        totals = self.run_schedule(mailboxes, [{"id": "big"}, {"id": "small"}], quantum=10)
+
+        self.assertEqual([(account_id, taken) for account_id, taken, _ in mailboxes.slices],
+                         [("big", 10), ("small", 10), ("big", 10), ("small", 5), ("big", 10), ("big", 10), ("big", 5)])
+        self.assertEqual((totals["big"]["processed"], totals["small"]["processed"]), (45, 15))
+
+    def test_at_most_n_per_account(self):
+        mailboxes = FakeMailboxes({"a": 100, "b": 3})
+        totals = self.run_schedule(mailboxes, [{"id": "a"}, {"id": "b"}], processes=2, quantum=10, n=25)
+
+        self.assertEqual((totals["a"]["processed"], totals["b"]["processed"]), (25, 3))
+        self.assertEqual(mailboxes.alerts["a"], 75)
+
+    def test_rate_limit(self):
+        mailboxes = FakeMailboxes({"limited": 30, "free": 30})
+        self.run_schedule(mailboxes, [{"id": "limited", "max_per_minute": 6000}, {"id": "free"}], processes=2, quantum=10)
+
+        # 10 alerts at 100 a second means a slice every 0.1s.
+        starts = [at for account_id, _, at in mailboxes.slices if account_id == "limited"]
+        self.assertTrue(all(later - earlier >= 0.09 for earlier, later in zip(starts, starts[1:])))
+        self.assertEqual(slice_delay({"max_per_minute": 600}, 100), 10)
+
+    def test_rate_limited_slices_are_a_minute_at_most(self):
+        mailboxes = FakeMailboxes({"limited": 20})
+        self.run_schedule(mailboxes, [{"id": "limited", "max_per_minute": 4}], quantum=10, n=4)
+
+        self.assertEqual([(account_id, taken) for account_id, taken, _ in mailboxes.slices], [("limited", 4)])
+        self.assertEqual(slice_size({"max_per_minute": 6000}, 10), 10)
+
+    def test_failed_account_is_skipped(self):
+        mailboxes = FakeMailboxes({"ok": 12, "broken": 5}, fail={"broken"})
+        totals = self.run_schedule(mailboxes, [{"id": "broken"}, {"id": "ok"}], quantum=5)
+
+        self.assertEqual(totals["ok"]["processed"], 12)
+        self.assertEqual(totals["broken"]["slices"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
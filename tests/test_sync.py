@@ -0,0 +1,78 @@
+import unittest
+from datetime import date
+from unittest.mock import MagicMock
+
+from src.sync import (
+    get_sync_state,
+    new_messages_criteria,
+    resolve_last_uid,
+    search_new_uids,
+    set_sync_state,
+    sync_state_key,
+)
+
+
+class TestSyncState(unittest.TestCase):
+    def test_get_sync_state_for_new_mailbox(self):
+        r = MagicMock()
+        r.hgetall.return_value = {}
+        self.assertEqual(get_sync_state(r, "john@gmail.com", "INBOX"), {"uidvalidity": 0, "last_uid": 0})
+        r.hgetall.assert_called_once_with("sync:john@gmail.com:INBOX")
+
+    def test_get_sync_state(self):
+        r = MagicMock()
+        r.hgetall.return_value = {b"uidvalidity": b"7", b"last_uid": b"120"}
+        self.assertEqual(get_sync_state(r, "john@gmail.com", "INBOX"), {"uidvalidity": 7, "last_uid": 120})
+
+    def test_set_sync_state(self):
+        r = MagicMock()
+        set_sync_state(r, "john@gmail.com", "INBOX", 7, 120)
+        r.hset.assert_called_once_with(sync_state_key("john@gmail.com", "INBOX"), mapping={"uidvalidity": 7, "last_uid": 120})
+
+    def test_window_has_its_own_key(self):
+        self.assertEqual(
+            sync_state_key("john@gmail.com", "INBOX", date(2026, 1, 1), date(2026, 4, 1)),
+            "sync:john@gmail.com:INBOX:2026-01-01:2026-04-01"
+        )
+        self.assertEqual(sync_state_key("john@gmail.com", "INBOX", since=date(2026, 1, 1)), "sync:john@gmail.com:INBOX:2026-01-01:")
+
+    def test_resolve_last_uid(self):
+        self.assertEqual(resolve_last_uid({"uidvalidity": 7, "last_uid": 120}, 7), 120)
+
+    def test_resolve_last_uid_when_uidvalidity_changes(self):
+        self.assertEqual(resolve_last_uid({"uidvalidity": 7, "last_uid": 120}, 8), 0)
+
+
+class TestSearchNewUids(unittest.TestCase):
+    def test_skips_already_processed_uid(self):
+        # with nothing new, "121:*" still returns the newest message (uid 120).
+        imap_client = MagicMock()
+        imap_client.uids.return_value = ["120"]
+        self.assertEqual(search_new_uids(imap_client, 120), [])
+
+    def test_search_new_uids(self):
+        imap_client = MagicMock()
+        imap_client.uids.return_value = ["130", "121", "125"]
+
+        res = search_new_uids(imap_client, 120, 2)
+
+        self.assertEqual(res, ["121", "125"])
+        self.assertIn("UID 121:*", str(imap_client.uids.call_args.args[0]))
+
+
+class TestNewMessagesCriteria(unittest.TestCase):
+    def test_criteria_without_window(self):
+        criteria = str(new_messages_criteria(0))
+        self.assertIn("UID 1:*", criteria)
+        self.assertNotIn("SINCE", criteria)
+        self.assertNotIn("BEFORE", criteria)
+
+    def test_criteria_with_window(self):
+        criteria = str(new_messages_criteria(10, date(2026, 1, 1), date(2026, 4, 1)))
+        self.assertIn("UID 11:*", criteria)
+        self.assertIn("SINCE 1-Jan-2026", criteria)
+        self.assertIn("BEFORE 1-Apr-2026", criteria)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import patch
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from benchmarks.fake_imap import FakeIMAPServer, alert_emails
+from src.aioimap import connect_mailbox
+from src.main import classify_and_parse_alerts, to_raw_alert
+from src.watch import watch
+from storage.apis import get_checkpoint_async
+from storage.base import Base
+from storage.models import CreditTransaction, DebitTransaction
+from tests.test_aioengine import FakeAsyncRedis
+
+
+@patch.dict(os.environ, {"KUDA": "no-reply@kuda.com"})
+class TestWatch(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = patch.dict(os.environ, {"ARCHIVE_DIR": tmp.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.server = await FakeIMAPServer(alert_emails(4)).start()
+        self.addAsyncCleanup(self.server.close)
+        # a file, so counting rows from the test doesn't share the watcher's connection.
+        self.db = create_async_engine(f"sqlite+aiosqlite:///{tmp.name}/kuda.db")
+        self.addAsyncCleanup(self.db.dispose)
+        async with self.db.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session_maker = async_sessionmaker(self.db)
+        self.r = FakeAsyncRedis()
+        self.stop = asyncio.Event()
+        self.connects = 0
+
+    def connect(self):
+        self.connects += 1
+        return connect_mailbox(self.server.host, "me@gmail.com", "pw", port=self.server.port, use_ssl=False)
+
+    def start_watching(self, **kwargs):
+        task = asyncio.create_task(watch(self.connect, self.r, self.session_maker, "me@gmail.com", to_raw_alert,
+                                         classify_and_parse_alerts, stop=self.stop, **kwargs))
+        self.addAsyncCleanup(asyncio.wait_for, task, 5)
+        self.addCleanup(self.stop.set)
+        return task
+
+    async def count(self):
+        async with self.session_maker() as session:
+            return (await session.scalar(select(func.count()).select_from(DebitTransaction))
+                    + await session.scalar(select(func.count()).select_from(CreditTransaction)))
+
+    async def wait_for_count(self, expected, timeout=5):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while (count := await self.count()) != expected and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        return count
+
+    async def test_ingests_alerts_as_they_arrive(self):
+        task = self.start_watching(idle_timeout=60)
+        self.assertEqual(await self.wait_for_count(4), 4)
+
+        for message in alert_emails(2, start=4):
+            self.server.append(message)
+        self.assertEqual(await self.wait_for_count(6), 6)
+        self.assertEqual((await get_checkpoint_async(self.session_maker, "sync:me@gmail.com:INBOX"))["last_uid"], 6)
+
+        self.stop.set()
+        counts = await asyncio.wait_for(task, 5)
+        self.assertEqual(counts, {"processed": 6, "debit": 3, "credit": 3, "invalid": 0})
+
+    async def test_reconnects_and_catches_up(self):
+        self.start_watching(idle_timeout=60)
+        self.assertEqual(await self.wait_for_count(4), 4)
+
+        self.server.disconnect_all()
+        for message in alert_emails(3, start=4):
+            self.server.append(message)
+        self.assertEqual(await self.wait_for_count(7), 7)
+        self.assertEqual(self.connects, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
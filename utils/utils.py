@@ -7,6 +7,8 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
 from datetime import datetime
+import hashlib
+import uuid
 import smtplib
 import ssl
 import os
@@ -16,7 +18,11 @@ import re
 
 load_dotenv(find_dotenv())
 
+AMOUNT_PATTERN = re.compile(r'₦(\d+(?:,\d+)*(?:\.\d{2})?)')
+
 smtp_server = os.getenv("SMTP_SERVER")
+smtp_ssl = os.getenv("SMTP_SSL", "true").lower() not in ("0", "false", "no")
+smtp_port = int(os.getenv("SMTP_PORT") or (465 if smtp_ssl else 25))
 sender = os.getenv("EMAIL")
 password = os.getenv("PASSWORD")
 
@@ -76,7 +82,11 @@ def send_email(email: str, transaction_type: str, start_date: str, end_date: str
     logger.info("done attaching file to email.")
 
     logger.info("sending email...")
-    with smtplib.SMTP_SSL(smtp_server, port=465, context=context) as connection:
+    if smtp_ssl:
+        connection = smtplib.SMTP_SSL(smtp_server, port=smtp_port, context=context)
+    else:
+        connection = smtplib.SMTP(smtp_server, port=smtp_port)
+    with connection:
         connection.login(user=sender, password=password)
         connection.sendmail(from_addr=sender, to_addrs=email, msg=msg.as_string())
     logger.info(f"email successfully sent to: {sender}")
@@ -101,14 +111,73 @@ def get_start_datetime_end_datetime(start_date, end_date):
         return None
     
 
+def get_since_before_dates(since: str | None, before: str | None):
+    """
+    Converts the optional since and before dates of an ingestion window to date objects.
+    """
+    try:
+        since_date = datetime.strptime(since, "%Y-%m-%d").date() if since else None
+        before_date = datetime.strptime(before, "%Y-%m-%d").date() if before else None
+    except ValueError:
+        logger.info(f"Could not convert {since} or {before} to date obj. Incorrect format for {since} or {before}")
+        return None
+    
+    if since_date and before_date and since_date >= before_date:
+        logger.info(f"{since} has to be earlier than {before}.")
+        return None
+    return since_date, before_date
+
+
+def encode_cursor(date_of_transaction: datetime, id: uuid.UUID) -> str:
+    """
+    Encodes where a page of ka get stopped, for --after.
+    """
+    return f"{date_of_transaction.isoformat()}_{id.hex}"
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID] | None:
+    """
+    Decodes a cursor from encode_cursor back to the (date_of_transaction, id) it was made from.
+    """
+    try:
+        date_of_transaction, id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(date_of_transaction), uuid.UUID(hex=id)
+    except ValueError:
+        logger.info(f"{cursor} is not a cursor printed by ka get.")
+        return None
+
+
+def match_from(pattern: re.Pattern, text: str, pos: int | None = None) -> re.Match | None:
+    """
+    Matches pattern at pos, where its key phrase is already known to be, before searching the whole text.
+    """
+    return (pos is not None and pattern.match(text, pos)) or pattern.search(text)
+
+
 def get_amount(transaction_statement) -> str:
     """
     Gets the amount from the transaction statement.
     """
-    pattern = r'₦(\d+(?:,\d+)*(?:\.\d{2})?)'
-    match = re.search(pattern, transaction_statement)
+    match = AMOUNT_PATTERN.search(transaction_statement)
     if match:
         amount = match.group(1)
         return amount
     else:
         raise ValueError("Amount not found.")
+
+
+def get_source_key(message_id: str, sent_at: str, transaction_statement: str) -> str:
+    """
+    Gets the key that ties a transaction to the alert email it came from. It is a hash of the
+    email's Message-ID, or of when it was sent and its statement if it doesn't have one.
+    """
+    source = message_id.strip() or f"{sent_at}\n{transaction_statement}"
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def get_account_source_key(source_key: str, account_id: str) -> str:
+    """
+    Scopes a source key to an account. The same alert can reach more than one configured mailbox,
+    e.g. when it is forwarded, and is then a transaction of each account.
+    """
+    return hashlib.sha256(f"{account_id}\n{source_key}".encode()).hexdigest()